@@ -30,6 +30,7 @@ command -v uwsgi >/dev/null && AVAILABLE_SERVERS+=("uwsgi")
 command -v uwsgi_python3 >/dev/null && AVAILABLE_SERVERS+=("uwsgi-http")
 command -v gunicorn >/dev/null && AVAILABLE_SERVERS+=("gunicorn")
 command -v waitress-serve >/dev/null && AVAILABLE_SERVERS+=("waitress")
+command -v uvicorn >/dev/null && AVAILABLE_SERVERS+=("uvicorn")
 AVAILABLE_SERVERS+=("flask")
 
 # Let user select server type
@@ -52,12 +53,22 @@ case "$SERVER_TYPE" in
 module = playcard_server:app
 master = true
 processes = 4
+# Threads pro Prozess: offene Now-Playing-Streams belegen so nur einen Thread
+threads = 16
+# Python-Threads (Log-Writer, Index-Aufbau, Analysen) laufen unter uWSGI nur damit
+enable-threads = true
 socket = 127.0.0.1:${PORT}
 chmod-socket = 660
 vacuum = true
 die-on-term = true
 plugins = python3
 env = FLASK_ENV=production
+# Nur über den Reverse-Proxy erreichbar (127.0.0.1): dessen X-Forwarded-For gilt als Client-Adresse
+env = PLAYCARD_TRUSTED_PROXIES=1
+# Preload: Index einmal im Master bauen, Worker erben ihn copy-on-write (kein lazy-apps!)
+env = PLAYCARD_PRELOAD=1
+# Koordinierter Reload: Master baut den Index neu und forkt frische Worker
+touch-reload = ${CLONE_DIR}/.playcard-reload
 EOF
 
         cat > "$UNIT_FILE_TMP" <<EOF
@@ -85,10 +96,20 @@ module = playcard_server:app
 http-socket = 127.0.0.1:${PORT}
 master = true
 processes = 4
+# Threads pro Prozess: offene Now-Playing-Streams belegen so nur einen Thread
+threads = 16
+# Python-Threads (Log-Writer, Index-Aufbau, Analysen) laufen unter uWSGI nur damit
+enable-threads = true
 vacuum = true
 die-on-term = true
 plugins = python3
 env = FLASK_ENV=production
+# Nur über den Reverse-Proxy erreichbar (127.0.0.1): dessen X-Forwarded-For gilt als Client-Adresse
+env = PLAYCARD_TRUSTED_PROXIES=1
+# Preload: Index einmal im Master bauen, Worker erben ihn copy-on-write (kein lazy-apps!)
+env = PLAYCARD_PRELOAD=1
+# Koordinierter Reload: Master baut den Index neu und forkt frische Worker
+touch-reload = ${CLONE_DIR}/.playcard-reload
 EOF
 
         cat > "$UNIT_FILE_TMP" <<EOF
@@ -119,7 +140,10 @@ User=${SERVICE_USER}
 Group=${SERVICE_GROUP}
 WorkingDirectory=${CLONE_DIR}
 Environment=FLASK_ENV=production
-ExecStart=/usr/bin/gunicorn -w 4 -b 127.0.0.1:${PORT} playcard_server:app
+Environment=PLAYCARD_TRUSTED_PROXIES=1
+ExecStart=/usr/bin/gunicorn -c ${CLONE_DIR}/playcard_gunicorn.conf.py -b 127.0.0.1:${PORT} playcard_server:app
+# Koordinierter Reload (Index im Master neu bauen, Worker neu forken)
+ExecReload=/bin/kill -HUP \$MAINPID
 Restart=always
 RestartSec=3
 
@@ -138,10 +162,31 @@ User=${SERVICE_USER}
 Group=${SERVICE_GROUP}
 WorkingDirectory=${CLONE_DIR}
 Environment=FLASK_ENV=production
+Environment=PLAYCARD_TRUSTED_PROXIES=1
 ExecStart=/usr/bin/waitress-serve --host=127.0.0.1 --port=${PORT} playcard_server:app
 Restart=always
 RestartSec=3
 
+[Install]
+WantedBy=multi-user.target
+EOF
+        ;;
+    uvicorn)
+        cat > "$UNIT_FILE_TMP" <<EOF
+[Unit]
+Description=Playcard Uvicorn (ASGI) Service
+After=network.target
+
+[Service]
+User=${SERVICE_USER}
+Group=${SERVICE_GROUP}
+WorkingDirectory=${CLONE_DIR}
+Environment=FLASK_ENV=production
+Environment=PLAYCARD_TRUSTED_PROXIES=1
+ExecStart=/usr/bin/uvicorn --host 127.0.0.1 --port ${PORT} playcard_server:asgi_application
+Restart=always
+RestartSec=3
+
 [Install]
 WantedBy=multi-user.target
 EOF
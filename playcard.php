@@ -32,6 +32,13 @@ if (empty($MEDIA_DIRS)) {
 // Allowed media file extensions
 $ALLOWED_EXTENSIONS = ['.mp3', '.mp4', '.ogg', '.ogv', '.webm'];
 
+// Shared index store written by playcard_server.py (PLAYCARD_INDEX_STORE there, default
+// ~/.playcard/playcard-index.sqlite of the service user). It must be readable by the web server.
+// If set and present, index, search, cover and stream lookups are answered from it read-only
+// instead of scanning MEDIA_DIRS. Empty = scan the filesystem as before.
+define('INDEX_STORE', getenv('PLAYCARD_INDEX_STORE') ?: '');
+$INDEX_STORE_META = [];
+
 // Get relative path from absolute, based on MEDIA_DIRS
 function get_relative_path($absolute_path) {
     global $MEDIA_DIRS;
@@ -114,10 +121,91 @@ if (php_sapi_name() === 'cli') {
 // generate_index_with_structure - Index with no parameter structured true
 // sort_key_locale - Used by generate_index_with_structure
 // compare_titles - Used by generate_index needs sort_key_locale
+// index_store - Read-only connection to the shared index store (or null)
+// same_media_dirs - Used by index_store, compares the store's media_dirs with MEDIA_DIRS
 // -------------------------------
+function same_media_dirs($store_dirs, $media_dirs) {
+    $normalize = function ($dirs) {
+        $dirs = array_map(fn($d) => rtrim(realpath($d) ?: $d, '/'), $dirs);
+        sort($dirs);
+        return array_values(array_unique($dirs));
+    };
+    return $normalize($store_dirs) === $normalize($media_dirs);
+}
+
+function index_store() {
+    global $INDEX_STORE_META, $MEDIA_DIRS;
+    static $db = false;
+
+    if ($db !== false) return $db;
+    $db = null;
+    if (INDEX_STORE === '' || !is_readable(INDEX_STORE) || !class_exists('PDO')) return $db;
+
+    $options = [PDO::ATTR_ERRMODE => PDO::ERRMODE_EXCEPTION];
+    if (defined('PDO::SQLITE_ATTR_OPEN_FLAGS')) {
+        $options[PDO::SQLITE_ATTR_OPEN_FLAGS] = PDO::SQLITE_OPEN_READONLY;
+    }
+    try {
+        $conn = new PDO('sqlite:' . INDEX_STORE, null, null, $options);
+        $meta = $conn->query("SELECT key, value FROM meta")->fetchAll(PDO::FETCH_KEY_PAIR);
+        if (($meta['version'] ?? '') !== '2') return $db;
+        // Only trust a store that indexes exactly our media directories
+        if (!same_media_dirs(json_decode($meta['media_dirs'] ?? '[]', true) ?: [], $MEDIA_DIRS)) {
+            error_log("playcard: index store " . INDEX_STORE . " covers other media directories, scanning filesystem");
+            return $db;
+        }
+        $db = $conn;
+        $INDEX_STORE_META = $meta;
+    } catch (PDOException $e) {
+        error_log("playcard: index store not usable, scanning filesystem: " . $e->getMessage());
+    }
+    return $db;
+}
+
+function store_file_info($row) {
+    return [
+        'path' => $row['path'],
+        'name' => $row['name'],
+        'ext' => $row['ext'],
+        'rel_path' => $row['rel_path']
+    ];
+}
+
+function store_find_file($db, $title_path, $extensions) {
+    global $INDEX_STORE_META;
+
+    $exts = array_map(fn($e) => ltrim($e, '.'), $extensions);
+    $ext_list = implode(',', array_fill(0, count($exts), '?'));
+
+    // exact relative path first, then the same filename search as the filesystem fallback
+    $stmt = $db->prepare("SELECT path, name, ext, rel_path FROM entries WHERE rel_path = ? AND ext IN ($ext_list)");
+    $stmt->execute(array_merge([$title_path], $exts));
+    if ($row = $stmt->fetch(PDO::FETCH_ASSOC)) return store_file_info($row);
+
+    $needle = pathinfo($title_path, PATHINFO_FILENAME);
+    if ($needle === '') return null;
+    if (($INDEX_STORE_META['fts_tokenizer'] ?? '') === 'trigram' && mb_strlen($needle) >= 3) {
+        $stmt = $db->prepare("SELECT e.path, e.name, e.ext, e.rel_path FROM entries_fts f
+            JOIN entries e ON e.id = f.rowid
+            WHERE entries_fts MATCH ? AND e.ext IN ($ext_list) AND instr(e.name, ?) > 0
+            ORDER BY e.id LIMIT 1");
+        $stmt->execute(array_merge(['name : "' . str_replace('"', '""', $needle) . '"'], $exts, [$needle]));
+    } else {
+        $stmt = $db->prepare("SELECT path, name, ext, rel_path FROM entries
+            WHERE instr(name, ?) > 0 AND ext IN ($ext_list) ORDER BY id LIMIT 1");
+        $stmt->execute(array_merge([$needle], $exts));
+    }
+    $row = $stmt->fetch(PDO::FETCH_ASSOC);
+    return $row ? store_file_info($row) : null;
+}
+
 function find_file($title_path, $extensions) {
     global $MEDIA_DIRS;
 
+    if ($db = index_store()) {
+        return store_find_file($db, $title_path, $extensions);
+    }
+
     foreach ($MEDIA_DIRS as $media_root) {
         $media_root_real = realpath($media_root);
         $full_path = realpath($media_root . '/' . $title_path);
@@ -169,6 +257,13 @@ function find_file($title_path, $extensions) {
 function find_cover_image($track_path, $track_name_base) {
     global $MEDIA_DIRS;
 
+    if ($db = index_store()) {
+        $stmt = $db->prepare("SELECT cover_path FROM entries WHERE path = ?");
+        $stmt->execute([$track_path]);
+        $cover = $stmt->fetchColumn();
+        return $cover ?: null;
+    }
+
     $img_extensions = ['jpg', 'jpeg'];
     $track_dir = dirname($track_path);
     $candidate_images = [];
@@ -265,6 +360,12 @@ OG;
 function generate_index() {
     global $MEDIA_DIRS, $ALLOWED_EXTENSIONS;
 
+    if ($db = index_store()) {
+        // sort_rank is the server's collation order, no usort needed
+        return $db->query("SELECT name, rel_path AS path FROM entries WHERE playable = 1 ORDER BY sort_rank")
+                  ->fetchAll(PDO::FETCH_ASSOC);
+    }
+
     $entries = [];
 
     foreach ($MEDIA_DIRS as $media_root) {
@@ -314,6 +415,21 @@ function compare_titles($a, $b) {
 function generate_index_with_structure() {
     global $MEDIA_DIRS, $ALLOWED_EXTENSIONS;
 
+    if ($db = index_store()) {
+        $folder_map = [];
+        $rows = $db->query("SELECT e.dir, e.name, e.rel_path, e.ext FROM entries e
+            JOIN folders f ON f.path = e.dir
+            WHERE e.playable = 1 ORDER BY f.sort_rank, e.sort_rank");
+        foreach ($rows as $row) {
+            $dir = $row['dir'] === '' ? '.' : $row['dir'];
+            $folder_map[$dir][] = ['name' => $row['name'], 'path' => $row['rel_path'], 'ext' => '.' . $row['ext']];
+        }
+        $shuffle_path = $db->query("SELECT rel_path FROM entries WHERE playable = 1 ORDER BY RANDOM() LIMIT 1")
+                           ->fetchColumn();
+        $shuffle_url = $shuffle_path ? "?title=" . urlencode($shuffle_path) : '#';
+        return [$folder_map, $shuffle_url];
+    }
+
     $folder_map = [];
     $all_files = [];
 
@@ -376,6 +492,15 @@ if (isset($_GET['stream'])) {
     $stream_path = urldecode($_GET['stream']);
     $stream_path = str_replace('\\', '/', $stream_path);
 
+    if ($db = index_store()) {
+        $stmt = $db->prepare("SELECT path FROM entries WHERE rel_path = ?");
+        $stmt->execute([$stream_path]);
+        $store_path = $stmt->fetchColumn();
+        if ($store_path && is_file($store_path)) {
+            send_file($store_path);
+        }
+    }
+
     foreach ($MEDIA_DIRS as $media_root) {
         $full_path = realpath($media_root . '/' . $stream_path);
         if ($full_path && is_file($full_path)) {
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Benchmark- und Lasttest-Suite für playcard_server.py
+
+Erzeugt einen synthetischen Medienbaum (verschachtelte Ordner, verbotene Ordner,
+Cover-Bilder), misst Index-Aufbau, Suche, Sortierung und Cover-Suche und schickt
+anschließend Last gegen den Flask-Testclient. Die Ergebnisse landen als JSON,
+damit man zwei Commits vergleichen kann:
+
+    python3 playcard_bench.py --files 100000 --output before.json
+    git checkout <anderer-commit>
+    python3 playcard_bench.py --files 100000 --output after.json --compare before.json
+
+Mit --memory wird zusätzlich der Speicherbedarf pro Worker gemessen: einmal baut jeder
+geforkte Worker seinen eigenen Index, einmal wird im Master vorgeladen (PLAYCARD_PRELOAD).
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import shutil
+import statistics
+import subprocess
+import threading
+
+# -------------------------------
+# Synthetischer Medienbaum
+# -------------------------------
+MEDIA_EXTS = ['.mp3', '.mp3', '.mp3', '.ogg', '.mp4', '.webm']
+WORDS = ['Blue', 'Night', 'Radio', 'Lied', 'Sonne', 'Herz', 'Zeit', 'Moon', 'Road', 'Fire',
+         'Ära', 'Öl', 'Über', 'Straße', 'Café', '99', '1984', '_Intro', 'Echo', 'Wind']
+STREAM_FILE = "bench_stream.mp3"  # Liegt direkt im Root, damit serve_file ihn findet
+STREAM_FILE_SIZE = 8 * 1024 * 1024
+
+
+def _title(rng, words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate_tree(root, n_files, files_per_folder=20, forbidden_ratio=0.02, cover_ratio=0.3, seed=42):
+    """Legt n_files leere Mediendateien in verschachtelten Artist/Album/CD-Ordnern an."""
+    rng = random.Random(seed)
+    created = 0
+    folder = 0
+    while created < n_files:
+        artist = f"Artist_{folder // 50:05d}"
+        album = f"{_title(rng, 2)} {folder:06d}"
+        parts = [root, artist, album]
+        if rng.random() < 0.2:
+            parts.append(f"CD{rng.randint(1, 3)}")
+        if rng.random() < forbidden_ratio:
+            parts.insert(2, "forbiddendir")
+        path = os.path.join(*parts)
+        os.makedirs(path, exist_ok=True)
+        for i in range(min(files_per_folder, n_files - created)):
+            base = f"{i + 1:02d} - {_title(rng)}"
+            open(os.path.join(path, base + rng.choice(MEDIA_EXTS)), 'wb').close()
+            if rng.random() < cover_ratio / files_per_folder * 3:
+                open(os.path.join(path, base + '.jpg'), 'wb').close()
+            created += 1
+        if rng.random() < cover_ratio:
+            open(os.path.join(path, f"{album} - cover.jpg"), 'wb').close()
+        folder += 1
+
+    with open(os.path.join(root, STREAM_FILE), 'wb') as f:
+        f.truncate(STREAM_FILE_SIZE)
+    return created
+
+
+# -------------------------------
+# Messhilfen
+# -------------------------------
+def _stats(samples):
+    samples = sorted(samples)
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0] * 1000, 3),
+        'median_ms': round(statistics.median(samples) * 1000, 3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3),
+    }
+
+
+def bench(fn, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return _stats(samples)
+
+
+def load_test(ps, url, requests_total, concurrency, headers=None, expect=(200,)):
+    """Schickt requests_total Anfragen mit concurrency Threads an den Flask-Testclient."""
+    samples = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = max(1, requests_total // concurrency)
+
+    def worker():
+        client = ps.app.test_client()
+        local = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            response = client.get(url, headers=headers or {})
+            response.get_data()
+            local.append(time.perf_counter() - start)
+            if response.status_code not in expect:
+                errors.append(response.status_code)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    result = _stats(samples)
+    result.update({
+        'concurrency': concurrency,
+        'requests_per_s': round(len(samples) / elapsed, 1),
+        'errors': len(errors),
+    })
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -------------------------------
+# Speicher pro Worker (Preload vs. Index pro Worker)
+# -------------------------------
+def _memory_usage():
+    """Rss/Pss/Private in MiB aus /proc/self/smaps_rollup (Linux)."""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': round(fields.get('Rss', 0), 1),
+        'pss_mb': round(fields.get('Pss', 0), 1),
+        'private_mb': round(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0), 1),
+    }
+
+
+def _worker_traffic(ps):
+    """Typische Anfragen, damit die Worker den Index wirklich anfassen (Refcounts, Sortierung)."""
+    ps.limiter.enabled = False
+    ps._get_radio_streams_from_xml = lambda: []
+    client = ps.app.test_client()
+    prefix = f"/{ps.MUSIC_PATH}/{ps.PLAYCARD_ENDPOINT}"
+    for url in (f"{prefix}?structured=1", f"{prefix}?structured=0", f"{prefix}?title=radio",
+                f"{prefix}/api/index?structured=0", f"{prefix}/api/tree"):
+        client.get(url).get_data()
+
+
+def memory_child(root, mode, workers):
+    """Läuft in einem eigenen Interpreter: forkt Worker wie ein Prefork-Server und misst sie gemeinsam."""
+    import multiprocessing
+    os.environ['AUDIO_PATH'] = root
+    os.environ['PLAYCARD_BACKGROUND_INDEX'] = '0'
+    os.environ['PLAYCARD_LOUDNESS'] = '0'
+    os.environ['PLAYCARD_PRELOAD'] = '1' if mode == 'preload' else '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    ctx = multiprocessing.get_context('fork')
+    barrier = ctx.Barrier(workers)
+    read_fd, write_fd = os.pipe()
+
+    master = None
+    if mode == 'preload':
+        import playcard_server as master  # Baut und friert den Index im "Master"
+        master_usage = _memory_usage()
+
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            ps = master
+            if ps is None:
+                import playcard_server as ps  # Jeder Worker baut seinen eigenen Index
+            _worker_traffic(ps)
+            barrier.wait()  # Erst messen, wenn alle Worker leben (Pss teilt sich auf)
+            os.write(write_fd, (json.dumps(_memory_usage()) + '\n').encode())
+            barrier.wait()
+            os._exit(0)
+        pids.append(pid)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        samples = [json.loads(line) for line in f]
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+    result = {'workers': workers}
+    for key in ('rss_mb', 'pss_mb', 'private_mb'):
+        result[f'worker_{key}'] = round(statistics.fmean(s[key] for s in samples), 1)
+    result['total_pss_mb'] = round(sum(s['pss_mb'] for s in samples) +
+                                   (master_usage['pss_mb'] if master else 0), 1)
+    if master:
+        result['master'] = master_usage
+    print(json.dumps(result))
+
+
+def run_memory(root, workers):
+    results = {}
+    for mode in ('per_worker', 'preload'):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--memory-child', mode,
+                                          '--tree', root, '--workers', str(workers)])
+        results[mode] = json.loads(output.decode().strip().splitlines()[-1])
+    return results
+
+
+# -------------------------------
+# Suite
+# -------------------------------
+def run_suite(args, root):
+    os.environ['AUDIO_PATH'] = root
+    os.environ['PLAYCARD_BACKGROUND_INDEX'] = '0'  # Index beim Import blockierend bauen, wie bisher
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import playcard_server as ps
+
+    # Nur den synthetischen Baum indizieren, Radio-Upstream und Rate-Limits ausblenden
+    ps.MEDIA_DIRS = [os.path.abspath(root)]
+    ps._get_radio_streams_from_xml = lambda: []
+    ps.limiter.enabled = False
+
+    results = {'micro': {}, 'load': {}}
+    micro = results['micro']
+
+    micro['build_media_index'] = bench(lambda: ps.build_media_index(ps.EXTENSIONS), repeat=args.repeat)
+    micro['build_media_index']['entries'] = len(ps.MEDIA_INDEX)
+
+    media_entries = [e for e in ps.MEDIA_INDEX if f".{e['ext']}" in ps.ALLOWED_EXTENSIONS]
+    sample = random.Random(1).choice(media_entries) if media_entries else None
+    terms = {
+        'substring_hit': 'radio',
+        'exact_path': sample['rel_path'] if sample else 'x',
+        'fuzzy_miss': 'qzxv wvut',
+    }
+    for label, term in terms.items():
+        micro[f'search_{label}'] = bench(lambda t=term: ps.find_all_matches_from_index(t),
+                                         repeat=1 if label == 'fuzzy_miss' else args.repeat)
+
+    micro['search_substring_hit_uncached'] = bench(lambda: ps._search_index('radio', 10), repeat=args.repeat)
+
+    micro['generate_index_structured'] = bench(lambda: ps.generate_index(structured=True), repeat=args.repeat)
+    micro['generate_index_flat'] = bench(lambda: ps.generate_index(structured=False), repeat=args.repeat)
+    names = [e['name'] for e in media_entries]
+    micro['sort_key_locale'] = bench(lambda: sorted(names, key=ps.sort_key_locale), repeat=args.repeat)
+    micro['sort_precomputed_keys'] = bench(lambda: sorted(media_entries, key=lambda e: e['sort_key']),
+                                           repeat=args.repeat)
+
+    if sample:
+        track_base = os.path.splitext(sample['name'])[0]
+        micro['find_cover_by_name_in_index'] = bench(lambda: ps._find_cover_by_name_in_index(track_base),
+                                                     repeat=args.repeat)
+        micro['find_cover_image'] = bench(lambda: ps.find_cover_image(sample['path'], track_base),
+                                          repeat=args.repeat)
+
+    prefix = f"/{ps.MUSIC_PATH}/{ps.PLAYCARD_ENDPOINT}"
+    load = results['load']
+    n, c = args.requests, args.concurrency
+    load['playcard_structured'] = load_test(ps, f"{prefix}?structured=1", n, c)
+    load['playcard_flat'] = load_test(ps, f"{prefix}?structured=0", n, c)
+    load['playcard_search'] = load_test(ps, f"{prefix}?title=radio", n, c)
+    load['api_index_flat'] = load_test(ps, f"{prefix}/api/index?structured=0", n, c)
+    load['api_index_structured'] = load_test(ps, f"{prefix}/api/index?structured=1", n, c)
+    load['stream_range'] = load_test(ps, f"{prefix}/{STREAM_FILE}", n * 5, c,
+                                     headers={'Range': 'bytes=1048576-2097151'}, expect=(206,))
+    return results
+
+
+def compare(current, baseline_path):
+    """Gibt die Median-Verhältnisse aktuell/Baseline aus (>1 = langsamer geworden)."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nVergleich mit {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    for section in ('micro', 'load'):
+        for name, stats in current[section].items():
+            old = baseline.get(section, {}).get(name)
+            if not old or not old.get('median_ms'):
+                continue
+            ratio = stats['median_ms'] / old['median_ms']
+            flag = '  <-- REGRESSION' if ratio > 1.2 else ''
+            print(f"  {section}.{name:32s} {old['median_ms']:10.3f} ms -> {stats['median_ms']:10.3f} ms  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark- und Lasttest-Suite für playcard_server.py")
+    parser.add_argument('--files', type=int, default=10000, help="Anzahl synthetischer Mediendateien (10k-1M)")
+    parser.add_argument('--files-per-folder', type=int, default=20)
+    parser.add_argument('--forbidden-ratio', type=float, default=0.02, help="Anteil der Ordner unter FORBIDDEN_DIRS")
+    parser.add_argument('--cover-ratio', type=float, default=0.3, help="Anteil der Ordner mit Cover-Bild")
+    parser.add_argument('--tree', help="Vorhandenen Baum benutzen statt einen temporären zu erzeugen")
+    parser.add_argument('--keep-tree', action='store_true', help="Temporären Baum nach dem Lauf nicht löschen")
+    parser.add_argument('--repeat', type=int, default=5, help="Wiederholungen pro Micro-Benchmark")
+    parser.add_argument('--requests', type=int, default=50, help="Anfragen pro Endpunkt im Lasttest")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--output', default='bench.json', help="Ziel-JSON-Datei")
+    parser.add_argument('--compare', help="Früheres Ergebnis-JSON zum Vergleich")
+    parser.add_argument('--memory', action='store_true', help="Speicher pro Worker messen (Preload vs. Index pro Worker)")
+    parser.add_argument('--workers', type=int, default=4, help="Worker-Anzahl für --memory")
+    parser.add_argument('--memory-child', choices=['per_worker', 'preload'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.memory_child:
+        memory_child(args.tree, args.memory_child, args.workers)
+        return
+
+    root = args.tree or tempfile.mkdtemp(prefix='playcard-bench-')
+    # Caches, Index-Store, Play-Statistik usw. in ein eigenes HOME, damit der Lauf nie
+    # den Store überschreibt, den der produktive Server und playcard.php benutzen
+    home = tempfile.mkdtemp(prefix='playcard-bench-home-')
+    os.environ['HOME'] = home
+    os.environ['PLAYCARD_INDEX_STORE'] = os.path.join(home, '.playcard', 'playcard-index.sqlite')
+    try:
+        generate_seconds = 0.0
+        if not args.tree:
+            start = time.perf_counter()
+            created = generate_tree(root, args.files, args.files_per_folder, args.forbidden_ratio, args.cover_ratio)
+            generate_seconds = time.perf_counter() - start
+            print(f"Generated {created} files under {root} in {generate_seconds:.1f}s")
+
+        results = run_suite(args, root)
+        if args.memory:
+            results['memory'] = run_memory(root, args.workers)
+        results['meta'] = {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'files': args.files,
+            'tree': root if args.tree or args.keep_tree else None,
+            'tree_generation_s': round(generate_seconds, 2),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'workers': args.workers if args.memory else None,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(json.dumps(results, indent=2, sort_keys=True))
+        print(f"\nResults written to {args.output}")
+        if args.compare:
+            compare(results, args.compare)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+        if not args.tree and not args.keep_tree:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Gunicorn-Konfiguration für den Preload-Modus von playcard_server.py
+
+    gunicorn -c playcard_gunicorn.conf.py -b 127.0.0.1:8010 playcard_server:app
+
+Der Master importiert die App, baut Index, sortierte Ansichten und Cover-Map einmal und
+friert sie mit gc.freeze() ein; die Worker erben alles copy-on-write.
+
+Reload (Index neu bauen, frische Worker forken, alte geordnet beenden):
+    kill -HUP <master-pid>
+oder POST /musik/playcard/api/admin/reload mit Admin-Token.
+"""
+import os
+
+os.environ.setdefault("PLAYCARD_PRELOAD", "1")
+
+workers = int(os.environ.get("PLAYCARD_WORKERS", "4"))
+# Threads pro Worker: offene Now-Playing-Streams (/api/radio/events) und lange Downloads
+# belegen so nur einen Thread statt eines ganzen Workers
+worker_class = "gthread"
+threads = int(os.environ.get("PLAYCARD_THREADS", "16"))
+preload_app = True
+
+
+def post_fork(server, worker):
+    import playcard_server
+    playcard_server.after_fork()
+
+
+def on_reload(server):
+    # Läuft im Master vor dem Start der neuen Worker, die den frischen Index dann erben
+    import playcard_server
+    playcard_server.preload_index()
@@ -5,16 +5,47 @@ import urllib.parse
 import locale
 import fcntl
 import random
+import io
+import sys
+import time
+import json
+import asyncio
+import contextvars
+import functools
+import itertools
+import hmac
+import math
+import atexit
+import sqlite3
+import hashlib
+import shutil
+import subprocess
+import base64
+from array import array
+from collections import deque, OrderedDict
+import queue
+import mimetypes
+import mmap
+import gc
+import signal
+import bisect
+import struct
+import zlib
 import requests
 import logging
-from flask import Flask, send_from_directory, abort, redirect, request, render_template_string, url_for, jsonify
+from logging.handlers import QueueHandler, QueueListener
+from flask import Flask, send_from_directory, abort, redirect, request, render_template_string, url_for, jsonify, stream_with_context, g
 from markupsafe import escape
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from limits.storage import Storage as LimitsStorage
 from difflib import get_close_matches
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from threading import Lock, Condition, Event, Thread, Timer, get_ident as threading_get_ident
 from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import HTTPException
 
 # -------------------------------
 # Configuration (identisch zu PHP)
@@ -29,6 +60,163 @@ PLAYCARD_ENDPOINT = "playcard"
 RADIO_NOW_PLAYING_URL = "https://jaquearnoux.de/now.xsl" # The URL you provided
 RADIO_LOGO = "https://jaquearnoux.de/radio.png" 
 
+# --- Optional radio relay ---
+# Statt jeden Hörer direkt zum Shoutcast-Mount zu schicken, hält der Relay genau eine
+# Upstream-Verbindung pro Mount und verteilt die Bytes über einen Ringpuffer an alle lokalen Hörer.
+RADIO_RELAY_ENABLED = os.environ.get("PLAYCARD_RADIO_RELAY", "0") == "1"
+# Basis-URL der Mounts aus now.xsl; Standard ist Schema+Host von RADIO_NOW_PLAYING_URL.
+# Zum Testen gegen einen lokalen Dummy-Stream-Server einfach z.B. "http://127.0.0.1:8000" setzen.
+RADIO_STREAM_BASE_URL = os.environ.get("RADIO_STREAM_BASE_URL") or \
+    "{0.scheme}://{0.netloc}".format(urllib.parse.urlparse(RADIO_NOW_PLAYING_URL))
+# Kommagetrennte Liste erlaubter Mounts (z.B. "/stream,/radio.ogg"). Leer = Mounts aus now.xsl.
+RADIO_RELAY_MOUNTS = [m.strip() for m in os.environ.get("RADIO_RELAY_MOUNTS", "").split(",") if m.strip()]
+RADIO_RELAY_BUFFER_SIZE = 1024 * 1024   # Ringpuffer pro Mount (~60 s bei 128 kbit/s)
+RADIO_RELAY_CHUNK_SIZE = 16 * 1024
+RADIO_RELAY_BURST_SIZE = 64 * 1024      # So viel bekommt ein neuer Hörer sofort (schneller Start)
+RADIO_RELAY_IDLE_TIMEOUT = 15           # Sekunden ohne Hörer, bevor der Upstream geschlossen wird
+RADIO_RELAY_MAX_SKIPS = 3               # Wie oft ein langsamer Hörer vorspringen darf, bevor er getrennt wird
+
+# --- Now-Playing Push (Server-Sent Events) ---
+# Ein Watcher pro Prozess fragt now.xsl ab und pusht nur bei Titelwechseln an alle Abonnenten.
+RADIO_WATCH_INTERVAL = 10               # Sekunden zwischen zwei Upstream-Abfragen des Watchers
+RADIO_WATCH_LINGER = 60                 # So lange läuft der Watcher nach dem letzten Abonnenten weiter
+RADIO_EVENTS_HEARTBEAT = 25             # Keepalive-Kommentar, damit Proxies die Verbindung offen halten
+
+# --- ASGI-Modus (uvicorn playcard_server:asgi_application) ---
+ASGI_THREAD_POOL_SIZE = 32              # Threads für Dateizugriffe und die synchronen Flask-Routen
+ASGI_STREAM_CHUNK_SIZE = 256 * 1024
+ASGI_POLL_INTERVAL = 0.05               # Sekunden, mit denen Relay-Hörer im Event-Loop auf neue Daten warten
+
+# --- Admin-Token für Diagnose-/Verwaltungsfunktionen (Profiling usw.) ---
+# Ohne Token sind diese Funktionen abgeschaltet.
+PLAYCARD_ADMIN_TOKEN = os.environ.get("PLAYCARD_ADMIN_TOKEN")
+
+# --- Profiling auf Anfrage ---
+# Aktiv per Header "X-Playcard-Profile: <token>" bzw. "?profile=<token>" oder für einen
+# zufälligen Anteil (in Prozent) aller Anfragen an die Index- und API-Views.
+PROFILE_SAMPLE_PERCENT = float(os.environ.get("PLAYCARD_PROFILE_SAMPLE_PERCENT", "0"))
+PROFILE_DIR = os.path.join(os.path.expanduser('~'), '.playcard', 'profiles')
+PROFILE_INTERVAL = 0.002                # Sekunden zwischen zwei Stack-Samples
+PROFILE_KEEP = 200                      # So viele Profile bleiben auf der Platte liegen
+PROFILED_ENDPOINTS = {'playcard', 'get_index_json', 'get_track_info_json', 'get_random_track_json'}
+
+# --- Play-Statistik ("most played" / "trending") ---
+# Plays werden pro Worker im Speicher gesammelt und gebündelt in SQLite (WAL) geschrieben.
+PLAYS_DB_PATH = os.path.join(os.path.expanduser('~'), '.playcard', 'plays.sqlite')
+PLAYS_FLUSH_INTERVAL = 30               # Sekunden zwischen zwei Flushes
+PLAYS_FLUSH_THRESHOLD = 500             # ... oder früher, wenn so viele Plays anstehen
+PLAYS_DEDUP_WINDOW = 60                 # Derselbe Client + Titel innerhalb dieser Sekunden zählt nur einmal
+TRENDING_HALF_LIFE = 3 * 24 * 3600      # Halbwertszeit des Trending-Scores in Sekunden
+
+# --- Caches und Deduplizierung ---
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.playcard')
+# Gleiche Aufnahmen in mehreren MEDIA_DIRS nur einmal listen (Gruppierung nach Größe, dann Inhalts-Hash)
+DEDUP_MEDIA_INDEX = os.environ.get("PLAYCARD_DEDUP", "1") == "1"
+DEDUP_HASH_WORKERS = min(4, os.cpu_count() or 1)  # Threads zum Hashen (I/O-lastig, hashlib gibt die GIL frei)
+DEDUP_PARTIAL_HASH_BYTES = 64 * 1024    # Anfang und Ende der Datei für den schnellen Vorab-Hash
+
+# --- Hintergrund-Analysen mit ffmpeg (Lautheit usw.) ---
+FFMPEG_BIN = os.environ.get("PLAYCARD_FFMPEG") or shutil.which("ffmpeg")
+NICE_BIN = shutil.which("nice")
+ANALYSIS_WORKERS = 2                    # Höchstens so viele ffmpeg-Prozesse gleichzeitig pro Server-Prozess
+ANALYSIS_NICE = 19                      # Niedrigste CPU-Priorität für die Analyse-Prozesse
+ANALYSIS_TIMEOUT = 600                  # Sekunden pro Datei
+ANALYSIS_RECHECK = 10                   # Andere Worker schauen höchstens so oft (Sekunden) im Cache nach
+LOUDNESS_ANALYSIS = os.environ.get("PLAYCARD_LOUDNESS", "1") == "1"
+REPLAYGAIN_REFERENCE_LUFS = -18.0       # ReplayGain-2.0-Referenzpegel
+PEAKS_SAMPLE_RATE = 8000                # Dekodier-Rate für die Wellenform (mono)
+PEAKS_BLOCK_SAMPLES = 256               # Feinauflösung im Cache: ~31 Peaks pro Sekunde, 1 Byte pro Peak
+PEAKS_DEFAULT_BUCKETS = 200
+PEAKS_MAX_BUCKETS = 4096
+# Video-Vorschaubilder: Posterframe (Cover) und Sprite-Sheet zum Scrubben, je Video einmal
+VIDEO_THUMBNAILS = os.environ.get("PLAYCARD_VIDEO_THUMBNAILS", "1") == "1"
+THUMBNAIL_DIR = os.path.join(os.path.expanduser('~'), '.playcard', 'thumbnails')
+VIDEO_THUMBNAIL_WORKERS = 1             # Video-Dekodierung ist teurer als Audio, ein ffmpeg reicht
+POSTER_WIDTH = 480
+POSTER_POSITION = 0.1                   # Posterframe bei diesem Anteil der Laufzeit ...
+POSTER_MAX_OFFSET = 60                  # ... aber spätestens nach so vielen Sekunden
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_MAX_TILES = 100
+SPRITE_MIN_INTERVAL = 2                 # Mindestabstand zweier Kacheln in Sekunden
+
+# --- Antwort-Cache (LRU pro Worker vor optionalem, gemeinsamem memcached) ---
+MEMCACHED_SERVER = os.environ.get("PLAYCARD_MEMCACHED", "localhost:11211")
+RESPONSE_CACHE_SIZE = 4096              # Einträge im In-Process-LRU
+RESPONSE_CACHE_TTL = 300                # Sekunden; index-abhängige Einträge verfallen zusätzlich mit der Index-Generation
+RESPONSE_CACHE_RETRY = 30               # Sekunden Pause, nachdem memcached nicht erreichbar war
+RADIO_SNAPSHOT_TTL = 5                  # So lange teilen sich alle Worker einen Now-Playing-Stand
+
+# --- Reverse-Proxy ---
+# Anzahl vorgeschalteter Proxys, deren X-Forwarded-For übernommen wird. Davon hängt die
+# Client-Adresse für Rate-Limits und Play-Statistik ab. Standard 0 (direkt erreichbar, sonst
+# könnten Clients ihre Adresse selbst setzen); die erzeugten Service-Units hinter dem Proxy setzen 1.
+TRUSTED_PROXIES = int(os.environ.get("PLAYCARD_TRUSTED_PROXIES") or 0)
+
+# --- Rate-Limiting ---
+# Standard: Zähler in einer gemeinsam gemappten Datei (mmap). Alle Worker eines Servers teilen
+# sich damit dieselben Limits ohne Netzwerk-Roundtrip. Alternativ z.B. "memcached://localhost:11211".
+RATELIMIT_STORAGE_URI = os.environ.get("PLAYCARD_RATELIMIT_STORAGE") or \
+    f"mmap://{os.path.join(CACHE_DIR, f'{PLAYCARD_ENDPOINT}-ratelimit.mmap')}"
+RATELIMIT_MMAP_SLOTS = 16384            # Gleichzeitig verfolgte Schlüssel (Client x Limit), 24 Byte pro Slot
+RATELIMIT_MMAP_PROBES = 32              # Slots, die pro Schlüssel durchsucht werden, bevor der älteste verdrängt wird
+# Eigener Bereich für die Marken geöffneter Streams (6 h gültig), damit sie keine Limit-Zähler verdrängen
+RATELIMIT_MMAP_STREAM_SLOTS = 4096
+STREAM_CONTINUATION_WINDOW = 6 * 3600   # So lange zählen Range-Folgeanfragen eines geöffneten Streams nicht
+
+# --- Index-Aufbau beim Start ---
+# Der Index wird im Hintergrund gebaut, der Server nimmt sofort Anfragen an.
+# Beim ersten Aufbau werden Teilergebnisse in diesem Abstand (Sekunden) sichtbar gemacht.
+INDEX_BUILD_IN_BACKGROUND = os.environ.get("PLAYCARD_BACKGROUND_INDEX", "1") == "1"
+INDEX_PUBLISH_INTERVAL = 2.0
+# Preload-Modus für vorgeforkte Server (uWSGI ohne lazy-apps, gunicorn --preload): Index, sortierte
+# Ansichten und Cover-Map werden einmal im Master gebaut und per gc.freeze() copy-on-write geteilt.
+PRELOAD_MODE = os.environ.get("PLAYCARD_PRELOAD") == "1"
+# Gemeinsamer Index-Speicher (SQLite mit FTS5): Nach jedem vollständigen Aufbau schreibt der
+# Indexer Einträge, Sortierreihenfolge, Cover-Zuordnung und Suchtabelle in diese Datei.
+# playcard.php liest sie nur (PLAYCARD_INDEX_STORE dort auf denselben Pfad setzen), und weitere
+# Worker übernehmen den Index von hier, statt selbst die Platte zu durchsuchen. Leer = aus.
+INDEX_STORE_PATH = os.environ.get("PLAYCARD_INDEX_STORE",
+                                  os.path.join(os.path.expanduser('~'), '.playcard', f'{PLAYCARD_ENDPOINT}-index.sqlite'))
+INDEX_STORE_VERSION = 2
+INDEX_STORE_SYNC_INTERVAL = 2.0          # Sekunden zwischen zwei Prüfungen auf Einträge anderer Worker
+PROCESS_START = time.time()
+
+# --- Playlists (M3U8/XSPF) ---
+PLAYLIST_MAX_SHUFFLE = 1000             # Obergrenze für zufällige Playlists
+
+# --- Upload (fortsetzbar nach dem tus-Protokoll, Admin-Token erforderlich) ---
+# Zielordner, muss unter einem MEDIA_DIR liegen; leer = <erstes MEDIA_DIR>/uploads.
+# Ein einzelner Chunk (PATCH) ist durch MAX_CONTENT_LENGTH begrenzt, die Datei durch UPLOAD_MAX_SIZE.
+UPLOAD_DIR = os.environ.get("PLAYCARD_UPLOAD_DIR", "")
+UPLOAD_MAX_SIZE = 4 * 1024 ** 3
+UPLOAD_WRITE_SIZE = 256 * 1024          # Schreibblock beim Entgegennehmen eines Chunks
+UPLOAD_EXPIRY = 24 * 3600               # Unvollständige Uploads werden danach verworfen
+
+# --- Empfehlungen ("Up next", braucht NumPy) ---
+# Speicher: Titel x (RECOMMEND_DIMENSIONS + 3) x 4 Byte, bei 500k Titeln und 128 Dimensionen ~260 MB
+RECOMMEND_DIMENSIONS = 128              # Hash-Buckets der Merkmalsvektoren
+RECOMMEND_DEFAULT = 10
+RECOMMEND_MAX = 50
+RECOMMEND_SHUFFLE_POOL = 20             # /api/random_track?after=...: Zufall unter so vielen ähnlichsten Titeln
+RECOMMEND_NUMERIC_WEIGHT = 1.0          # Gewicht von Laufzeit und Lautheit gegenüber den Tokens
+RECOMMEND_REFRESH_DELAY = 60            # Laufzeit/Lautheit frühestens so lange (Sekunden) nach neuen Analysen nachziehen
+
+# --- API-Antwortformate (JSON, NDJSON, MessagePack, CBOR) ---
+API_STREAM_BUFFER = 64 * 1024           # Gestreamte Formate werden in Blöcken dieser Größe gesendet
+API_RECORD_BATCH = 500                  # So viele Songs teilen sich eine Cache-Abfrage (get_many/set_many)
+
+# --- Ordner-Download (ZIP ohne Kompression, gestreamt) ---
+ZIP_CHUNK_SIZE = 1024 * 1024            # Lesegröße pro Datei; mehr Speicher braucht ein Download nicht
+
+
+# --- Logging (asynchron über eine Queue, gesprächige Meldungen gedrosselt) ---
+LOG_LEVEL = os.environ.get("PLAYCARD_LOG_LEVEL", "").upper()  # Leer = Level vom Root-Logger übernehmen
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_QUEUE_SIZE = 10000                  # Ist die Queue voll, wird verworfen statt die Anfrage zu blockieren
+# Meldungen mit extra=LOG_SAMPLED erscheinen höchstens einmal pro Aufrufstelle und Intervall (Sekunden)
+LOG_SAMPLE_INTERVAL = float(os.environ.get("PLAYCARD_LOG_SAMPLE_INTERVAL", "60"))
+
 
 # --- DEBUG/TESTING FLAGS ---
 # Set to True to prioritize radio stream for shuffle, useful for testing the fallback.
@@ -73,13 +261,39 @@ EXTENSIONS = ALLOWED_EXTENSIONS | IMAGE_EXTENSIONS | MUSIC_EXTENSIONS | VIDEO_EX
 
 
 MEDIA_INDEX = []
+MEDIA_TREE = {}  # Relativer Ordnerpfad -> Knoten, wird zusammen mit MEDIA_INDEX aufgebaut
+MEDIA_BY_REL_PATH = {}  # rel_path -> MEDIA_INDEX-Eintrag
+MEDIA_ALTERNATES = {}  # rel_path eines weggefassten Duplikats -> kanonischer MEDIA_INDEX-Eintrag
+COVER_MAP = None  # CoverMap über die Bild-Einträge des Index
+SORTED_VIEWS = {}  # (INDEX_GENERATION, structured) -> Ergebnis von generate_index
+INDEX_GENERATION = "0"  # Fingerabdruck des Index-Inhalts, Namensraum für den Antwort-Cache
+# Fortschritt des Index-Aufbaus für /health und /ready ('complete': es gab schon einen vollständigen Index)
+INDEX_STATUS = {'state': 'pending', 'complete': False, 'entries': 0, 'builds': 0,
+                'started': None, 'finished': None, 'duration': None, 'error': None}
 INDEX_LOCK = Lock()
 
-# Set locale for sorting
+# -------------------------------
+# Sortierung (Collation)
+# -------------------------------
+# Die Sortier-Locale wird genau einmal beim Import festgelegt und danach nie mehr
+# umgestellt (setlocale ist prozessweit und nicht thread-sicher). Mit PyICU wird ein
+# ICU-Collator benutzt, sonst strxfrm unter LC_COLLATE.
+COLLATION_LOCALES = [loc for loc in (os.environ.get("PLAYCARD_COLLATION_LOCALE"),
+                                     'de_DE.UTF-8', 'de_DE.UTF8', 'en_US.UTF-8', 'C.UTF-8', 'C') if loc]
+
 try:
-    locale.setlocale(locale.LC_ALL, '')
-except locale.Error:
-    locale.setlocale(locale.LC_ALL, 'C')  # Fallback to C locale
+    from icu import Collator as IcuCollator, Locale as IcuLocale
+    ICU_COLLATOR = IcuCollator.createInstance(IcuLocale(COLLATION_LOCALES[0].split('.')[0]))
+    COLLATOR_ID = f"icu:{COLLATION_LOCALES[0].split('.')[0]}"
+except ImportError:
+    ICU_COLLATOR = None
+    for loc in COLLATION_LOCALES:
+        try:
+            locale.setlocale(locale.LC_COLLATE, loc)
+            break
+        except locale.Error:
+            continue
+    COLLATOR_ID = f"strxfrm:{locale.setlocale(locale.LC_COLLATE)}"
 
 # -------------------------------
 # App Setup
@@ -88,18 +302,141 @@ app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 # Fix gegen localhost leak Zeile NACH der Instanziierung der Flask-App:
 # app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_host=1, x_prefix=1, x_proto=1)
-# Oder einfacher (nur die Host-Header):
-app.wsgi_app = ProxyFix(app.wsgi_app, x_host=1, x_proto=1) # Minimal, aber oft ausreichend
+# Host- und Proto-Header, dazu die Client-Adresse hinter TRUSTED_PROXIES Proxys:
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_host=1, x_proto=1)
 
 
-# Configure storage backend
-try:
-    import pymemcache
-    storage_uri = "memcached://localhost:11211"
-    print("Using memcached for rate limiting")  # Debug output
-except ImportError:
-    storage_uri = "memory://"
-    print("Memcached not available, using in-memory storage")  # Debug output
+# -------------------------------
+# Rate-Limit-Speicher im Shared Memory (mmap)
+# -------------------------------
+class MmapRateLimitStorage(LimitsStorage):
+    """
+    limits-Storage ("mmap://<datei>") für die Fixed-Window-Strategie. Die Zähler liegen
+    in einer Hash-Tabelle fester Größe in einer per mmap geteilten Datei, sodass alle
+    vorgeforkten Worker dieselben Limits sehen. Zugriffe sind mit lockf (zwischen
+    Prozessen) und einem Thread-Lock (innerhalb des Prozesses) geschützt.
+    Slot: Schlüssel-Hash (u64, 0 = frei), Fensterende (Unix-Zeit), Zähler.
+    Marken geöffneter Streams liegen in einem eigenen Bereich hinter den Limit-Zählern, damit
+    viele geöffnete Dateien keine laufenden Zähler verdrängen können.
+    """
+    STORAGE_SCHEME = ["mmap"]
+    SLOT = struct.Struct('<Qdq')
+    STREAM_PREFIX = "playcard/open-stream/"
+
+    def __init__(self, uri=None, wrap_exceptions=False, slots=RATELIMIT_MMAP_SLOTS,
+                 stream_slots=RATELIMIT_MMAP_STREAM_SLOTS, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = urllib.parse.urlparse(uri).path if uri else \
+            os.path.join(CACHE_DIR, f'{PLAYCARD_ENDPOINT}-ratelimit.mmap')
+        self.slots = int(slots)
+        self.stream_slots = int(stream_slots)
+        size = (self.slots + self.stream_slots) * self.SLOT.size
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.fd).st_size != size:
+                os.ftruncate(self.fd, 0)  # Neue oder anders dimensionierte Tabelle: leer anlegen
+                os.ftruncate(self.fd, size)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.map = mmap.mmap(self.fd, size)
+        self.lock = Lock()
+
+    @property
+    def base_exceptions(self):
+        return (OSError, ValueError)
+
+    def _acquire(self):
+        self.lock.acquire()
+        try:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+        except OSError:
+            self.lock.release()
+            raise
+
+    def _release(self):
+        fcntl.lockf(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+    def _find(self, key, now):
+        """(Slot-Index, Hash, Fensterende, Zähler); abgelaufene oder neue Schlüssel haben Zähler 0."""
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') | 1
+        base, slots = (self.slots, self.stream_slots) if key.startswith(self.STREAM_PREFIX) else (0, self.slots)
+        start = key_hash % slots
+        free = oldest = None
+        oldest_expiry = math.inf
+        for i in range(RATELIMIT_MMAP_PROBES):
+            index = base + (start + i) % slots
+            slot_hash, expiry, count = self.SLOT.unpack_from(self.map, index * self.SLOT.size)
+            if slot_hash == key_hash:
+                return (index, key_hash, expiry, count) if expiry > now else (index, key_hash, 0.0, 0)
+            if free is None and (slot_hash == 0 or expiry <= now):
+                free = index
+            elif expiry < oldest_expiry:
+                oldest, oldest_expiry = index, expiry
+        # Tabelle in diesem Bereich voll: den Schlüssel mit dem frühesten Fensterende verdrängen
+        return (free if free is not None else oldest), key_hash, 0.0, 0
+
+    def incr(self, key, expiry, amount=1, elastic_expiry=False, **kwargs):
+        # elastic_expiry übergeben limits 2.x/3.x (Flask-Limiter 2.x) noch als Schlüsselwort
+        self._acquire()
+        try:
+            now = time.time()
+            index, key_hash, window_end, count = self._find(key, now)
+            if count == 0 or elastic_expiry:
+                window_end = now + expiry
+            count += amount
+            self.SLOT.pack_into(self.map, index * self.SLOT.size, key_hash, window_end, count)
+            return count
+        finally:
+            self._release()
+
+    def get(self, key):
+        self._acquire()
+        try:
+            return self._find(key, time.time())[3]
+        finally:
+            self._release()
+
+    def get_expiry(self, key):
+        self._acquire()
+        try:
+            now = time.time()
+            window_end = self._find(key, now)[2]
+            return window_end if window_end else now
+        finally:
+            self._release()
+
+    def clear(self, key):
+        self._acquire()
+        try:
+            index, key_hash, _, count = self._find(key, time.time())
+            if count:
+                self.SLOT.pack_into(self.map, index * self.SLOT.size, 0, 0.0, 0)
+        finally:
+            self._release()
+
+    def reset(self):
+        self._acquire()
+        try:
+            now = time.time()
+            cleared = 0
+            for index in range(self.slots + self.stream_slots):
+                slot_hash, expiry, _ = self.SLOT.unpack_from(self.map, index * self.SLOT.size)
+                if slot_hash and expiry > now:
+                    cleared += 1
+            self.map[:] = bytes(len(self.map))
+            return cleared
+        finally:
+            self._release()
+
+    def check(self):
+        return not self.map.closed
+
+
+storage_uri = RATELIMIT_STORAGE_URI
+print(f"Using {urllib.parse.urlparse(storage_uri).scheme} storage for rate limiting")  # Debug output
 
 # Rate limiting with explicit storage
 limiter = Limiter(
@@ -107,9 +444,349 @@ limiter = Limiter(
     key_func=get_remote_address,
     storage_uri=storage_uri,
     default_limits=["100 per minute"],
-    strategy="fixed-window"  # or "moving-window"
+    strategy="fixed-window",  # or "moving-window"
+    # Nicht geänderte Dateien (304) kosten kaum etwas und zählen nicht gegen das Limit
+    default_limits_deduct_when=lambda response: response.status_code != 304
 )
 
+
+def _open_stream_key(filename):
+    return f"{MmapRateLimitStorage.STREAM_PREFIX}{get_remote_address()}/{filename}"
+
+
+@limiter.request_filter
+def _is_stream_continuation():
+    """
+    Range-Folgeanfragen (Spulen, Weiterladen) eines Streams, den derselbe Client bereits
+    geöffnet hat, sind vom Limit ausgenommen. Geöffnete Streams merkt sich serve_file im
+    Limit-Speicher, damit das über alle Worker hinweg gilt.
+    """
+    if request.endpoint != 'serve_file' or not request.headers.get('Range'):
+        return False
+    if is_play_start(request.headers.get('Range')):
+        return False
+    try:
+        return limiter.storage.get(_open_stream_key(request.view_args.get('filename'))) > 0
+    except Exception:
+        return False
+
+# -------------------------------
+# Metrics (Prometheus, optional)
+# -------------------------------
+# Für mehrere vorgeforkte Worker PROMETHEUS_MULTIPROC_DIR auf ein leeres, gemeinsames
+# Verzeichnis setzen (vor dem Start leeren), dann aggregiert /metrics über alle Worker.
+METRICS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # Ohne NumPy liefert /api/up_next eine Zufallsauswahl
+
+# Binäre API-Formate, jeweils nur verfügbar, wenn die Bibliothek installiert ist
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, \
+        generate_latest, CONTENT_TYPE_LATEST, multiprocess
+    METRICS_AVAILABLE = True
+    if METRICS_MULTIPROC_DIR:
+        os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+except ImportError:
+    METRICS_AVAILABLE = False
+    print("prometheus_client not available, /metrics disabled")  # Debug output
+
+
+class _NoopMetric:
+    """Ersatz, wenn prometheus_client fehlt: alle Aufrufe laufen ins Leere."""
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, *args):
+        pass
+
+    def inc(self, *args):
+        pass
+
+    def set(self, *args):
+        pass
+
+
+if METRICS_AVAILABLE:
+    REQUEST_LATENCY = Histogram('playcard_request_seconds', 'Request latency per route',
+                                ['endpoint', 'method', 'status'])
+    FUNCTION_LATENCY = Histogram('playcard_function_seconds', 'Latency of hot-path functions', ['function'],
+                                 buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+    INDEX_ENTRIES = Gauge('playcard_index_entries', 'Number of entries in MEDIA_INDEX', multiprocess_mode='max')
+    INDEX_BUILD_SECONDS = Gauge('playcard_index_last_build_seconds', 'Duration of the last index build',
+                                multiprocess_mode='liveall')
+    INDEX_BUILD_TIMESTAMP = Gauge('playcard_index_last_build_timestamp_seconds', 'Unix time of the last index build',
+                                  multiprocess_mode='max')
+    RADIO_ERRORS = Counter('playcard_radio_upstream_errors_total', 'Errors fetching/parsing the radio feed', ['kind'])
+    CACHE_LOOKUPS = Counter('playcard_cache_lookups_total', 'Response cache lookups by tier that answered',
+                            ['namespace', 'tier'])
+    LOG_RECORDS_DROPPED = Counter('playcard_log_records_dropped_total', 'Log records not written', ['reason'])
+else:
+    REQUEST_LATENCY = FUNCTION_LATENCY = INDEX_ENTRIES = INDEX_BUILD_SECONDS = INDEX_BUILD_TIMESTAMP = \
+        RADIO_ERRORS = CACHE_LOOKUPS = LOG_RECORDS_DROPPED = _NoopMetric()
+
+
+def timed(name):
+    """Dekorator: misst die Laufzeit einer Hot-Path-Funktion in playcard_function_seconds."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                FUNCTION_LATENCY.labels(name).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+@app.before_request
+def _metrics_start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+@app.after_request
+def _metrics_observe_request(response):
+    start = g.get('metrics_start')
+    if start is not None:
+        REQUEST_LATENCY.labels(request.endpoint or 'unknown', request.method,
+                               response.status_code).observe(time.perf_counter() - start)
+    return response
+
+
+# -------------------------------
+# Logging (Queue + Writer-Thread)
+# -------------------------------
+LOG_SAMPLED = {'sampled': True}  # extra= für Meldungen, die bei jeder Anfrage anfallen
+LOG_LISTENER = None
+
+
+class SampledLogFilter(logging.Filter):
+    """
+    Lässt Meldungen mit extra=LOG_SAMPLED höchstens einmal pro Intervall und Aufrufstelle
+    durch; die nächste durchgelassene Meldung nennt die Zahl der unterdrückten.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.last = {}  # (Datei, Zeile) -> (Zeitpunkt, unterdrückt)
+        self.lock = Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            last, suppressed = self.last.get(key, (None, 0))
+            if last is not None and now - last < self.interval:
+                self.last[key] = (last, suppressed + 1)
+                LOG_RECORDS_DROPPED.labels('sampled').inc()
+                return False
+            self.last[key] = (now, 0)
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Legt Meldungen unformatiert in die Queue; formatiert wird erst im Writer-Thread.
+    Ist die Queue voll, wird die Meldung verworfen, statt den Request-Thread zu blockieren.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels('queue_full').inc()
+
+
+def start_log_listener():
+    """
+    Leitet app.logger über eine begrenzte Queue an einen Writer-Thread um, sodass langsame
+    Platten oder journald nur diesen Thread bremsen. Läuft nach jedem Fork im Kind erneut,
+    der Thread des Elternprozesses existiert dort nicht.
+    """
+    global LOG_LISTENER
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    writer = logging.StreamHandler()
+    writer.setFormatter(logging.Formatter(LOG_FORMAT))
+    LOG_LISTENER = QueueListener(log_queue, writer, respect_handler_level=True)
+    LOG_LISTENER.start()
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SampledLogFilter(LOG_SAMPLE_INTERVAL))
+    for old in list(app.logger.handlers):
+        app.logger.removeHandler(old)
+    app.logger.addHandler(handler)
+    app.logger.propagate = False
+    if LOG_LEVEL:
+        app.logger.setLevel(LOG_LEVEL)
+
+
+@atexit.register
+def stop_log_listener():
+    """Schreibt beim Beenden noch alle Meldungen aus der Queue."""
+    if LOG_LISTENER is not None and LOG_LISTENER._thread is not None:
+        try:
+            LOG_LISTENER.stop()
+        except queue.Full:
+            pass
+
+
+start_log_listener()
+# Jeder geforkte Worker (gunicorn, uWSGI mit oder ohne Preload) bekommt seinen eigenen Writer-Thread
+os.register_at_fork(after_in_child=start_log_listener)
+
+
+# -------------------------------
+# Profiling auf Anfrage (Stack-Sampling, collapsed stacks)
+# -------------------------------
+def is_admin_request(token=None):
+    """Prüft das Admin-Token aus Header, Query oder Argument (zeitkonstant)."""
+    if not PLAYCARD_ADMIN_TOKEN:
+        return False
+    token = token or request.headers.get('X-Playcard-Token') or request.args.get('token', '')
+    return hmac.compare_digest(token.encode('utf-8'), PLAYCARD_ADMIN_TOKEN.encode('utf-8'))
+
+
+class StackSampler:
+    """
+    Statistischer Profiler: tastet den Stack eines Threads in festen Abständen ab und
+    zählt die Stacks im "collapsed"-Format (flamegraph.pl, speedscope, inferno).
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.running = False
+        self.thread = None
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        name = getattr(code, 'co_qualname', code.co_name)
+        return f"{os.path.basename(code.co_filename)}:{name}".replace(';', ',').replace(' ', '_')
+
+    def _run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                stack = ';'.join(reversed(labels))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self._run, name="playcard-profiler", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return self.stacks
+
+
+def _should_profile():
+    if request.endpoint not in PROFILED_ENDPOINTS:
+        return False
+    token = request.headers.get('X-Playcard-Profile') or request.args.get('profile')
+    if token:
+        return is_admin_request(token)
+    return PROFILE_SAMPLE_PERCENT > 0 and random.random() * 100 < PROFILE_SAMPLE_PERCENT
+
+
+def _profile_url():
+    """Pfad und Query der Anfrage ohne profile= und token=, damit kein Admin-Token im Profil landet."""
+    args = [(key, value) for key, value in request.args.items(multi=True) if key not in ('profile', 'token')]
+    return f"{request.path}?{urllib.parse.urlencode(args)}" if args else request.path
+
+
+def _write_profile(stacks, samples, duration):
+    """Schreibt ein Profil (.folded) plus Metadaten (.json) und räumt alte Profile auf."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{int(time.time() * 1000)}-{os.getpid()}-{request.endpoint}"
+    with open(os.path.join(PROFILE_DIR, name + '.folded'), 'w') as f:
+        for stack, count in stacks.items():
+            f.write(f"{stack} {count}\n")
+    with open(os.path.join(PROFILE_DIR, name + '.json'), 'w') as f:
+        json.dump({
+            'name': name,
+            'endpoint': request.endpoint,
+            'url': _profile_url(),
+            'duration_ms': round(duration * 1000, 2),
+            'samples': samples,
+            'created': time.time(),
+        }, f)
+    profiles = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith('.json'))
+    for old in profiles[:-PROFILE_KEEP]:
+        for ext in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old[:-5] + ext))
+            except OSError:
+                pass
+
+
+@app.before_request
+def _profile_start():
+    if _should_profile():
+        g.profiler = StackSampler(threading_get_ident()).start()
+        g.profile_start = time.perf_counter()
+
+
+@app.after_request
+def _profile_stop(response):
+    profiler = g.pop('profiler', None)
+    if profiler:
+        duration = time.perf_counter() - g.profile_start
+        stacks = profiler.stop()
+        try:
+            _write_profile(stacks, profiler.samples, duration)
+        except OSError as e:
+            app.logger.error("Could not write profile: %s", e)
+    return response
+
+
+def list_profiles(limit=20):
+    """Die langsamsten der zuletzt gespeicherten Profile."""
+    try:
+        names = [n for n in os.listdir(PROFILE_DIR) if n.endswith('.json')]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for n in names:
+        try:
+            with open(os.path.join(PROFILE_DIR, n)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda p: -p.get('duration_ms', 0))
+    return profiles[:limit]
+
+
 playcardurl = PLAYCARD_ENDPOINT
 
 
@@ -155,7 +832,16 @@ def is_youtube_url(url_string):
 
 
 def run_once_global():
-    """Initialisiert den Media-Index genau einmal pro Serverstart"""
+    """
+    Initialisiert den Media-Index genau einmal pro Serverstart: der erste Worker scannt und
+    schreibt den Store, wer auf den Lock warten musste, übernimmt den Index aus dem Store.
+    """
+    if not INDEX_STORE_PATH:
+        # Ohne Store braucht jeder Prozess seinen eigenen Scan; parallel statt nacheinander
+        app.logger.info("Building media index...")
+        build_media_index(EXTENSIONS)
+        app.logger.info("Media index built with %s entries", len(MEDIA_INDEX))
+        return
     try:
         # Lockfile im .playcard directory des Benutzers
         lock_dir = os.path.join(os.path.expanduser('~'), '.playcard')
@@ -165,45 +851,142 @@ def run_once_global():
         
         with open(lockfile, 'w') as f:
             try:
-                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
-                
-                # Locale für Sortierung setzen
-                for loc in ['de_DE.UTF8', 'en_US.UTF-8', 'C.UTF-8', 'C']:
-                    try:
-                        locale.setlocale(locale.LC_ALL, loc)
-                        break
-                    except locale.Error:
-                        continue
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    waited = False
+                except BlockingIOError:
+                    # Jeder Prozess braucht seinen eigenen Index; wer warten musste, übernimmt
+                    # ihn aus dem gemeinsamen Speicher, den der erste Worker gerade geschrieben hat
+                    app.logger.debug("Lock already held, another process is indexing; waiting")
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    waited = True
                 
-                app.logger.info("Building media index...")
-                build_media_index(EXTENSIONS)
-                app.logger.info(f"Media index built with {len(MEDIA_INDEX)} entries")
+                if waited and load_index_from_store(min_built_at=PROCESS_START):
+                    app.logger.info("Media index loaded from %s with %s entries", INDEX_STORE_PATH, len(MEDIA_INDEX))
+                    schedule_background_analyses()
+                else:
+                    app.logger.info("Building media index...")
+                    build_media_index(EXTENSIONS)
+                    app.logger.info("Media index built with %s entries", len(MEDIA_INDEX))
                 
-            except BlockingIOError:
-                app.logger.debug("Lock already held, another process is initializing")
             except Exception as e:
-                app.logger.error(f"Error during initialization: {e}")
+                app.logger.error("Error during initialization: %s", e)
                 # Falls fehlgeschlagen, trotzdem versuchen Index zu bauen
                 try:
                     build_media_index(EXTENSIONS)
                 except Exception as e:
-                    app.logger.critical(f"Failed to build media index: {e}")
+                    app.logger.critical("Failed to build media index: %s", e)
     
     except PermissionError as e:
-        app.logger.error(f"Permission denied for lockfile: {e}")
+        app.logger.error("Permission denied for lockfile: %s", e)
         # Ohne Lock fortfahren
         build_media_index(EXTENSIONS)
     except Exception as e:
-        app.logger.error(f"Unexpected error in run_once_global: {e}")
+        app.logger.error("Unexpected error in run_once_global: %s", e)
         build_media_index(EXTENSIONS)
 
 
+def start_index_build():
+    """Baut den Index im Hintergrund (Standard) oder blockierend, wenn PLAYCARD_BACKGROUND_INDEX=0."""
+    if not INDEX_BUILD_IN_BACKGROUND:
+        run_once_global()
+        return None
+    thread = Thread(target=run_once_global, name="index-build", daemon=True)
+    thread.start()
+    return thread
+
+
+def preload_index():
+    """
+    Preload-Modus, im Master vor dem Fork (und beim koordinierten Reload): Index, sortierte
+    Ansichten und Cover-Map bauen, offene SQLite-Verbindungen schließen (dürfen nicht über
+    fork hinweg benutzt werden) und alles per gc.freeze() aus der zyklischen GC nehmen,
+    damit deren Durchläufe die geteilten Seiten in den Workern nicht kopieren.
+    """
+    gc.unfreeze()
+    build_media_index(EXTENSIONS, analyze=False)  # Analysen plant erst after_fork im Worker ein
+    generate_index(structured=True)
+    generate_index(structured=False)
+    for cache in PersistentCache.instances:
+        cache.close()
+    gc.collect()
+    gc.freeze()
+    app.logger.info("Preloaded media index with %s entries (%s objects frozen)", len(MEDIA_INDEX), gc.get_freeze_count())
+
+
+_ANALYSIS_ROLE_LOCK = None
+_ANALYSIS_ROLE_FILE = None
+_ANALYSIS_ROLE_MUTEX = Lock()
+
+
+def claim_analysis_role():
+    """
+    Genau ein Prozess pro Server (wer den Lock bekommt und bis zum Ende hält) startet ffmpeg;
+    alle anderen lesen die Ergebnisse nur aus dem PersistentCache. Stirbt der Analyse-Worker,
+    übernimmt der nächste, der hier nachfragt.
+    """
+    global _ANALYSIS_ROLE_LOCK, _ANALYSIS_ROLE_FILE
+    with _ANALYSIS_ROLE_MUTEX:
+        if _ANALYSIS_ROLE_LOCK is not None:
+            return True
+        if _ANALYSIS_ROLE_FILE is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _ANALYSIS_ROLE_FILE = open(os.path.join(CACHE_DIR, f'{PLAYCARD_ENDPOINT}-analysis.lock'), 'w')
+        try:
+            fcntl.flock(_ANALYSIS_ROLE_FILE, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        _ANALYSIS_ROLE_LOCK = _ANALYSIS_ROLE_FILE
+        return True
+
+
+def after_fork():
+    """
+    Im Worker direkt nach dem Fork aufrufen (uWSGI @postfork, gunicorn post_fork): lädt die
+    vorhandenen Analyse-Ergebnisse; der Worker mit der Analyse-Rolle plant die fehlenden ein.
+    """
+    schedule_background_analyses()
+
+
+def request_reload():
+    """
+    Koordinierter Reload. Im Preload-Modus baut der Master den Index neu und forkt frische
+    Worker (uWSGI: graceful reload, gunicorn: SIGHUP an den Master, der on_reload-Hook ruft
+    preload_index auf). Ohne Preload baut nur dieser Prozess seinen Index im Hintergrund neu.
+    """
+    if PRELOAD_MODE:
+        try:
+            import uwsgi
+            uwsgi.reload()
+            return 'uwsgi'
+        except ImportError:
+            pass
+        if 'gunicorn' in sys.modules:
+            os.kill(os.getppid(), signal.SIGHUP)
+            return 'gunicorn'
+    start_index_build()
+    return 'worker'
+
+
 # Then let's get the available files
-def build_media_index(extensions):
-    global MEDIA_INDEX
-    with INDEX_LOCK:
-        MEDIA_INDEX = []
+@timed('build_media_index')
+def build_media_index(extensions, analyze=True):
+    """
+    Durchsucht alle MEDIA_DIRS und tauscht den Index am Ende atomar aus. Beim ersten
+    Aufbau (noch kein Index vorhanden) werden Teilergebnisse alle INDEX_PUBLISH_INTERVAL
+    Sekunden veröffentlicht, damit der Server schon während des Scans etwas liefert.
+    Mit analyze werden danach die Hintergrund-Analysen für den neuen Index eingeplant.
+    """
+    global MEDIA_INDEX, MEDIA_TREE, MEDIA_BY_REL_PATH, COVER_MAP, INDEX_GENERATION
+    build_start = time.perf_counter()
+    progressive = not INDEX_STATUS['complete']
+    INDEX_STATUS.update(state='building', started=time.time(), entries=0, error=None)
+    entries = []
+    partial_tree, partial_by_rel_path = {'': _tree_node('')}, {}
+    partial_owned = {''}  # Knoten, die seit der letzten Veröffentlichung nur dem Scan gehören
+    last_publish = time.monotonic()
 
+    try:
         for media_root in MEDIA_DIRS:
             media_root_norm = os.path.normpath(media_root) # Normalisiere media_root einmal
             for root, _, files in os.walk(media_root_norm): # Walk from normalized path
@@ -213,7 +996,7 @@ def build_media_index(extensions):
                     # um Directory Traversal zu verhindern, falls os.walk aus irgendeinem Grund
                     # Pfade außerhalb des ursprünglichen media_root liefern sollte (unwahrscheinlich, aber sicher ist sicher)
                     if not full_path.startswith(media_root_norm):
-                        app.logger.warning(f"Skipping path outside media_root: {full_path} not in {media_root_norm}")
+                        app.logger.warning("Skipping path outside media_root: %s not in %s", full_path, media_root_norm)
                         continue
                     
                     if is_forbidden(full_path):
@@ -223,20 +1006,1367 @@ def build_media_index(extensions):
                         try:
                             relative_path = get_relative_path(full_path)
                             if not relative_path: # Ensure relative_path is not empty
-                                app.logger.warning(f"Empty relative path for {full_path}. Skipping.")
+                                app.logger.warning("Empty relative path for %s. Skipping.", full_path)
                                 continue
                             
                             safe_rel_path = relative_path
-                            MEDIA_INDEX.append({
-                                'path': full_path,  # Absoluter Pfad
-                                'name': safe_string(f), # Voller Dateiname
-                                'base': safe_string(base),
-                                'ext': ext[1:].lower(),  # ohne Punkt und kleingeschrieben
-                                'rel_path': safe_rel_path  # Relativer Pfad
-                            })
+                            entries.append(_index_entry(full_path, safe_rel_path))
                         except UnicodeEncodeError as e:
-                            app.logger.warning(f"Skipping file with encoding issue: {full_path} - {e}")
+                            app.logger.warning("Skipping file with encoding issue: %s - %s", full_path, e)
+                            continue
+                        except OSError as e:
+                            app.logger.warning("Skipping unreadable file: %s - %s", full_path, e)
                             continue
+                        if progressive:
+                            partial_by_rel_path[safe_rel_path] = entries[-1]
+                            if f".{entries[-1]['ext']}" in ALLOWED_EXTENSIONS:
+                                _tree_insert(partial_tree, entries[-1], owned=partial_owned)
+
+                INDEX_STATUS['entries'] = len(entries)
+                if progressive and time.monotonic() - last_publish >= INDEX_PUBLISH_INTERVAL:
+                    # Teilindex veröffentlichen; die eigene Generation verhindert, dass
+                    # gecachte Teilergebnisse den fertigen Index überdauern
+                    with INDEX_LOCK:
+                        MEDIA_INDEX = list(entries)
+                        MEDIA_TREE = partial_tree
+                        MEDIA_BY_REL_PATH = partial_by_rel_path
+                        COVER_MAP = None  # Cover-Suche fällt bis zum fertigen Index auf den Scan zurück
+                        INDEX_GENERATION = f"partial-{len(entries)}"
+                    # Weiter auf Kopien arbeiten, der veröffentlichte Stand bleibt unverändert
+                    partial_tree, partial_by_rel_path = dict(partial_tree), dict(partial_by_rel_path)
+                    partial_owned = set()
+                    INDEX_ENTRIES.set(len(entries))
+                    last_publish = time.monotonic()
+
+        if DEDUP_MEDIA_INDEX:
+            entries = deduplicate_media_entries(entries)
+        _install_index(entries, build_start)
+    except Exception as e:
+        INDEX_STATUS.update(state='failed', error=str(e), finished=time.time())
+        raise
+
+    try:
+        publish_index_store()
+    except (sqlite3.Error, OSError) as e:
+        app.logger.warning("Could not publish index store %s: %s", INDEX_STORE_PATH, e)
+    if analyze:
+        schedule_background_analyses()
+
+
+def _index_entry(full_path, rel_path):
+    """Index-Eintrag für eine Datei (beim Scan und beim Einfügen einzelner Dateien)."""
+    f = os.path.basename(full_path)
+    base, ext = os.path.splitext(f)
+    st = os.stat(full_path)
+    return {
+        'path': full_path,  # Absoluter Pfad
+        'name': safe_string(f), # Voller Dateiname
+        'base': safe_string(base),
+        'ext': ext[1:].lower(),  # ohne Punkt und kleingeschrieben
+        'rel_path': rel_path,  # Relativer Pfad
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'inode': f"{st.st_dev}:{st.st_ino}",
+        'sort_key': sort_key_locale(safe_string(f))  # Collation-Schlüssel (Bytes)
+    }
+
+
+def add_index_entry(entry):
+    """
+    Fügt einen einzelnen Eintrag ohne Rescan in den laufenden Index ein (Upload, Abgleich mit
+    anderen Workern): Liste, Pfad-Map, Baum und Cover-Map werden als Kopien fortgeschrieben
+    (vom Baum nur die Knoten auf dem Pfad) und unter INDEX_LOCK ausgetauscht, die Generation
+    neu berechnet. Leser ohne Lock behalten so ihren alten Stand. Gibt False zurück, wenn der
+    Pfad schon im Index ist.
+    """
+    global MEDIA_INDEX, MEDIA_TREE, MEDIA_BY_REL_PATH, COVER_MAP, INDEX_GENERATION
+    with INDEX_LOCK:
+        if entry['rel_path'] in MEDIA_BY_REL_PATH:
+            return False
+        entries = MEDIA_INDEX + [entry]
+        generation = index_fingerprint(entries)
+        by_rel_path = dict(MEDIA_BY_REL_PATH)
+        by_rel_path[entry['rel_path']] = entry
+        tree = MEDIA_TREE
+        if f".{entry['ext']}" in ALLOWED_EXTENSIONS:
+            tree = dict(MEDIA_TREE)
+            _tree_insert(tree, entry, keep_sorted=True, owned=set())
+        cover_map = COVER_MAP
+        if cover_map is not None and f".{entry['ext']}" in IMAGE_EXTENSIONS:
+            cover_map = cover_map.with_entry(entry)
+        MEDIA_INDEX = entries
+        MEDIA_TREE = tree
+        MEDIA_BY_REL_PATH = by_rel_path
+        COVER_MAP = cover_map
+        INDEX_GENERATION = generation
+    INDEX_STATUS['entries'] = len(entries)
+    INDEX_ENTRIES.set(len(entries))
+    schedule_entry_analyses(entry)
+    return True
+
+
+def _install_index(entries, build_start):
+    """Baut Baum, Pfad-Map, Cover-Map und Generation zu fertigen Einträgen und tauscht den Index atomar aus."""
+    global MEDIA_INDEX, MEDIA_TREE, MEDIA_BY_REL_PATH, MEDIA_ALTERNATES, COVER_MAP, INDEX_GENERATION
+    tree = build_media_tree(entries)
+    by_rel_path = {entry['rel_path']: entry for entry in entries}
+    alternates = {alternate: entry for entry in entries for alternate in entry.get('alternates', ())
+                  if alternate not in by_rel_path}
+    cover_map = CoverMap(entries)
+    generation = index_fingerprint(entries)
+
+    with INDEX_LOCK:
+        MEDIA_INDEX = entries
+        MEDIA_TREE = tree
+        MEDIA_BY_REL_PATH = by_rel_path
+        MEDIA_ALTERNATES = alternates
+        COVER_MAP = cover_map
+        INDEX_GENERATION = generation
+
+    duration = time.perf_counter() - build_start
+    INDEX_STATUS.update(state='ready', complete=True, entries=len(entries), finished=time.time(),
+                        duration=round(duration, 3), builds=INDEX_STATUS['builds'] + 1)
+    INDEX_ENTRIES.set(len(MEDIA_INDEX))
+    INDEX_BUILD_SECONDS.set(duration)
+    INDEX_BUILD_TIMESTAMP.set(time.time())
+    build_recommender()  # Merkmalsmatrix gleich mit dem Index bauen (im Preload-Modus also im Master)
+
+
+# -------------------------------
+# Cover-Map (Cover-Suche nach Namen ohne Scan über alle Bilder)
+# -------------------------------
+class CoverMap:
+    """
+    Vorberechnete Struktur für _find_cover_by_name_in_index mit identischem Ergebnis:
+    exakter Basename (100), Bild-Basename als Präfix des Tracks (95), Track als Präfix
+    des Bild-Basenamens (90); bei Gleichstand gewinnt das erste Bild in Index-Reihenfolge.
+    """
+    SEPARATORS = ("-", "_", " ")
+
+    def __init__(self, entries):
+        image_extensions_without_dots = {ext.lstrip('.') for ext in IMAGE_EXTENSIONS}
+        self.first_by_base = {}  # Basename -> (Position, Eintrag) des ersten Bildes
+        position = 0
+        for entry in entries:
+            if entry.get('ext') in image_extensions_without_dots:
+                self.first_by_base.setdefault(entry.get('base', ''), (position, entry))
+                position += 1
+        self.images = position
+        self.sorted_bases = sorted(self.first_by_base)
+
+    def with_entry(self, entry):
+        """Kopie mit einem neu eingefügten Bild (es steht am Ende der Index-Reihenfolge)."""
+        cover_map = CoverMap([])
+        cover_map.first_by_base = dict(self.first_by_base)
+        cover_map.sorted_bases = list(self.sorted_bases)
+        cover_map.images = self.images
+        if f".{entry.get('ext')}" in IMAGE_EXTENSIONS:
+            base = entry.get('base', '')
+            if base not in cover_map.first_by_base:
+                cover_map.first_by_base[base] = (cover_map.images, entry)
+                bisect.insort(cover_map.sorted_bases, base)
+            cover_map.images += 1
+        return cover_map
+
+    def find(self, track_basename):
+        exact = self.first_by_base.get(track_basename)
+        if exact:
+            return exact[1]
+        best = None
+        for i in range(len(track_basename)):
+            if track_basename[i:].lstrip().startswith(self.SEPARATORS):
+                hit = self.first_by_base.get(track_basename[:i])
+                if hit and (best is None or hit[0] < best[0]):
+                    best = hit
+        if best:
+            return best[1]
+        start = bisect.bisect_left(self.sorted_bases, track_basename)
+        for img_basename in self.sorted_bases[start:]:
+            if not img_basename.startswith(track_basename):
+                break
+            if len(img_basename) > len(track_basename) and \
+                    img_basename[len(track_basename):].lstrip().startswith(self.SEPARATORS):
+                hit = self.first_by_base[img_basename]
+                if best is None or hit[0] < best[0]:
+                    best = hit
+        return best[1] if best else None
+
+
+# -------------------------------
+# Ordnerbaum (für lazy Browsing über /api/tree)
+# -------------------------------
+def _tree_node(path):
+    return {
+        'name': path.rsplit('/', 1)[-1],
+        'path': path,
+        'folders': [],       # Relative Pfade der direkten Unterordner
+        'files': [],         # MEDIA_INDEX-Einträge direkt in diesem Ordner
+        'total_files': 0,    # Alle Dateien im Teilbaum
+        'total_size': 0,     # Summe der Dateigrößen im Teilbaum (Bytes)
+    }
+
+
+def _tree_insert(tree, entry, keep_sorted=False, owned=None):
+    """
+    Hängt einen Eintrag in den Baum ein und legt fehlende Ordner samt Aggregaten an.
+    Mit keep_sorted wird in die schon sortierten Listen eines fertigen Baums einsortiert.
+    Mit owned (Menge der Pfade, deren Knoten schon privat sind) ist tree die flache Kopie
+    eines veröffentlichten Baums: Knoten auf dem Pfad werden vor dem Ändern kopiert, Leser
+    des alten Baums sehen also nie halb eingefügte Einträge.
+    """
+    rel_dir = os.path.dirname(entry['rel_path']).replace('\\', '/')
+    parts = rel_dir.split('/') if rel_dir else []
+    node = None
+    for depth in range(len(parts) + 1):
+        path = '/'.join(parts[:depth])
+        if path not in tree:
+            tree[path] = _tree_node(path)
+            if owned is not None:
+                owned.add(path)
+            if node is not None and keep_sorted:
+                bisect.insort(node['folders'], path, key=lambda child: folder_sort_key(tree[child]['name']))
+            elif node is not None:
+                node['folders'].append(path)
+        elif owned is not None and path not in owned:
+            shared = tree[path]
+            tree[path] = dict(shared, folders=list(shared['folders']), files=list(shared['files']))
+            owned.add(path)
+        node = tree[path]
+        node['total_files'] += 1
+        node['total_size'] += entry.get('size', 0)
+    if keep_sorted:
+        bisect.insort(node['files'], entry, key=lambda file_entry: file_entry['sort_key'])
+    else:
+        node['files'].append(entry)
+
+
+def build_media_tree(entries):
+    """Baut den Ordnerbaum aus den abspielbaren Einträgen; Kinder werden einmal vorsortiert."""
+    allowed = [ext[1:] for ext in ALLOWED_EXTENSIONS]
+    tree = {'': _tree_node('')}
+    for entry in entries:
+        if entry['ext'] in allowed:
+            _tree_insert(tree, entry)
+    for node in tree.values():
+        node['folders'].sort(key=lambda path: folder_sort_key(tree[path]['name']))
+        node['files'].sort(key=lambda entry: entry['sort_key'])
+    return tree
+
+
+# -------------------------------
+# Gemeinsamer Index-Speicher (SQLite/FTS5, von playcard.php read-only gelesen)
+# -------------------------------
+INDEX_STORE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE entries (
+    id INTEGER PRIMARY KEY,        -- Position in MEDIA_INDEX
+    rel_path TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    base TEXT NOT NULL,
+    ext TEXT NOT NULL,             -- ohne Punkt, kleingeschrieben
+    dir TEXT NOT NULL,             -- relativer Ordner ('' = Wurzel)
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    inode TEXT NOT NULL,
+    sort_key BLOB NOT NULL,        -- nur gültig für meta.collator
+    sort_rank INTEGER NOT NULL,    -- globale Sortierposition, für PHP ohne eigene Collation
+    playable INTEGER NOT NULL,
+    is_image INTEGER NOT NULL,
+    cover_path TEXT,               -- bestes Cover im Ordner (find_cover_image), NULL = Standard
+    alternates TEXT                -- JSON-Liste der Duplikat-Pfade
+);
+CREATE INDEX entries_path ON entries (path);
+CREATE INDEX entries_dir ON entries (dir, sort_rank);
+CREATE INDEX entries_playable ON entries (playable, sort_rank);
+CREATE TABLE folders (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    parent TEXT,
+    sort_rank INTEGER NOT NULL,
+    total_files INTEGER NOT NULL,
+    total_size INTEGER NOT NULL
+);
+CREATE TABLE index_log (           -- nachträglich eingefügte Einträge (Uploads), als Generationskette
+    seq INTEGER PRIMARY KEY,
+    parent TEXT NOT NULL,          -- Generation vor dem Einfügen
+    generation TEXT NOT NULL,      -- Generation danach
+    rel_path TEXT NOT NULL
+);
+"""
+INDEX_STORE_ENTRY_COLUMNS = "path, name, base, ext, rel_path, size, mtime, inode, sort_key, alternates"
+
+
+def _read_index_store_meta(conn):
+    try:
+        return dict(conn.execute("SELECT key, value FROM meta"))
+    except sqlite3.Error:
+        return {}
+
+
+def _index_store_connect(read_only=True):
+    if read_only:
+        return sqlite3.connect(f"file:{urllib.parse.quote(INDEX_STORE_PATH)}?mode=ro", uri=True)
+    return sqlite3.connect(INDEX_STORE_PATH)
+
+
+def _create_index_store_fts(conn):
+    """Legt die Volltextsuche an: Trigram (Teilstrings wie die Python-Suche), sonst unicode61, sonst keine."""
+    for tokenizer in ('trigram', 'unicode61'):
+        try:
+            conn.execute("CREATE VIRTUAL TABLE entries_fts USING fts5(name, rel_path, content='entries', "
+                         f"content_rowid='id', tokenize='{tokenizer}')")
+        except sqlite3.OperationalError:
+            continue
+        conn.execute("INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')")
+        return tokenizer
+    return ''
+
+
+def _index_store_covers(entries):
+    """Cover je abspielbarem Eintrag wie find_cover_image, aber über die Bilder im Index statt os.listdir."""
+    images_by_dir = {}
+    for entry in entries:
+        if f".{entry['ext']}" in IMAGE_EXTENSIONS:
+            images_by_dir.setdefault(os.path.dirname(entry['path']), []).append(entry)
+    covers = {}
+    for entry in entries:
+        if f".{entry['ext']}" not in ALLOWED_EXTENSIONS:
+            continue
+        best_score, best_path = 0, None
+        for image in images_by_dir.get(os.path.dirname(entry['path']), ()):
+            score = _cover_score(entry['base'], image['base'])
+            if score > best_score:
+                best_score, best_path = score, image['path']
+        if best_path:
+            covers[entry['rel_path']] = best_path
+    return covers
+
+
+@timed('publish_index_store')
+def publish_index_store():
+    """
+    Schreibt den aktuellen Index in eine temporäre Datei und ersetzt INDEX_STORE_PATH atomar,
+    Leser (PHP, andere Worker) sehen also immer einen vollständigen Stand. Hat bereits ein
+    anderer Prozess dieselbe Generation veröffentlicht, wird nichts geschrieben.
+    """
+    if not INDEX_STORE_PATH:
+        return False
+    with INDEX_LOCK:
+        entries, tree, generation = MEDIA_INDEX, MEDIA_TREE, INDEX_GENERATION
+    if os.path.isfile(INDEX_STORE_PATH):
+        conn = _index_store_connect()
+        try:
+            meta = _read_index_store_meta(conn)
+        finally:
+            conn.close()
+        if meta.get('generation') == generation and meta.get('version') == str(INDEX_STORE_VERSION):
+            return False
+
+    allowed = {ext[1:] for ext in ALLOWED_EXTENSIONS}
+    images = {ext[1:] for ext in IMAGE_EXTENSIONS}
+    ranks = {id(entry): rank for rank, entry in enumerate(sorted(entries, key=lambda entry: entry['sort_key']))}
+    covers = _index_store_covers(entries)
+    folder_ranks = {path: rank for rank, path in enumerate(sorted(tree, key=folder_sort_key))}
+
+    os.makedirs(os.path.dirname(INDEX_STORE_PATH) or '.', exist_ok=True)
+    tmp_path = f"{INDEX_STORE_PATH}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(INDEX_STORE_SCHEMA)
+        conn.executemany(
+            "INSERT INTO entries (id, rel_path, path, name, base, ext, dir, size, mtime, inode, sort_key, "
+            "sort_rank, playable, is_image, cover_path, alternates) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((position, entry['rel_path'], entry['path'], entry['name'], entry['base'], entry['ext'],
+              os.path.dirname(entry['rel_path']), entry['size'], entry['mtime'], entry['inode'], entry['sort_key'],
+              ranks[id(entry)], entry['ext'] in allowed, entry['ext'] in images, covers.get(entry['rel_path']),
+              json.dumps(entry['alternates']) if entry.get('alternates') else None)
+             for position, entry in enumerate(entries)))
+        conn.executemany(
+            "INSERT INTO folders (path, name, parent, sort_rank, total_files, total_size) VALUES (?, ?, ?, ?, ?, ?)",
+            ((node['path'], node['name'], os.path.dirname(node['path']) if node['path'] else None,
+              folder_ranks[node['path']], node['total_files'], node['total_size'])
+             for node in tree.values()))
+        tokenizer = _create_index_store_fts(conn)
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ('version', str(INDEX_STORE_VERSION)),
+            ('generation', generation),
+            ('collator', COLLATOR_ID),
+            ('fts_tokenizer', tokenizer),
+            ('media_dirs', json.dumps(MEDIA_DIRS)),
+            ('entries', str(len(entries))),
+            ('built_at', repr(time.time())),
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, INDEX_STORE_PATH)
+    app.logger.info("Published index store %s (%s entries, fts: %s)", INDEX_STORE_PATH, len(entries), tokenizer or 'none')
+    return True
+
+
+def _entry_from_store_row(row, same_collation):
+    path, name, base, ext, rel_path, size, mtime, inode, sort_key, alternates = row
+    entry = {'path': path, 'name': name, 'base': base, 'ext': ext, 'rel_path': rel_path,
+             'size': size, 'mtime': mtime, 'inode': inode,
+             'sort_key': sort_key if same_collation else sort_key_locale(name)}
+    if alternates:
+        entry['alternates'] = json.loads(alternates)
+    return entry
+
+
+def load_index_from_store(min_built_at=0):
+    """
+    Übernimmt den Index aus INDEX_STORE_PATH, wenn er zu denselben MEDIA_DIRS gehört und nicht
+    vor min_built_at geschrieben wurde. Sortierschlüssel werden nur bei anderer Collation neu berechnet.
+    """
+    if not INDEX_STORE_PATH or not os.path.isfile(INDEX_STORE_PATH):
+        return False
+    build_start = time.perf_counter()
+    try:
+        conn = _index_store_connect()
+        try:
+            meta = _read_index_store_meta(conn)
+            if (meta.get('version') != str(INDEX_STORE_VERSION)
+                    or meta.get('media_dirs') != json.dumps(MEDIA_DIRS)
+                    or float(meta.get('built_at', 0)) < min_built_at):
+                return False
+            same_collation = meta.get('collator') == COLLATOR_ID
+            entries = [_entry_from_store_row(row, same_collation) for row in conn.execute(
+                f"SELECT {INDEX_STORE_ENTRY_COLUMNS} FROM entries ORDER BY id")]
+        finally:
+            conn.close()
+    except (sqlite3.Error, ValueError) as e:
+        app.logger.warning("Could not load index store %s: %s", INDEX_STORE_PATH, e)
+        return False
+    _install_index(entries, build_start)
+    return True
+
+
+def _apply_index_store_log(conn, same_collation):
+    """Übernimmt die Einträge, die andere Prozesse seit unserer Generation angehängt haben."""
+    applied = 0
+    while True:
+        with INDEX_LOCK:
+            generation = INDEX_GENERATION
+        row = conn.execute("SELECT e.path, e.name, e.base, e.ext, e.rel_path, e.size, e.mtime, e.inode, e.sort_key, "
+                           "e.alternates FROM index_log l JOIN entries e ON e.rel_path = l.rel_path "
+                           "WHERE l.parent = ? ORDER BY l.seq LIMIT 1", (generation,)).fetchone()
+        if row is None or not add_index_entry(_entry_from_store_row(row, same_collation)):
+            return applied
+        applied += 1
+
+
+_INDEX_STORE_SYNC = {'checked': 0.0, 'mtime': None}
+
+
+@app.before_request
+def sync_index_from_store():
+    """
+    Übernimmt höchstens alle INDEX_STORE_SYNC_INTERVAL Sekunden neue Einträge aus dem
+    gemeinsamen Speicher, damit ein Upload in einem Worker auch in den anderen sichtbar wird.
+    """
+    if not INDEX_STORE_PATH or not INDEX_STATUS['complete']:
+        return
+    now = time.monotonic()
+    if now - _INDEX_STORE_SYNC['checked'] < INDEX_STORE_SYNC_INTERVAL:
+        return
+    _INDEX_STORE_SYNC['checked'] = now
+    try:
+        mtime = os.stat(INDEX_STORE_PATH).st_mtime_ns
+    except OSError:
+        return
+    if mtime == _INDEX_STORE_SYNC['mtime']:
+        return
+    _INDEX_STORE_SYNC['mtime'] = mtime
+    try:
+        conn = _index_store_connect()
+        try:
+            meta = _read_index_store_meta(conn)
+            if meta.get('version') == str(INDEX_STORE_VERSION) and meta.get('generation') != INDEX_GENERATION:
+                applied = _apply_index_store_log(conn, meta.get('collator') == COLLATOR_ID)
+                if applied:
+                    app.logger.info("Took over %s new entries from the index store", applied)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        app.logger.debug("Index store sync failed: %s", e)
+
+
+def _append_to_index_store(conn, entry, parent, generation, fts=True):
+    """Schreibt einen eingefügten Eintrag samt Rang, Ordnern, Covern und FTS-Zeile fort."""
+    playable = f".{entry['ext']}" in ALLOWED_EXTENSIONS
+    is_image = f".{entry['ext']}" in IMAGE_EXTENSIONS
+    rel_dir = os.path.dirname(entry['rel_path'])
+    position = conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM entries").fetchone()[0]
+    # Neuer Eintrag steht hinter gleichen Schlüsseln, wie beim stabilen Sortieren
+    rank = conn.execute("SELECT COUNT(*) FROM entries WHERE sort_key <= ?", (entry['sort_key'],)).fetchone()[0]
+    conn.execute("UPDATE entries SET sort_rank = sort_rank + 1 WHERE sort_rank >= ?", (rank,))
+    conn.execute(
+        "INSERT INTO entries (id, rel_path, path, name, base, ext, dir, size, mtime, inode, sort_key, "
+        "sort_rank, playable, is_image, cover_path, alternates) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL)",
+        (position, entry['rel_path'], entry['path'], entry['name'], entry['base'], entry['ext'], rel_dir,
+         entry['size'], entry['mtime'], entry['inode'], entry['sort_key'], rank, playable, is_image))
+
+    if playable:
+        parts = rel_dir.split('/') if rel_dir else []
+        new_folder = False
+        for depth in range(len(parts) + 1):
+            path = '/'.join(parts[:depth])
+            updated = conn.execute("UPDATE folders SET total_files = total_files + 1, total_size = total_size + ? "
+                                   "WHERE path = ?", (entry['size'], path)).rowcount
+            if not updated:
+                conn.execute("INSERT INTO folders (path, name, parent, sort_rank, total_files, total_size) "
+                             "VALUES (?, ?, ?, 0, 1, ?)", (path, path.rsplit('/', 1)[-1],
+                                                           os.path.dirname(path) if path else None, entry['size']))
+                new_folder = True
+        if new_folder:
+            paths = sorted((row[0] for row in conn.execute("SELECT path FROM folders")), key=folder_sort_key)
+            conn.executemany("UPDATE folders SET sort_rank = ? WHERE path = ?", enumerate(paths))
+
+    if playable or is_image:
+        folder_entries = [{'path': path, 'base': base, 'ext': ext, 'rel_path': rel_path}
+                          for path, base, ext, rel_path in conn.execute(
+                              "SELECT path, base, ext, rel_path FROM entries WHERE dir = ? ORDER BY id", (rel_dir,))]
+        covers = _index_store_covers(folder_entries)
+        conn.executemany("UPDATE entries SET cover_path = ? WHERE rel_path = ?",
+                         [(covers.get(e['rel_path']), e['rel_path']) for e in folder_entries
+                          if f".{e['ext']}" in ALLOWED_EXTENSIONS])
+
+    if fts:
+        conn.execute("INSERT INTO entries_fts (rowid, name, rel_path) VALUES (?, ?, ?)",
+                     (position, entry['name'], entry['rel_path']))
+    conn.execute("INSERT INTO index_log (parent, generation, rel_path) VALUES (?, ?, ?)",
+                 (parent, generation, entry['rel_path']))
+    conn.executemany("UPDATE meta SET value = ? WHERE key = ?",
+                     [(generation, 'generation'), (str(position + 1), 'entries')])
+
+
+def insert_index_file(full_path):
+    """
+    Nimmt eine neue Datei ohne Rescan in den Index auf. Ist der gemeinsame Speicher aktiv, läuft
+    das unter dessen Schreibsperre: erst Einträge anderer Worker übernehmen, dann den eigenen
+    anhängen und protokollieren, so entsteht in allen Prozessen dieselbe Generationskette.
+    """
+    entry = _index_entry(full_path, get_relative_path(full_path))
+    if not INDEX_STORE_PATH or not os.path.isfile(INDEX_STORE_PATH):
+        add_index_entry(entry)
+        return entry
+    conn = _index_store_connect(read_only=False)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        meta = _read_index_store_meta(conn)
+        same_collation = meta.get('collator') == COLLATOR_ID
+        if meta.get('version') == str(INDEX_STORE_VERSION):
+            _apply_index_store_log(conn, same_collation)
+        with INDEX_LOCK:
+            parent = INDEX_GENERATION
+        if not add_index_entry(entry):
+            conn.rollback()
+            return MEDIA_BY_REL_PATH.get(entry['rel_path'], entry)
+        if meta.get('version') == str(INDEX_STORE_VERSION) and meta.get('generation') == parent and same_collation:
+            _append_to_index_store(conn, entry, parent, INDEX_GENERATION, fts=bool(meta.get('fts_tokenizer')))
+            conn.commit()
+        else:
+            # Speicher gehört zu einem anderen Stand; der nächste vollständige Aufbau schreibt ihn neu
+            app.logger.warning("Index store %s is not at our generation, %s added locally only", INDEX_STORE_PATH, entry['rel_path'])
+            conn.rollback()
+    finally:
+        conn.close()
+    return entry
+
+
+# -------------------------------
+# Persistente Caches (pro Datei, gültig solange sich die Datei nicht ändert)
+# -------------------------------
+class PersistentCache:
+    """
+    Kleiner Key-Value-Cache in ~/.playcard/<name>.sqlite. Jeder Wert trägt einen
+    Stempel (z.B. "mtime:size"); passt der Stempel nicht mehr, gilt der Eintrag als veraltet.
+    Werte werden als JSON gespeichert. Mehrere Prozesse dürfen gleichzeitig zugreifen (WAL).
+    """
+
+    instances = []
+
+    def __init__(self, name):
+        self.path = os.path.join(CACHE_DIR, f"{name}.sqlite")
+        self.lock = Lock()
+        self.conn = None
+        PersistentCache.instances.append(self)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _connection(self):
+        if self.conn is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, stamp TEXT NOT NULL, value TEXT)")
+        return self.conn
+
+    @staticmethod
+    def file_stamp(entry_or_path):
+        """Stempel aus mtime und Größe, wahlweise aus einem Index-Eintrag oder einem Pfad."""
+        if isinstance(entry_or_path, dict) and 'mtime' in entry_or_path:
+            return f"{entry_or_path['mtime']}:{entry_or_path['size']}"
+        st = os.stat(entry_or_path['path'] if isinstance(entry_or_path, dict) else entry_or_path)
+        return f"{st.st_mtime}:{st.st_size}"
+
+    def get(self, key, stamp):
+        with self.lock:
+            row = self._connection().execute("SELECT stamp, value FROM cache WHERE key = ?", (key,)).fetchone()
+        if row and row[0] == stamp:
+            return json.loads(row[1])
+        return None
+
+    def get_field_many(self, keys_and_stamps, field):
+        """Wie get_many, liefert aber nur ein Feld der Werte, ohne die ganzen Werte zu laden."""
+        found = {}
+        keys = list(keys_and_stamps)
+        with self.lock:
+            conn = self._connection()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = conn.execute(f"SELECT key, stamp, json_extract(value, ?) FROM cache "
+                                    f"WHERE key IN ({','.join('?' * len(chunk))})", [f'$.{field}', *chunk])
+                for key, stamp, value in rows:
+                    if keys_and_stamps[key] == stamp and value is not None:
+                        found[key] = value
+        return found
+
+    def get_many(self, keys_and_stamps):
+        """{key: stamp} -> {key: value} für alle gültigen Treffer."""
+        found = {}
+        keys = list(keys_and_stamps)
+        with self.lock:
+            conn = self._connection()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = conn.execute(f"SELECT key, stamp, value FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+                for key, stamp, value in rows:
+                    if keys_and_stamps[key] == stamp:
+                        found[key] = json.loads(value)
+        return found
+
+    def set(self, key, stamp, value):
+        self.set_many([(key, stamp, value)])
+
+    def set_many(self, items):
+        with self.lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO cache (key, stamp, value) VALUES (?, ?, ?)",
+                                 [(key, stamp, json.dumps(value)) for key, stamp, value in items])
+
+
+# -------------------------------
+# Antwort-Cache (In-Process-LRU + optional memcached)
+# -------------------------------
+def index_fingerprint(entries):
+    """Fingerabdruck über Pfade, Größen und mtimes: gleicher Inhalt ergibt in jedem Worker dieselbe Generation."""
+    h = hashlib.blake2b(digest_size=8)
+    for entry in entries:
+        h.update(f"{entry['rel_path']}\0{entry.get('size')}\0{entry.get('mtime')}\n".encode('utf-8', 'surrogatepass'))
+    return h.hexdigest()
+
+
+class TieredCache:
+    """
+    Zweistufiger Cache: ein LRU pro Worker vor einem optionalen, zwischen allen Workern
+    geteilten Backend (memcached oder ein Stub mit get(key) / set(key, value, expire=...)).
+    Werte müssen JSON-serialisierbar sein, get_many/set_many nutzt das Backend, wenn es sie hat
+    (pymemcache), damit eine Liste nur einen Roundtrip kostet. Index-abhängige Schlüssel enthalten die
+    INDEX_GENERATION, nach einem neuen Index sind alte Einträge damit einfach unerreichbar.
+    Fällt das Backend aus, arbeitet der Cache bis zum nächsten Versuch nur im Speicher.
+    """
+    _MISS = object()
+
+    def __init__(self, backend=None, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.backend = backend
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = Lock()
+        self.local = OrderedDict()  # Schlüssel -> (Ablaufzeit, Wert)
+        self.backend_down_until = 0
+
+    @staticmethod
+    def make_key(namespace, key, per_index=True):
+        digest = hashlib.blake2b(json.dumps(key, sort_keys=True, default=str).encode('utf-8'), digest_size=16).hexdigest()
+        generation = INDEX_GENERATION if per_index else 'static'
+        return f"playcard:{PLAYCARD_ENDPOINT}:{namespace}:{generation}:{digest}"
+
+    def _backend_call(self, method, *args, **kwargs):
+        if self.backend is None or time.monotonic() < self.backend_down_until:
+            return None
+        try:
+            return getattr(self.backend, method)(*args, **kwargs)
+        except Exception as e:
+            app.logger.warning("Shared cache unavailable, using in-process cache only for %ss: %s", RESPONSE_CACHE_RETRY, e)
+            self.backend_down_until = time.monotonic() + RESPONSE_CACHE_RETRY
+            return None
+
+    def _store_local(self, full_key, value, ttl):
+        with self.lock:
+            self.local[full_key] = (time.monotonic() + ttl, value)
+            self.local.move_to_end(full_key)
+            while len(self.local) > self.maxsize:
+                self.local.popitem(last=False)
+
+    def set(self, namespace, key, value, ttl=None, per_index=True):
+        ttl = ttl or self.ttl
+        full_key = self.make_key(namespace, key, per_index)
+        self._store_local(full_key, value, ttl)
+        self._backend_call('set', full_key, json.dumps(value).encode('utf-8'), expire=ttl)
+
+    def get(self, namespace, key, compute, ttl=None, per_index=True):
+        """Wert aus dem LRU, sonst aus dem Backend, sonst compute() ausführen und in beiden Stufen ablegen."""
+        ttl = ttl or self.ttl
+        full_key = self.make_key(namespace, key, per_index)
+        with self.lock:
+            hit = self.local.get(full_key)
+            if hit and hit[0] > time.monotonic():
+                self.local.move_to_end(full_key)
+                CACHE_LOOKUPS.labels(namespace, 'local').inc()
+                return hit[1]
+
+        raw = self._backend_call('get', full_key)
+        if raw is not None:
+            value = json.loads(raw)
+            CACHE_LOOKUPS.labels(namespace, 'shared').inc()
+        else:
+            value = compute()
+            CACHE_LOOKUPS.labels(namespace, 'miss').inc()
+            self._backend_call('set', full_key, json.dumps(value).encode('utf-8'), expire=ttl)
+        self._store_local(full_key, value, ttl)
+        return value
+
+    def get_many(self, namespace, keys, compute, ttl=None, per_index=True):
+        """
+        Wie get() für eine Liste von Schlüsseln mit einem Backend-Roundtrip für alle, die nicht
+        im LRU liegen. compute(i) berechnet den Wert für keys[i]; Ergebnis in derselben Reihenfolge.
+        """
+        ttl = ttl or self.ttl
+        full_keys = [self.make_key(namespace, key, per_index) for key in keys]
+        values = [self._MISS] * len(keys)
+        now = time.monotonic()
+        with self.lock:
+            for i, full_key in enumerate(full_keys):
+                hit = self.local.get(full_key)
+                if hit and hit[0] > now:
+                    self.local.move_to_end(full_key)
+                    values[i] = hit[1]
+        CACHE_LOOKUPS.labels(namespace, 'local').inc(sum(value is not self._MISS for value in values))
+
+        missing = [i for i, value in enumerate(values) if value is self._MISS]
+        if not missing:
+            return values
+        if hasattr(self.backend, 'get_many'):
+            raw = self._backend_call('get_many', [full_keys[i] for i in missing]) or {}
+        else:
+            raw = {full_keys[i]: self._backend_call('get', full_keys[i]) for i in missing}
+        computed = {}
+        for i in missing:
+            if raw.get(full_keys[i]) is not None:
+                values[i] = json.loads(raw[full_keys[i]])
+                CACHE_LOOKUPS.labels(namespace, 'shared').inc()
+            else:
+                values[i] = compute(i)
+                computed[full_keys[i]] = json.dumps(values[i]).encode('utf-8')
+                CACHE_LOOKUPS.labels(namespace, 'miss').inc()
+            self._store_local(full_keys[i], values[i], ttl)
+        if computed and hasattr(self.backend, 'set_many'):
+            self._backend_call('set_many', computed, expire=ttl)
+        else:
+            for full_key, raw_value in computed.items():
+                self._backend_call('set', full_key, raw_value, expire=ttl)
+        return values
+
+    def clear_local(self):
+        with self.lock:
+            self.local.clear()
+
+
+def _memcached_backend():
+    """pymemcache-Client für MEMCACHED_SERVER oder None (dann nur In-Process-Cache)."""
+    if not MEMCACHED_SERVER:
+        return None
+    try:
+        from pymemcache.client.base import PooledClient
+    except ImportError:
+        return None
+    return PooledClient(MEMCACHED_SERVER, connect_timeout=0.2, timeout=0.2, no_delay=True)
+
+
+RESPONSE_CACHE = TieredCache(_memcached_backend())
+
+
+# -------------------------------
+# Deduplizierung über alle MEDIA_DIRS
+# -------------------------------
+HASH_CACHE = PersistentCache('hashes')
+
+
+def _partial_file_hash(path):
+    """Schneller Vorab-Hash: Größe + Anfang + Ende der Datei."""
+    try:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            h.update(str(size).encode())
+            h.update(f.read(DEDUP_PARTIAL_HASH_BYTES))
+            if size > 2 * DEDUP_PARTIAL_HASH_BYTES:
+                f.seek(-DEDUP_PARTIAL_HASH_BYTES, os.SEEK_END)
+                h.update(f.read(DEDUP_PARTIAL_HASH_BYTES))
+        return h.hexdigest()
+    except OSError:
+        return None
+
+
+def _full_file_hash(path):
+    try:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(block)
+        return h.hexdigest()
+    except OSError:
+        return None
+
+
+def _hash_entries(entries, kind):
+    """
+    Hasht die Dateien der Einträge (kind = 'partial' oder 'full'), gecacht pro (inode, mtime).
+    Cache-Misses laufen in einem Thread-Pool, damit das Hashen großer Dateien parallel läuft
+    (kein fork aus dem Index-Thread, während Log- und Analyse-Threads Locks halten könnten).
+    """
+    stamps = {entry['inode']: PersistentCache.file_stamp(entry) for entry in entries}
+    cached = HASH_CACHE.get_many(stamps)
+    result = {}
+    missing = []
+    for entry in entries:
+        value = cached.get(entry['inode']) or {}
+        if kind in value:
+            result[entry['inode']] = value[kind]
+        else:
+            missing.append(entry)
+
+    if missing:
+        func = _partial_file_hash if kind == 'partial' else _full_file_hash
+        paths = [entry['path'] for entry in missing]
+        if len(missing) > 8 and DEDUP_HASH_WORKERS > 1:
+            with ThreadPoolExecutor(DEDUP_HASH_WORKERS, thread_name_prefix="playcard-hash") as pool:
+                hashes = list(pool.map(func, paths))
+        else:
+            hashes = [func(path) for path in paths]
+        updates = []
+        for entry, digest in zip(missing, hashes):
+            if digest is None:
+                continue
+            result[entry['inode']] = digest
+            value = dict(cached.get(entry['inode']) or {}, **{kind: digest})
+            cached[entry['inode']] = value
+            updates.append((entry['inode'], stamps[entry['inode']], value))
+        HASH_CACHE.set_many(updates)
+    return result
+
+
+def deduplicate_media_entries(entries):
+    """
+    Fasst identische Aufnahmen zu einem kanonischen Eintrag zusammen:
+    gleicher Inode (überlappende MEDIA_DIRS) oder gleicher Inhalt (Größe -> Teil-Hash -> voller Hash)
+    in verschiedenen MEDIA_DIRS. Gleiche Dateien innerhalb eines MEDIA_DIRS (z.B. ein Album und
+    eine Zusammenstellung daraus) bleiben getrennt. Der kanonische Eintrag (erstes MEDIA_DIR, dann
+    kürzester Pfad) bekommt 'alternates'. Bilder werden nicht dedupliziert, da die Cover-Suche
+    pro Ordner arbeitet.
+    """
+    start = time.perf_counter()
+    image_exts = {ext.lstrip('.') for ext in IMAGE_EXTENSIONS}
+    media = [e for e in entries if e['ext'] not in image_exts and 'inode' in e]
+
+    roots = [os.path.join(os.path.normpath(root), '') for root in MEDIA_DIRS]  # Mit Trenner am Ende
+
+    def root_rank(entry):
+        return next((i for i, root in enumerate(roots) if entry['path'].startswith(root)), len(roots))
+
+    def across_roots(group):
+        return len({root_rank(entry) for entry in group}) > 1
+
+    # 1. Gleicher Inode: dieselbe Datei über zwei MEDIA_DIRS gesehen
+    by_inode = {}
+    for entry in media:
+        by_inode.setdefault(entry['inode'], []).append(entry)
+    # 2. Gleiche Größe -> Kandidaten für Inhaltsvergleich
+    by_size = {}
+    for group in by_inode.values():
+        by_size.setdefault(group[0]['size'], []).append(group[0])
+    # Nur Gruppen, die mehrere MEDIA_DIRS berühren, werden überhaupt gehasht
+    candidates = [e for group in by_size.values() if len(group) > 1 and across_roots(group)
+                  for e in group if e['size'] > 0]
+
+    partial = _hash_entries(candidates, 'partial') if candidates else {}
+    by_partial = {}
+    for entry in candidates:
+        if entry['inode'] in partial:
+            by_partial.setdefault(partial[entry['inode']], []).append(entry)
+    full_candidates = [e for group in by_partial.values() if len(group) > 1 and across_roots(group) for e in group]
+    full = _hash_entries(full_candidates, 'full') if full_candidates else {}
+
+    # Union: inode -> Gruppen-Schlüssel
+    group_of = {inode: inode for inode in by_inode}
+    for entry in full_candidates:
+        if entry['inode'] in full:
+            group_of[entry['inode']] = 'content:' + full[entry['inode']]
+    groups = {}
+    for entry in media:
+        groups.setdefault(group_of[entry['inode']], []).append(entry)
+
+    def canonical_rank(entry):
+        return (root_rank(entry), len(entry['rel_path']), entry['rel_path'])
+
+    dropped = set()
+    for key, group in groups.items():
+        if len(group) < 2:
+            continue
+        group.sort(key=canonical_rank)
+        canonical = group[0]
+        alternates = []
+        for other in group[1:]:
+            if key.startswith('content:') and other['inode'] != canonical['inode'] \
+                    and root_rank(other) == root_rank(canonical):
+                continue  # Inhaltsgleiche Kopie im selben MEDIA_DIR bleibt ein eigener Eintrag
+            dropped.add(id(other))
+            if other['rel_path'] != canonical['rel_path'] and other['rel_path'] not in alternates:
+                alternates.append(other['rel_path'])
+        if alternates:
+            canonical['alternates'] = alternates
+
+    if dropped:
+        app.logger.info("Deduplicated media index: %s duplicate entries collapsed in %.2fs",
+                        len(dropped), time.perf_counter() - start)
+    return [e for e in entries if id(e) not in dropped]
+
+
+# -------------------------------
+# Hintergrund-Analysen (ffmpeg, begrenzter Pool, niedrige Priorität)
+# -------------------------------
+def ffmpeg_command(args):
+    """ffmpeg-Aufruf mit niedrigster Priorität und nur einem Thread."""
+    cmd = [FFMPEG_BIN, '-hide_banner', '-nostdin', '-threads', '1'] + args
+    if NICE_BIN:
+        cmd = [NICE_BIN, '-n', str(ANALYSIS_NICE)] + cmd
+    return cmd
+
+
+def run_ffmpeg(args, timeout=ANALYSIS_TIMEOUT, **kwargs):
+    return subprocess.run(ffmpeg_command(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, **kwargs)
+
+
+class BackgroundAnalyzer:
+    """
+    Führt eine teure Analyse pro Datei im Hintergrund aus und hält die Ergebnisse
+    im PersistentCache (gestempelt mit mtime:size) sowie im Speicher vor.
+
+    get() blockiert nie: Liegt kein gültiges Ergebnis im Speicher, wird die Analyse
+    eingeplant und None zurückgegeben. peek() liest nur den Speicher und plant nichts ein,
+    für Listen im Request; eingeplant wird dort schon beim Indexaufbau (preload) und beim
+    Einfügen (schedule_entry). Der SQLite-Cache wird nur in Hintergrund-Threads gelesen, nie
+    im Request. Analysiert wird nur im Prozess mit der Analyse-Rolle (claim_analysis_role);
+    alle anderen schauen alle ANALYSIS_RECHECK Sekunden gesammelt im Cache nach, ob die
+    fehlenden Ergebnisse inzwischen vorliegen.
+    """
+
+    def __init__(self, name, analyze, workers=ANALYSIS_WORKERS, valid=None):
+        self.name = name
+        self.analyze = analyze
+        self.valid = valid  # Optional: prüft ein Cache-Ergebnis (z.B. ob erzeugte Dateien noch da sind)
+        self.on_update = None  # Optional: wird nach neuen Ergebnissen aufgerufen
+        self.cache = PersistentCache(name)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"analysis-{name}")
+        self.results = {}  # path -> (stamp, value)
+        self.pending = set()
+        self.checked = {}  # path -> letzter Cache-Blick (monotonic), nur ohne Analyse-Rolle
+        self.waiting = {}  # path -> stamp, ohne Analyse-Rolle: fehlt noch im Cache
+        self.refresher = None
+        self.lock = Lock()
+
+    def lookup(self, entry):
+        """Gibt (state, value) zurück, state ist 'ready', 'pending' oder 'failed'."""
+        path = entry['path']
+        try:
+            stamp = PersistentCache.file_stamp(entry)
+        except OSError:
+            return 'failed', None
+        hit = self.results.get(path)
+        if hit and hit[0] == stamp:
+            return ('failed', None) if hit[1].get('failed') else ('ready', hit[1])
+        self.schedule(path, stamp)
+        return 'pending', None
+
+    def get(self, entry):
+        return self.lookup(entry)[1]
+
+    def peek(self, entry):
+        """Gültiges Ergebnis aus dem Speicher oder None; kein Stat, nichts wird eingeplant."""
+        hit = self.results.get(entry['path'])
+        if hit and hit[0] == PersistentCache.file_stamp(entry) and not hit[1].get('failed'):
+            return hit[1]
+        return None
+
+    def schedule_entry(self, entry):
+        """Plant einen neuen Index-Eintrag ein; ohne Analyse-Rolle nur für die Cache-Nachschau."""
+        try:
+            stamp = PersistentCache.file_stamp(entry)
+        except OSError:
+            return
+        if _ANALYSIS_ROLE_LOCK is not None:
+            self.schedule(entry['path'], stamp)
+            return
+        with self.lock:
+            self.waiting[entry['path']] = stamp
+        self._start_refresher()
+
+    def _start_refresher(self):
+        with self.lock:
+            if self.refresher is not None or not self.waiting:
+                return
+            self.refresher = Thread(target=self._refresh_loop, name=f"analysis-refresh-{self.name}", daemon=True)
+        self.refresher.start()
+
+    def _refresh_loop(self):
+        """Ohne Analyse-Rolle: fehlende Ergebnisse gesammelt aus dem Cache nachladen."""
+        while True:
+            time.sleep(ANALYSIS_RECHECK)
+            with self.lock:
+                waiting = dict(self.waiting)
+            try:
+                cached = self.cache.get_many(waiting)
+            except sqlite3.Error as e:
+                app.logger.warning("%s cache refresh failed: %s", self.name, e)
+                cached = {}
+            found = False
+            for path, value in cached.items():
+                if self.valid and not value.get('failed') and not self.valid(value):
+                    continue
+                self.results[path] = (waiting[path], value)
+                found = found or not value.get('failed')
+                with self.lock:
+                    if self.waiting.get(path) == waiting[path]:
+                        del self.waiting[path]
+            if found and self.on_update:
+                self.on_update()
+            with self.lock:
+                if not self.waiting:
+                    self.refresher = None
+                    return
+            # Analyse-Worker weg? Dann übernimmt dieser Prozess und plant alles selbst ein
+            if claim_analysis_role():
+                with self.lock:
+                    self.refresher = None
+                schedule_background_analyses()
+                return
+
+    def invalidate(self, entry):
+        """Verwirft ein Ergebnis, das nicht mehr stimmt (z.B. fehlende Dateien), und plant es neu ein."""
+        self.results.pop(entry['path'], None)
+        with self.lock:
+            self.checked.pop(entry['path'], None)
+        return self.lookup(entry)
+
+    def schedule(self, path, stamp):
+        analyze = _ANALYSIS_ROLE_LOCK is not None
+        with self.lock:
+            if path in self.pending:
+                return
+            if not analyze:
+                now = time.monotonic()
+                if now - self.checked.get(path, -math.inf) < ANALYSIS_RECHECK:
+                    return
+                self.checked[path] = now
+            self.pending.add(path)
+        self.executor.submit(self._run, path, stamp, analyze)
+
+    def _run(self, path, stamp, analyze=True):
+        try:
+            value = self.cache.get(path, stamp)
+            if value is not None and self.valid and not value.get('failed') and not self.valid(value):
+                value = None
+            if value is None and not analyze:
+                # Kein Analyse-Worker: nur nachschauen, ob die Rolle frei geworden ist
+                if claim_analysis_role():
+                    schedule_background_analyses()
+                return
+            if value is None:
+                try:
+                    value = self.analyze(path)
+                except (OSError, subprocess.SubprocessError, ValueError) as e:
+                    app.logger.warning("%s analysis failed for %s: %s", self.name, path, e)
+                    value = None
+                # Auch Fehlschläge merken, damit kaputte Dateien nicht ständig neu analysiert werden
+                value = value if value is not None else {'failed': True}
+                self.cache.set(path, stamp, value)
+            self.results[path] = (stamp, value)
+            if self.on_update and not value.get('failed'):
+                self.on_update()
+        except Exception as e:
+            app.logger.error("%s analysis error for %s: %s", self.name, path, e)
+        finally:
+            with self.lock:
+                self.pending.discard(path)
+
+    def preload(self, entries):
+        """Lädt vorhandene Ergebnisse in den Speicher und plant alle fehlenden Analysen ein."""
+        stamps = {}
+        for entry in entries:
+            try:
+                stamps[entry['path']] = PersistentCache.file_stamp(entry)
+            except OSError:
+                continue
+        cached = self.cache.get_many(stamps)
+        for path, value in cached.items():
+            self.results[path] = (stamps[path], value)
+        if self.on_update and cached:
+            self.on_update()
+        missing = [path for path in stamps if path not in cached]
+        if _ANALYSIS_ROLE_LOCK is None:
+            with self.lock:
+                self.waiting.update((path, stamps[path]) for path in missing)
+            self._start_refresher()
+            app.logger.info("%s: %s cached results, %s files left to the analysis worker",
+                            self.name, len(cached), len(missing))
+            return
+        for path in missing:
+            self.schedule(path, stamps[path])
+        app.logger.info("%s: %s cached results, %s files queued for analysis", self.name, len(cached), len(missing))
+
+
+def analyze_loudness(path):
+    """Integrierte Lautheit (EBU R128) und True Peak einer Datei via ffmpeg ebur128."""
+    result = run_ffmpeg(['-nostats', '-i', path, '-map', '0:a:0', '-af', 'ebur128=peak=true', '-f', 'null', '-'])
+    output = result.stderr.decode('utf-8', 'replace')
+    summary = output[output.rfind('Summary:'):]
+    lufs = re.search(r'I:\s+(-?[\d.]+|-inf) LUFS', summary)
+    peak = re.search(r'Peak:\s+(-?[\d.]+|-inf) dBFS', summary)
+    if result.returncode != 0 or not lufs or lufs.group(1) == '-inf':
+        return None
+    return {
+        'lufs': float(lufs.group(1)),
+        'peak_dbfs': float(peak.group(1)) if peak and peak.group(1) != '-inf' else None,
+    }
+
+
+LOUDNESS_ANALYZER = BackgroundAnalyzer('loudness', analyze_loudness)
+
+
+def analyze_peaks(path):
+    """
+    Dekodiert die Datei streamend (mono, PEAKS_SAMPLE_RATE) und speichert pro Block von
+    PEAKS_BLOCK_SAMPLES Samples den Spitzenwert als ein Byte (0-255).
+    """
+    proc = subprocess.Popen(ffmpeg_command(['-loglevel', 'error', '-i', path, '-map', '0:a:0', '-ac', '1',
+                                            '-ar', str(PEAKS_SAMPLE_RATE), '-f', 's16le', '-']),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    peaks = bytearray()
+    samples = 0
+    block_bytes = PEAKS_BLOCK_SAMPLES * 2
+    try:
+        pending = b''
+        for chunk in iter(lambda: proc.stdout.read(block_bytes * 64), b''):
+            pending += chunk
+            usable = len(pending) - len(pending) % block_bytes
+            for offset in range(0, usable, block_bytes):
+                block = array('h', pending[offset:offset + block_bytes])
+                peaks.append(min(255, max(max(block), -min(block)) * 255 // 32767))
+            samples += usable // 2
+            pending = pending[usable:]
+        if len(pending) >= 2:
+            block = array('h', pending[:len(pending) - len(pending) % 2])
+            peaks.append(min(255, max(max(block), -min(block)) * 255 // 32767))
+            samples += len(block)
+        proc.wait(timeout=ANALYSIS_TIMEOUT)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+    if proc.returncode != 0 or not peaks:
+        return None
+    return {
+        'duration': round(samples / PEAKS_SAMPLE_RATE, 3),
+        'peaks': base64.b64encode(bytes(peaks)).decode('ascii'),
+    }
+
+
+PEAKS_ANALYZER = BackgroundAnalyzer('peaks', analyze_peaks)
+
+
+def _probe_video(path):
+    """Laufzeit (Sekunden) und Bildgröße des ersten Videostreams aus der ffmpeg-Ausgabe."""
+    output = run_ffmpeg(['-i', path], timeout=60).stderr.decode('utf-8', 'replace')
+    duration = re.search(r'Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)', output)
+    size = re.search(r'Stream #\S+.*?: Video: .*?(\d{2,5})x(\d{2,5})', output)
+    if not duration or not size:
+        return None
+    hours, minutes, seconds = duration.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds), int(size.group(1)), int(size.group(2))
+
+
+def analyze_video_thumbnails(path):
+    """
+    Posterframe (JPEG, POSTER_WIDTH breit) und Sprite-Sheet (bis zu SPRITE_MAX_TILES Kacheln in
+    SPRITE_COLUMNS Spalten) eines Videos. Die Bilder liegen in THUMBNAIL_DIR, ihr Name enthält
+    mtime und Größe; ältere Bilder derselben Datei werden dabei entfernt.
+    """
+    probe = _probe_video(path)
+    if probe is None:
+        return None
+    duration, width, height = probe
+    st = os.stat(path)
+    prefix = hashlib.sha1(path.encode('utf-8', 'surrogatepass')).hexdigest()[:16]
+    stamp = hashlib.sha1(f"{st.st_mtime}:{st.st_size}".encode()).hexdigest()[:8]
+    os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+
+    def render(name, args):
+        # Eindeutig pro Prozess und Thread, damit sich parallele Läufe nie die Datei wegnehmen
+        tmp_path = os.path.join(THUMBNAIL_DIR, f".{name}.{os.getpid()}-{threading_get_ident()}.tmp.jpg")
+        result = run_ffmpeg(['-loglevel', 'error', *args, '-update', '1', '-y', tmp_path])
+        if result.returncode != 0 or not os.path.isfile(tmp_path):
+            raise ValueError(result.stderr.decode('utf-8', 'replace').strip()[-200:] or "ffmpeg produced no image")
+        os.replace(tmp_path, os.path.join(THUMBNAIL_DIR, name))
+        return name
+
+    poster = render(f"{prefix}-{stamp}-poster.jpg", [
+        '-ss', f"{min(duration * POSTER_POSITION, POSTER_MAX_OFFSET):.3f}", '-i', path, '-map', '0:v:0',
+        '-frames:v', '1', '-vf', f"scale={POSTER_WIDTH}:-2", '-q:v', '4'])
+
+    # Nur Keyframes dekodieren: für Vorschaukacheln genau genug und ein Vielfaches schneller
+    interval = max(SPRITE_MIN_INTERVAL, duration / SPRITE_MAX_TILES)
+    count = max(1, min(SPRITE_MAX_TILES, math.ceil(duration / interval)))
+    columns = min(SPRITE_COLUMNS, count)
+    rows = math.ceil(count / columns)
+    tile_height = max(2, round(SPRITE_TILE_WIDTH * height / width / 2) * 2)
+    sprite = render(f"{prefix}-{stamp}-sprite.jpg", [
+        '-skip_frame', 'nokey', '-i', path, '-map', '0:v:0', '-frames:v', '1', '-vf',
+        f"fps=1/{interval:.3f},scale={SPRITE_TILE_WIDTH}:{tile_height},tile={columns}x{rows}", '-q:v', '5'])
+
+    for name in os.listdir(THUMBNAIL_DIR):
+        if name.startswith(f"{prefix}-") and not name.startswith(f"{prefix}-{stamp}-"):
+            try:
+                os.remove(os.path.join(THUMBNAIL_DIR, name))
+            except OSError:
+                pass
+    return {
+        'duration': round(duration, 3), 'width': width, 'height': height,
+        'poster': poster, 'sprite': sprite, 'interval': round(interval, 3), 'count': count,
+        'columns': columns, 'rows': rows, 'tile_width': SPRITE_TILE_WIDTH, 'tile_height': tile_height,
+    }
+
+
+def _video_thumbnails_exist(value):
+    return all(os.path.isfile(os.path.join(THUMBNAIL_DIR, value[kind])) for kind in ('poster', 'sprite'))
+
+
+VIDEO_ANALYZER = BackgroundAnalyzer('video_thumbnails', analyze_video_thumbnails, workers=VIDEO_THUMBNAIL_WORKERS,
+                                    valid=_video_thumbnails_exist)
+
+
+def downsample_peaks(fine_peaks, buckets):
+    """Verdichtet die Fein-Peaks auf genau `buckets` Werte (Maximum pro Bucket)."""
+    if not fine_peaks:
+        return bytes(buckets)
+    result = bytearray(buckets)
+    step = len(fine_peaks) / buckets
+    for i in range(buckets):
+        start = int(i * step)
+        end = max(start + 1, int((i + 1) * step))
+        result[i] = max(fine_peaks[start:end])
+    return bytes(result)
+
+
+def _index_source(file_info):
+    """Der zugrunde liegende MEDIA_INDEX-Eintrag (mit absolutem Pfad und mtime) oder None."""
+    if file_info.get('source'):
+        return file_info['source']
+    return file_info if 'mtime' in file_info else None
+
+
+def get_loudness_fields(file_info):
+    """ReplayGain-Felder für die JSON-API; None-Werte, solange die Analyse noch aussteht."""
+    fields = {'loudness_lufs': None, 'replaygain_track_gain': None, 'replaygain_track_peak': None}
+    source = _index_source(file_info)
+    if not (LOUDNESS_ANALYSIS and FFMPEG_BIN and source) or f".{source['ext']}" not in MUSIC_EXTENSIONS:
+        return fields
+    loudness = LOUDNESS_ANALYZER.peek(source)  # Eingeplant wird beim Indexaufbau, nicht pro Request
+    if loudness:
+        fields['loudness_lufs'] = loudness['lufs']
+        fields['replaygain_track_gain'] = round(REPLAYGAIN_REFERENCE_LUFS - loudness['lufs'], 2)
+        if loudness.get('peak_dbfs') is not None:
+            fields['replaygain_track_peak'] = round(10 ** (loudness['peak_dbfs'] / 20), 6)
+    return fields
+
+
+def get_video_thumbnails(file_info):
+    """
+    Ergebnis der Vorschaubild-Analyse eines Videos oder None (kein Video, ausstehend, fehlgeschlagen).
+    Nur aus dem Speicher; eingeplant wird beim Indexaufbau, nicht pro Request.
+    """
+    source = _index_source(file_info)
+    if not (VIDEO_THUMBNAILS and FFMPEG_BIN and source) or f".{source['ext']}" not in VIDEO_EXTENSIONS:
+        return None
+    return VIDEO_ANALYZER.peek(source)
+
+
+def get_video_fields(file_info):
+    """Posterframe als Cover und Sprite-Sheet-Geometrie für die JSON-API, sobald die Analyse fertig ist."""
+    thumbnails = get_video_thumbnails(file_info)
+    if not thumbnails:
+        return {'video_sprite': None}
+    rel_path = _index_source(file_info)['rel_path']
+    return {
+        'cover_image_url': url_for('get_video_thumbnail', title=rel_path, kind='poster',
+                                   v=thumbnails['poster'].split('-')[1], _external=True),
+        'video_sprite': {
+            'url': url_for('get_video_thumbnail', title=rel_path, kind='sprite',
+                           v=thumbnails['sprite'].split('-')[1], _external=True),
+            'interval': thumbnails['interval'], 'count': thumbnails['count'],
+            'columns': thumbnails['columns'], 'rows': thumbnails['rows'],
+            'tile_width': thumbnails['tile_width'], 'tile_height': thumbnails['tile_height'],
+        },
+    }
+
+
+def schedule_background_analyses():
+    """
+    Lädt vorhandene Analyse-Ergebnisse für den aktuellen Index und plant, mit Analyse-Rolle,
+    die fehlenden ein (läuft komplett im Hintergrund).
+    """
+    if not FFMPEG_BIN:
+        app.logger.info("ffmpeg not found, background media analysis disabled")
+        return
+    claim_analysis_role()
+    entries = list(MEDIA_INDEX)
+    if LOUDNESS_ANALYSIS:
+        audio = [e for e in entries if f".{e['ext']}" in MUSIC_EXTENSIONS]
+        Thread(target=LOUDNESS_ANALYZER.preload, args=(audio,), name="loudness-preload", daemon=True).start()
+    if VIDEO_THUMBNAILS:
+        videos = [e for e in entries if f".{e['ext']}" in VIDEO_EXTENSIONS]
+        Thread(target=VIDEO_ANALYZER.preload, args=(videos,), name="video-preload", daemon=True).start()
+
+
+def schedule_entry_analyses(entry):
+    """Plant die Analysen für einen einzeln eingefügten Index-Eintrag ein (Upload, Store-Abgleich)."""
+    if not FFMPEG_BIN:
+        return
+    if LOUDNESS_ANALYSIS and f".{entry['ext']}" in MUSIC_EXTENSIONS:
+        LOUDNESS_ANALYZER.schedule_entry(entry)
+    if VIDEO_THUMBNAILS and f".{entry['ext']}" in VIDEO_EXTENSIONS:
+        VIDEO_ANALYZER.schedule_entry(entry)
 
 
 @app.context_processor
@@ -250,22 +2380,77 @@ def root_redirect():
     # Leitet "/" auf "$MUSIK_PATH/$PLAYCARD_ENDPOINT weiter
     return redirect(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}")
 
+def index_health():
+    """Zustand des Index-Aufbaus für /health und /ready."""
+    status = dict(INDEX_STATUS)
+    status['elapsed'] = round(time.time() - status['started'], 3) if status['state'] == 'building' else None
+    status['ready'] = status.pop('complete')
+    return status
+
+
+@app.route('/health')
+@limiter.exempt
+def health():
+    """Liveness: der Prozess antwortet, auch während der Index noch gebaut wird."""
+    return jsonify({"status": "ok", "index": index_health()})
+
+
+@app.route('/ready')
+@limiter.exempt
+def ready():
+    """Readiness: 200 sobald ein vollständiger Index vorliegt, sonst 503."""
+    index = index_health()
+    return jsonify({"status": "ready" if index['ready'] else "building", "index": index}), \
+        200 if index['ready'] else 503
+
+
+@app.after_request
+def _index_state_header(response):
+    # Clients (z.B. die flache /api/index-Liste) erkennen so einen noch unvollständigen Index
+    response.headers['X-Playcard-Index-State'] = INDEX_STATUS['state']
+    return response
+
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Prometheus-Metriken; mit PROMETHEUS_MULTIPROC_DIR über alle Worker aggregiert."""
+    if not METRICS_AVAILABLE:
+        abort(404, description="prometheus_client is not installed.")
+    if METRICS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return app.response_class(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
 # -------------------------------
 # Utility Functions (identisch zu PHP)
 # -------------------------------
 def sort_key_locale(title):
-    """Identische Sortierung wie in PHP"""
+    """
+    Identische Sortierung wie in PHP (Buchstaben, dann Sonderzeichen, dann Ziffern),
+    als Bytes-Schlüssel: ein Prioritäts-Byte gefolgt vom Collation-Schlüssel.
+    Wird beim Indexaufbau einmal pro Eintrag berechnet ('sort_key').
+    """
     title = title.strip()
     if not title:
-        return (3, '')
+        return b'\x03'
     first_char = title[0]
-    if re.match(r'[A-Za-z]', first_char):
-        priority = 0
-    elif re.match(r'\d', first_char):
-        priority = 2
+    if first_char.isascii() and first_char.isalpha():
+        priority = b'\x00'
+    elif first_char.isdecimal():
+        priority = b'\x02'
     else:
-        priority = 1
-    return (priority, locale.strxfrm(title.lower()))
+        priority = b'\x01'
+    if ICU_COLLATOR is not None:
+        return priority + ICU_COLLATOR.getSortKey(title.lower())
+    # UTF-8 erhält die Codepoint-Reihenfolge, der Bytevergleich entspricht also dem strxfrm-Vergleich
+    return priority + locale.strxfrm(title.lower()).encode('utf-8', 'surrogatepass')
+
+
+# Ordnernamen wiederholen sich über Anfragen hinweg, deren Schlüssel werden gecacht
+folder_sort_key = functools.lru_cache(maxsize=16384)(sort_key_locale)
 
 def is_forbidden(path):
     """Genau wie PHP-Version mit case-insensitiver Prüfung"""
@@ -276,7 +2461,7 @@ def is_forbidden(path):
             if forbidden_norm in rel_path:
                 return True
     except Exception as e:
-        app.logger.error(f"Forbidden check error: {e}")
+        app.logger.error("Forbidden check error: %s", e)
     return False
 
 def get_relative_path(absolute_path):
@@ -371,11 +2556,17 @@ def find_all_matches(search_term, extensions, limit=10):
                     return matches
     return matches
 
+@timed('find_all_matches_from_index')
 def find_all_matches_from_index(search_term, limit=10):
-    """Verbesserte Suche die genau wie die Originalversion funktioniert"""
+    """Verbesserte Suche die genau wie die Originalversion funktioniert (Treffer pro Index-Generation gecacht)"""
     if not search_term:
         return []
-    
+    rel_paths = RESPONSE_CACHE.get('search', [search_term.lower(), limit],
+                                   lambda: [entry['rel_path'] for entry in _search_index(search_term, limit)])
+    return [MEDIA_BY_REL_PATH[rel_path] for rel_path in rel_paths if rel_path in MEDIA_BY_REL_PATH]
+
+
+def _search_index(search_term, limit):
     search_term_lower = search_term.lower()
     matches = []
 
@@ -402,13 +2593,14 @@ def find_all_matches_from_index(search_term, limit=10):
     return matches
 
 
+@timed('find_cover_image')
 def find_cover_image(track_path, track_name_base):
     """Intelligente Suche nach Cover-Bildern wie in PHP"""
     track_dir = os.path.dirname(track_path)
 
     # DIESE PRÜFUNG IST KRITISCH!
     if not os.path.isdir(track_dir):
-        app.logger.warning(f"[find_cover_image] Directory does not exist: '{track_dir}' (derived from track_path: '{track_path}'). Returning None.")
+        app.logger.warning("[find_cover_image] Directory does not exist: '%s' (derived from track_path: '%s'). Returning None.", track_dir, track_path, extra=LOG_SAMPLED)
         return None # Wichtig: Hier abbrechen, um den FileNotFoundError zu verhindern.
     
     candidates = []
@@ -419,21 +2611,7 @@ def find_cover_image(track_path, track_name_base):
             continue
 
         img_path = os.path.join(track_dir, f)
-        name = os.path.splitext(f)[0]
-        score = 0
-
-        # Normalize names for comparison wie in PHP
-        norm_track = re.sub(r'[^a-z0-9]', '', track_name_base.lower())
-        norm_name = re.sub(r'[^a-z0-9]', '', name.lower())
-
-        if norm_name == norm_track:
-            score = 100
-        elif norm_track in norm_name:
-            score = 80
-        elif (re.search(r'\b(cover|folder|front|album)\b', name, re.I) and
-              track_name_base.lower() in name.lower()):
-            score = 70
-
+        score = _cover_score(track_name_base, os.path.splitext(f)[0])
         if score > 0:
             candidates.append({'path': img_path, 'score': score})
 
@@ -442,6 +2620,23 @@ def find_cover_image(track_path, track_name_base):
     return RADIO_LOGO
 
 
+def _cover_score(track_name_base, name):
+    """Bewertung eines Bild-Basenamens als Cover für einen Track (0 = kein Cover), wie in PHP"""
+    # Normalize names for comparison wie in PHP
+    norm_track = re.sub(r'[^a-z0-9]', '', track_name_base.lower())
+    norm_name = re.sub(r'[^a-z0-9]', '', name.lower())
+
+    if norm_name == norm_track:
+        return 100
+    if norm_track in norm_name:
+        return 80
+    if (re.search(r'\b(cover|folder|front|album)\b', name, re.I) and
+            track_name_base.lower() in name.lower()):
+        return 70
+    return 0
+
+
+@timed('_find_cover_by_name_in_index')
 def _find_cover_by_name_in_index(track_basename, limit=1):
     """
     Sucht im MEDIA_INDEX nach dem besten passenden Cover-Bild anhand des Track-Basenamens.
@@ -451,6 +2646,12 @@ def _find_cover_by_name_in_index(track_basename, limit=1):
     if not track_basename:
         return RADIO_LOGO # Hier direkt RADIO_LOGO, wenn der Basename leer ist
 
+    cover_map = COVER_MAP
+    if cover_map is not None:
+        best_match_entry = cover_map.find(track_basename)
+        return best_match_entry.get('path') if best_match_entry and best_match_entry.get('path') else RADIO_LOGO
+
+    # Noch kein fertiger Index (Aufbau läuft): linearer Scan über die Bilder
     best_match_entry = None  # Speichert das gesamte 'entry' Dictionary des besten Matches
     best_score = -1
 
@@ -576,8 +2777,25 @@ def generate_open_graph_tags(file_info, request):
     """
 
 
+@timed('generate_index')
 def generate_index(structured=True):
-    """Index-Generierung unter Verwendung von MEDIA_INDEX, aber mit identischem Verhalten wie die Originalversion"""
+    """
+    Index-Generierung unter Verwendung von MEDIA_INDEX, aber mit identischem Verhalten wie die Originalversion.
+    Das Ergebnis wird pro Index-Generation gemerkt und von allen Anfragen geteilt (nicht verändern!).
+    """
+    global SORTED_VIEWS
+    generation = INDEX_GENERATION
+    view = SORTED_VIEWS.get((generation, structured))
+    if view is not None:
+        return view
+    view = _generate_index(structured)
+    views = {key: value for key, value in SORTED_VIEWS.items() if key[0] == generation}
+    views[(generation, structured)] = view
+    SORTED_VIEWS = views
+    return view
+
+
+def _generate_index(structured):
     entries = []
     folder_map = {}
 
@@ -598,23 +2816,25 @@ def generate_index(structured=True):
                 'name': name,
                 'path': rel_path,  # Hier muss der relative Pfad sein, nicht der absolute
                 'ext': entry['ext'],
-                'rel_path': rel_path # Füge rel_path explizit hinzu für Konsistenz
+                'rel_path': rel_path, # Füge rel_path explizit hinzu für Konsistenz
+                'source': entry  # Original-Eintrag (absoluter Pfad, mtime) für Analysen
             })
         entries.append({
             'name': name,
             'path': rel_path,
             'ext': entry['ext'],
-            'rel_path': rel_path # Füge rel_path explizit hinzu für Konsistenz
+            'rel_path': rel_path, # Füge rel_path explizit hinzu für Konsistenz
+            'source': entry
         })
 
     # Sortierung wie in PHP
     if structured:
         for folder in folder_map:
-            folder_map[folder].sort(key=lambda x: sort_key_locale(x['name']))
+            folder_map[folder].sort(key=lambda x: x['source']['sort_key'])
         # Sortiere die Ordner selbst
-        folder_map = dict(sorted(folder_map.items(), key=lambda x: sort_key_locale(x[0])))
+        folder_map = dict(sorted(folder_map.items(), key=lambda x: folder_sort_key(x[0])))
     else:
-        entries.sort(key=lambda x: sort_key_locale(x['name']))
+        entries.sort(key=lambda x: x['source']['sort_key'])
 
     return folder_map if structured else entries
 
@@ -646,6 +2866,7 @@ def filter_folder_map(folder_map, search_value):
 # ----------------------------------
 
 
+@timed('render_index')
 def render_index(structured, entries=None, folder_map=None, shuffle_url="#", searchform="", radio_status=None):
     """
     Rendert den Index-Bereich mit strukturierter oder flacher Ansicht
@@ -703,18 +2924,32 @@ def render_index(structured, entries=None, folder_map=None, shuffle_url="#", sea
         {% if radio_status and radio_status.artist and radio_status.title %}
             <div class="radio-now-playing">
                 <h3>Radio:</h3>
-                <p><strong>Artist:</strong> {{ radio_status.artist }}</p>
-                <p><strong>Title:</strong> {{ radio_status.title }}</p>
-                {% if radio_status.stream_url %}
+                <p><strong>Artist:</strong> <span id="radio-artist">{{ radio_status.artist }}</span></p>
+                <p><strong>Title:</strong> <span id="radio-title">{{ radio_status.title }}</span></p>
+                {% if radio_status.relay_url %}
+                    <p><a href="{{ radio_status.relay_url }}">▶️  Radio Stream</a></p>
+                {% elif radio_status.stream_url %}
                     <p><a href="{{ url_for('playcard', title=radio_status.stream_url) }}">▶️  Radio Stream</a></p>
                 {% endif %}
             </div>
+            {% if radio_push %}
+            <script>
+                if (window.EventSource) {
+                    new EventSource("{{ url_for('get_radio_events') }}").addEventListener("nowplaying", function (e) {
+                        var streams = JSON.parse(e.data);
+                        if (!streams.length) return;
+                        document.getElementById("radio-artist").textContent = streams[0].artist;
+                        document.getElementById("radio-title").textContent = streams[0].title;
+                    });
+                }
+            </script>
+            {% endif %}
         {% endif %}
 
         {% if structured %}
             {% for folder, files in folder_map.items() %}
                 <div class="folder">
-                    <h2>{{ folder }}</h2>
+                    <h2>{{ folder }} <a href="{{ url_for('get_playlist', folder=folder) }}" title="Playlist (M3U)">▶️</a> <a href="{{ url_for('get_folder_zip', path=folder) }}" title="Download (ZIP)">⬇️</a></h2>
                     <ul class="song-list">
                         {% for file in files %}
                         <li class="song-item">
@@ -744,10 +2979,14 @@ def render_index(structured, entries=None, folder_map=None, shuffle_url="#", sea
         folder_map=prepared_folder_map if structured else None,
         shuffle_url=shuffle_url,
         searchform=searchform,
-        radio_status=radio_status # Pass radio status to template
+        radio_status=radio_status, # Pass radio status to template
+        # Ein offener Event-Stream belegt bei synchronen Workern (gunicorn sync, uWSGI ohne
+        # Threads) den ganzen Worker; Push deshalb nur mit Threads oder unter ASGI
+        radio_push=request.environ.get('wsgi.multithread', False)
     )
 
 
+@timed('render_player')
 def render_player(file_info, request, cover_html=f'<img src="{{RADIO_LOGO}}" width="300" alt="Standard Cover"><br>'):
     """
     Rendert den Player-Bereich mit allen notwendigen Komponenten.
@@ -786,8 +3025,16 @@ def render_player(file_info, request, cover_html=f'<img src="{{RADIO_LOGO}}" wid
         media_type = file_info['ext'].lower()
         
         if f".{media_type}" in VIDEO_EXTENSIONS:
+            thumbnails = None if file_info.get('is_external_url') else get_video_thumbnails(file_info)
+            poster_attr = ""
+            if thumbnails:
+                poster_url = html.escape(url_for('get_video_thumbnail', title=file_info['rel_path'],
+                                                 v=thumbnails['poster'].split('-')[1]))
+                poster_attr = f' poster="{poster_url}"'
+                if not cover_html:
+                    cover_html = f'<img src="{poster_url}" width="300" alt="Poster"><br>'
             player_html = f"""
-            <video controls autoplay width="640">
+            <video controls autoplay width="640"{poster_attr}>
                 <source src="{player_url}" type="video/{media_type}">
                 Your browser doesn't support HTML5 video.
             </video>
@@ -800,6 +3047,28 @@ def render_player(file_info, request, cover_html=f'<img src="{{RADIO_LOGO}}" wid
             </audio>
             """
 
+        if not file_info.get('is_external_url') and FFMPEG_BIN:
+            # Wellenform aus /api/peaks; Klick springt an die Stelle
+            peaks_url = url_for('get_peaks', title=file_info['rel_path'], buckets=300)
+            player_html += f"""
+            <canvas id="waveform" width="600" height="60" style="cursor:pointer"></canvas>
+            <script>
+                (function () {{
+                    var canvas = document.getElementById("waveform"), media = document.querySelector("audio, video");
+                    fetch("{peaks_url}").then(function (r) {{ return r.status === 200 ? r.json() : null; }}).then(function (data) {{
+                        if (!data) {{ canvas.style.display = "none"; return; }}
+                        var ctx = canvas.getContext("2d"), w = canvas.width / data.peaks.length, h = canvas.height;
+                        data.peaks.forEach(function (p, i) {{
+                            ctx.fillRect(i * w, (h - p * h) / 2, Math.max(1, w - 1), Math.max(1, p * h));
+                        }});
+                    }});
+                    canvas.addEventListener("click", function (e) {{
+                        if (media && media.duration) media.currentTime = media.duration * e.offsetX / canvas.width;
+                    }});
+                }})();
+            </script>
+            """
+
     return render_template_string("""
         <!DOCTYPE html>
         <html prefix="og: http://ogp.me/ns#">
@@ -832,6 +3101,7 @@ def render_player(file_info, request, cover_html=f'<img src="{{RADIO_LOGO}}" wid
 # -------------------------------
 # Helper function to get radio streams (extracted from get_radio_status_json)
 # -------------------------------
+@timed('_get_radio_streams_from_xml')
 def _get_radio_streams_from_xml():
     """
     Fetches the radio's "now playing" XML/HTML, parses it,
@@ -842,7 +3112,9 @@ def _get_radio_streams_from_xml():
         import requests
         from bs4 import BeautifulSoup
     except ImportError as e:
-        app.logger.error(f"Missing required libraries for radio status parsing: {e}. Please install them (e.g., pip install requests beautifulsoup4 lxml).")
+        RADIO_ERRORS.labels('missing_dependency').inc()
+        app.logger.error("Missing required libraries for radio status parsing: %s. "
+                         "Please install them (e.g., pip install requests beautifulsoup4 lxml).", e, extra=LOG_SAMPLED)
         return []
 
     try:
@@ -865,61 +3137,536 @@ def _get_radio_streams_from_xml():
                     "artist": artist,
                     "title": title
                 })
-        app.logger.debug(f"Successfully parsed {len(streams_data)} radio streams from {RADIO_NOW_PLAYING_URL}.")
+        app.logger.debug("Successfully parsed %s radio streams from %s.", len(streams_data), RADIO_NOW_PLAYING_URL, extra=LOG_SAMPLED)
         return streams_data
     except requests.exceptions.RequestException as e:
-        app.logger.warning(f"Could not fetch radio status for shuffle fallback from {RADIO_NOW_PLAYING_URL}: {e}")
+        RADIO_ERRORS.labels('fetch').inc()
+        app.logger.warning("Could not fetch radio status for shuffle fallback from %s: %s", RADIO_NOW_PLAYING_URL, e, extra=LOG_SAMPLED)
         return []
     except Exception as e:
-        app.logger.error(f"Error parsing radio status for shuffle fallback: {e}")
+        RADIO_ERRORS.labels('parse').inc()
+        app.logger.error("Error parsing radio status for shuffle fallback: %s", e, extra=LOG_SAMPLED)
         return []
 
+# -------------------------------
+# Now-Playing Watcher (Push statt Polling)
+# -------------------------------
+class RadioWatcher:
+    """
+    Ein einziger Watcher pro Prozess fragt den Now-Playing-Feed ab und benachrichtigt
+    alle Abonnenten nur dann, wenn sich Artist/Titel eines Mounts ändern.
+    Der letzte Stand dient zusätzlich als Cache für /api/radio und die Index-Seite.
+    """
+
+    def __init__(self, interval=RADIO_WATCH_INTERVAL):
+        self.interval = interval
+        self.lock = Lock()
+        self.subscribers = set()
+        self.snapshot = None
+        self.snapshot_time = 0
+        self.last_subscriber_left = 0
+        self.thread = None
+
+    @staticmethod
+    def _now_playing_key(streams):
+        return tuple((s.get('mount_point'), s.get('artist'), s.get('title')) for s in streams)
+
+    def _broadcast(self, streams):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(streams)
+            except queue.Full:
+                # Langsamer Abonnent: ältesten Stand verwerfen, nur der neueste zählt
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait(streams)
+                except queue.Full:
+                    pass  # Parallel schon wieder gefüllt (z.B. von subscribe()), der nächste Stand kommt
+
+    def _loop(self):
+        while True:
+            with self.lock:
+                if not self.subscribers and time.monotonic() - self.last_subscriber_left > RADIO_WATCH_LINGER:
+                    self.thread = None
+                    return
+            streams = _get_radio_streams_from_xml()
+            if streams:
+                changed = self.snapshot is None or \
+                    self._now_playing_key(streams) != self._now_playing_key(self.snapshot)
+                self.snapshot = streams
+                self.snapshot_time = time.monotonic()
+                RESPONSE_CACHE.set('radio', 'streams', streams, ttl=RADIO_SNAPSHOT_TTL, per_index=False)
+                if changed:
+                    app.logger.debug("Radio now playing changed, notifying subscribers")
+                    self._broadcast(streams)
+            time.sleep(self.interval)
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=1)
+        with self.lock:
+            self.subscribers.add(q)
+            if self.thread is None:
+                self.thread = Thread(target=self._loop, name="radio-watcher", daemon=True)
+                self.thread.start()
+        if self.snapshot:
+            try:
+                q.put_nowait(self.snapshot)
+            except queue.Full:
+                pass  # Der Watcher war schneller, sein Stand ist ohnehin aktueller
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+            self.last_subscriber_left = time.monotonic()
+
+    def fresh_snapshot(self):
+        """Letzter Stand des Watchers, solange er aktuell ist, sonst None."""
+        if self.snapshot and time.monotonic() - self.snapshot_time < 2 * self.interval:
+            return self.snapshot
+        return None
+
+    def events(self):
+        """SSE-Generator für einen Abonnenten."""
+        q = self.subscribe()
+        try:
+            yield f"retry: {RADIO_WATCH_INTERVAL * 1000}\n\n"
+            while True:
+                try:
+                    streams = q.get(timeout=RADIO_EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                payload = [dict(s, relay_url=radio_relay_url(s.get('mount_point'))) for s in streams]
+                yield f"event: nowplaying\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            self.unsubscribe(q)
+
+
+RADIO_WATCHER = RadioWatcher()
+
+
+def get_radio_streams():
+    """Radio-Streams aus dem Watcher, falls aktuell, sonst aus dem (zwischen Workern geteilten) Cache oder vom Upstream."""
+    return RADIO_WATCHER.fresh_snapshot() or \
+        RESPONSE_CACHE.get('radio', 'streams', lambda: _get_radio_streams_from_xml(), ttl=RADIO_SNAPSHOT_TTL, per_index=False)
+
 def get_current_radio_status():
     """
     Retrieves the current playing artist and title from the radio stream.
     Returns a dict with 'artist', 'title', 'stream_url' or None if not available.
     """
-    streams = _get_radio_streams_from_xml()
+    streams = get_radio_streams()
     if streams:
         # Assuming the first stream is the primary one
         first_stream = streams[0]
         return {
             "artist": safe_string(first_stream.get('artist', 'Unknown')),
             "title": safe_string(first_stream.get('title', 'Unknown')),
-            "stream_url": safe_string(first_stream.get('mount_point'))
+            "stream_url": safe_string(first_stream.get('mount_point')),
+            "relay_url": radio_relay_url(first_stream.get('mount_point'))
         }
     return None
 
+# -------------------------------
+# Radio Relay (eine Upstream-Verbindung pro Mount, Fan-out an N Hörer)
+# -------------------------------
+class RadioRelay:
+    """
+    Hält genau eine Upstream-Verbindung zu einem Shoutcast-Mount und verteilt die
+    empfangenen Bytes über einen gemeinsamen Ringpuffer an beliebig viele lokale Hörer.
+    Langsame Hörer bremsen niemanden aus: wer vom Schreibzeiger überholt wird, springt
+    nach vorne; wer das zu oft tut, wird getrennt.
+    """
+
+    def __init__(self, mount, upstream_url, buffer_size=RADIO_RELAY_BUFFER_SIZE):
+        self.mount = mount
+        self.upstream_url = upstream_url
+        self.buffer = bytearray(buffer_size)
+        self.buffer_size = buffer_size
+        self.write_pos = 0  # Absolute Anzahl bisher empfangener Bytes
+        self.cond = Condition()
+        self.listeners = 0
+        self.last_listener_left = time.monotonic()
+        self.running = False
+        self.generation = 0  # Gehört zum aktuellen Upstream-Thread; ältere Threads beenden sich
+        self.thread = None
+        self.content_type = mimetypes.guess_type(mount)[0] or 'audio/mpeg'
+
+    def _write(self, data):
+        with self.cond:
+            start = self.write_pos % self.buffer_size
+            first = min(len(data), self.buffer_size - start)
+            self.buffer[start:start + first] = data[:first]
+            if first < len(data):
+                rest = data[first:first + self.buffer_size]
+                self.buffer[:len(rest)] = rest
+            self.write_pos += len(data)
+            self.cond.notify_all()
+
+    def _read(self, pos, max_len):
+        """Liest ab absoluter Position pos; muss mit gehaltenem self.cond aufgerufen werden."""
+        length = min(max_len, self.write_pos - pos)
+        start = pos % self.buffer_size
+        end = start + length
+        if end <= self.buffer_size:
+            return bytes(self.buffer[start:end])
+        return bytes(self.buffer[start:]) + bytes(self.buffer[:end - self.buffer_size])
+
+    def _idle(self):
+        return self.listeners == 0 and time.monotonic() - self.last_listener_left > RADIO_RELAY_IDLE_TIMEOUT
+
+    def _active(self, generation):
+        """Ob der Upstream-Thread dieser Generation weiterlaufen soll; muss mit gehaltenem self.cond aufgerufen werden."""
+        return self.running and self.generation == generation
+
+    def _upstream_loop(self, generation):
+        backoff = 1
+        while True:
+            with self.cond:
+                if not self._active(generation):
+                    break
+            try:
+                with requests.get(self.upstream_url, stream=True, timeout=(5, 15),
+                                  headers={'Icy-MetaData': '0'}) as response:
+                    response.raise_for_status()
+                    self.content_type = response.headers.get('Content-Type', self.content_type)
+                    app.logger.info("Radio relay connected to %s", self.upstream_url)
+                    backoff = 1
+                    for chunk in response.iter_content(chunk_size=RADIO_RELAY_CHUNK_SIZE):
+                        with self.cond:
+                            if self._active(generation) and self._idle():
+                                self.running = False
+                            if not self._active(generation):
+                                break
+                            if chunk:
+                                self._write(chunk)
+            except requests.exceptions.RequestException as e:
+                app.logger.warning("Radio relay upstream error for %s: %s", self.upstream_url, e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            with self.cond:
+                if self._active(generation) and self._idle():
+                    self.running = False
+                self.cond.notify_all()
+        app.logger.info("Radio relay for %s stopped", self.upstream_url)
+
+    def _ensure_running(self):
+        """
+        Startet den Upstream-Thread; muss mit gehaltenem self.cond aufgerufen werden. Ein alter
+        Thread, der gerade aufhört, sieht die neue Generation und beendet sich, statt neben dem
+        neuen weiterzulaufen.
+        """
+        if not self.running:
+            self.running = True
+            self.generation += 1
+            self.thread = Thread(target=self._upstream_loop, args=(self.generation,),
+                                 name=f"radio-relay{self.mount}", daemon=True)
+            self.thread.start()
+
+    def _register(self):
+        with self.cond:
+            self.listeners += 1
+            self._ensure_running()
+            return max(0, self.write_pos - RADIO_RELAY_BURST_SIZE)
+
+    def _unregister(self):
+        with self.cond:
+            self.listeners -= 1
+            self.last_listener_left = time.monotonic()
+
+    def _take(self, pos, skips):
+        """
+        Nicht-blockierender Leseschritt eines Hörers; muss mit gehaltenem self.cond aufgerufen werden.
+        Gibt (data, pos, skips) zurück. data ist b'', wenn noch nichts Neues da ist,
+        und None, wenn der Hörer aufhören soll (Upstream beendet oder zu langsam).
+        """
+        if self.write_pos <= pos:
+            return (b'' if self.running else None), pos, skips
+        if self.write_pos - pos > self.buffer_size:
+            # Vom Schreibzeiger überholt: nach vorne springen statt alle anderen aufzuhalten
+            skips += 1
+            if skips > RADIO_RELAY_MAX_SKIPS:
+                app.logger.info("Dropping slow radio relay listener on %s", self.mount)
+                return None, pos, skips
+            pos = self.write_pos - RADIO_RELAY_BURST_SIZE
+        data = self._read(pos, RADIO_RELAY_CHUNK_SIZE)
+        return data, pos + len(data), skips
+
+    def listen(self):
+        """Generator für einen Hörer: liefert die Stream-Bytes ab dem aktuellen Live-Punkt."""
+        pos = self._register()
+        skips = 0
+        try:
+            while True:
+                with self.cond:
+                    data, pos, skips = self._take(pos, skips)
+                    while data == b'':
+                        self.cond.wait(timeout=RADIO_RELAY_IDLE_TIMEOUT)
+                        data, pos, skips = self._take(pos, skips)
+                if data is None:
+                    return
+                yield data
+        finally:
+            self._unregister()
+
+    async def alisten(self):
+        """Wie listen(), aber für den ASGI-Modus: wartet im Event-Loop statt einen Thread zu blockieren."""
+        pos = self._register()
+        skips = 0
+        try:
+            while True:
+                with self.cond:
+                    data, pos, skips = self._take(pos, skips)
+                if data is None:
+                    return
+                if data == b'':
+                    await asyncio.sleep(ASGI_POLL_INTERVAL)
+                    continue
+                yield data
+        finally:
+            self._unregister()
+
+
+RADIO_RELAYS = {}
+RADIO_RELAYS_LOCK = Lock()
+
+
+def _is_known_radio_mount(mount):
+    """Nur bekannte Mounts werden weitergeleitet, damit der Relay kein offener Proxy ist."""
+    if RADIO_RELAY_MOUNTS:
+        return mount in RADIO_RELAY_MOUNTS
+    with RADIO_RELAYS_LOCK:
+        if mount in RADIO_RELAYS:
+            return True
+    return any(s.get('mount_point') == mount for s in get_radio_streams())
+
+
+def get_radio_relay(mount):
+    with RADIO_RELAYS_LOCK:
+        relay = RADIO_RELAYS.get(mount)
+        if relay is None:
+            upstream_url = f"{RADIO_STREAM_BASE_URL.rstrip('/')}/{mount.lstrip('/')}"
+            relay = RadioRelay(mount, upstream_url)
+            RADIO_RELAYS[mount] = relay
+        return relay
+
+
+def radio_relay_url(mount):
+    """URL des lokalen Relays für einen Mount oder None, wenn der Relay abgeschaltet ist."""
+    if not RADIO_RELAY_ENABLED or not mount:
+        return None
+    return url_for('radio_relay', mount=mount.lstrip('/'), _external=True)
+
+
+
+# -------------------------------
+# Play-Statistik (gebündelte Schreibzugriffe)
+# -------------------------------
+class PlayCounter:
+    """
+    Zählt Plays ohne Lock und ohne Plattenzugriff im Request: record() hängt nur an eine
+    deque an. Ein Hintergrund-Thread schreibt die Plays gebündelt nach SQLite (WAL) und
+    berechnet dabei gleich den Trending-Schlüssel vor.
+
+    Der Trending-Score zerfällt mit TRENDING_HALF_LIFE. Gespeichert wird
+    trend_key = log2(score) + t / half_life; dieser Schlüssel ist zeitunabhängig
+    vergleichbar, sodass /api/trending nur noch "ORDER BY trend_key" braucht.
+    """
+
+    def __init__(self, db_path=PLAYS_DB_PATH):
+        self.db_path = db_path
+        self.pending = deque()
+        self.recent = {}  # (client, rel_path) -> Zeitpunkt, für die Dedup-Sperre
+        self.wake = Event()
+        self.thread = None
+        self.start_lock = Lock()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS plays (
+                            rel_path TEXT PRIMARY KEY,
+                            total INTEGER NOT NULL,
+                            last_played REAL NOT NULL,
+                            trend_key REAL NOT NULL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS plays_total ON plays (total DESC)")
+        conn.execute("CREATE INDEX IF NOT EXISTS plays_trend ON plays (trend_key DESC)")
+        return conn
+
+    def record(self, rel_path, client=None):
+        now = time.time()
+        key = (client, rel_path)
+        if now - self.recent.get(key, 0) < PLAYS_DEDUP_WINDOW:
+            return
+        self.recent[key] = now
+        self.pending.append((rel_path, now))
+        if self.thread is None:
+            self._start()
+        if len(self.pending) >= PLAYS_FLUSH_THRESHOLD:
+            self.wake.set()
+
+    def _start(self):
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = Thread(target=self._loop, name="play-counter", daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            self.wake.wait(PLAYS_FLUSH_INTERVAL)
+            self.wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                app.logger.error("Could not flush play counts: %s", e)
+
+    def flush(self):
+        batch = {}
+        while True:
+            try:
+                rel_path, played_at = self.pending.popleft()
+            except IndexError:
+                break
+            count, last = batch.get(rel_path, (0, 0))
+            batch[rel_path] = (count + 1, max(last, played_at))
+        cutoff = time.time() - PLAYS_DEDUP_WINDOW
+        for key, played_at in list(self.recent.items()):
+            if played_at < cutoff:
+                self.recent.pop(key, None)
+        if not batch:
+            return 0
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for rel_path, (count, last) in batch.items():
+                    row = conn.execute("SELECT total, trend_key FROM plays WHERE rel_path = ?", (rel_path,)).fetchone()
+                    # Alten Score auf "jetzt" abklingen lassen und die neuen Plays addieren
+                    now_units = last / TRENDING_HALF_LIFE
+                    old_score = 2 ** (row[1] - now_units) if row else 0.0
+                    trend_key = math.log2(old_score + count) + now_units
+                    conn.execute("""INSERT INTO plays (rel_path, total, last_played, trend_key) VALUES (?, ?, ?, ?)
+                                    ON CONFLICT(rel_path) DO UPDATE SET
+                                        total = total + excluded.total,
+                                        last_played = MAX(last_played, excluded.last_played),
+                                        trend_key = excluded.trend_key""",
+                                 (rel_path, count, last, trend_key))
+        finally:
+            conn.close()
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("Flushed %s plays for %s tracks", sum(c for c, _ in batch.values()), len(batch))
+        return len(batch)
+
+    def top(self, limit=20, trending=False):
+        """Die meistgespielten bzw. aktuell angesagten Titel als Liste von Dicts."""
+        if not os.path.exists(self.db_path):
+            return []
+        order = "trend_key" if trending else "total"
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT rel_path, total, last_played, trend_key FROM plays "
+                                f"ORDER BY {order} DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
+        now_units = time.time() / TRENDING_HALF_LIFE
+        return [{
+            'rel_path': rel_path,
+            'play_count': total,
+            'last_played': last_played,
+            'trending_score': round(2 ** (trend_key - now_units), 4),
+        } for rel_path, total, last_played, trend_key in rows]
+
+
+PLAY_COUNTER = PlayCounter()
+
+
+def is_play_start(range_header):
+    """Nur der Start eines Streams zählt als Play, nicht jede Byte-Range-Fortsetzung."""
+    if not range_header:
+        return True
+    return range_header.replace(' ', '').startswith('bytes=0-')
+
+
+def count_play(full_path, range_header, client):
+    ext = os.path.splitext(full_path)[1].lower()
+    if ext in IMAGE_EXTENSIONS or not is_play_start(range_header):
+        return
+    PLAY_COUNTER.record(get_relative_path(full_path), client)
+
+
+# -------------------------------
+# Routes (identisch zu PHP)
+# -------------------------------
+def _resolve_media_file(filename):
+    """
+    Löst einen angefragten Dateinamen genau wie serve_file auf.
+    Gibt (media_root, filename, full_path) zurück oder None, wenn die Datei nicht existiert.
+    """
+    # Das:
+    # filename = secure_filename(filename)
+    # machen wir hier nicht wir wollen Dateien zum Streamen
+    # ausliefern. 
+    filename = os.path.normpath(filename)
+    for media_root in MEDIA_DIRS:
+        filename = secure_filename(filename)
+        full_path = os.path.normpath(os.path.join(media_root, filename))
+        # Critical: Ensure the path is within the media_root to prevent directory traversal
+        if not full_path.startswith(os.path.normpath(media_root)):
+            app.logger.warning("Attempted directory traversal: %s outside %s", full_path, media_root)
+            abort(403, "Forbidden")
+        
+        if not os.path.isfile(full_path):
+            continue
+        if is_forbidden(full_path):
+            abort(403, "Forbidden")
+        return media_root, filename, full_path
+    return None
+
 
-# -------------------------------
-# Routes (identisch zu PHP)
-# -------------------------------
 @app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/<path:filename>")
 def serve_file(filename):
     #""" Dateiauslieferung """
     try:
-        # Das:
-        # filename = secure_filename(filename)
-        # machen wir hier nicht wir wollen Dateien zum Streamen
-        # ausliefern. 
-        filename = os.path.normpath(filename)
-        for media_root in MEDIA_DIRS:
-            filename = secure_filename(filename)
-            full_path = os.path.normpath(os.path.join(media_root, filename))
-            # Critical: Ensure the path is within the media_root to prevent directory traversal
-            if not full_path.startswith(os.path.normpath(media_root)):
-                app.logger.warning(f"Attempted directory traversal: {full_path} outside {media_root}")
-                abort(403, "Forbidden")
-            
-            if not os.path.isfile(full_path):
-                continue
-            if is_forbidden(full_path):
-                abort(403, "Forbidden")
+        resolved = _resolve_media_file(filename)
+        if resolved:
+            media_root, filename, full_path = resolved
+            count_play(full_path, request.headers.get('Range'), request.remote_addr)
+            if is_play_start(request.headers.get('Range')):
+                try:
+                    limiter.storage.incr(_open_stream_key(request.view_args.get('filename')), STREAM_CONTINUATION_WINDOW)
+                except Exception as e:
+                    app.logger.debug("Could not mark open stream: %s", e)
             return send_from_directory(media_root, filename)
+    except HTTPException:
+        raise
     except Exception as e:
-        app.logger.error(f"File serve error: {e}")
+        app.logger.error("File serve error: %s", e)
     abort(404)
 
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/relay/<path:mount>")
+def radio_relay(mount):
+    """Leitet einen Radio-Mount über eine gemeinsame Upstream-Verbindung an den Hörer weiter."""
+    if not RADIO_RELAY_ENABLED:
+        abort(404)
+    mount = '/' + mount.lstrip('/')
+    if not _is_known_radio_mount(mount):
+        abort(404, description="Unknown radio mount.")
+    relay = get_radio_relay(mount)
+    return app.response_class(relay.listen(), mimetype=relay.content_type, headers={
+        'Cache-Control': 'no-cache, no-store',
+        'X-Accel-Buffering': 'no'  # nginx soll den Stream nicht puffern
+    })
+
 @app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}", methods=['GET', 'POST'])
 @limiter.limit("100 per minute")
 def playcard():
@@ -941,7 +3688,7 @@ def playcard():
         # 1. Ist es eine YouTube-URL?
         youtube_video_id = is_youtube_url(search_value)
         if youtube_video_id:
-            app.logger.info(f"YouTube URL detected: {search_value}, ID: {youtube_video_id}")
+            app.logger.info("YouTube URL detected: %s, ID: %s", search_value, youtube_video_id, extra=LOG_SAMPLED)
             file_info = {
                 'name': f"YouTube Video: {youtube_video_id}", # Kann später durch echten Titel ersetzt werden
                 'ext': 'youtube', # Spezieller "Typ" für YouTube
@@ -957,7 +3704,7 @@ def playcard():
         # 2. Ist es eine generische HTTP/HTTPS URL, die nicht YouTube ist?
         #    Hier unterscheiden wir: Ist es eine direkte Mediendatei oder eine einzubettende Seite?
         elif is_http(search_value):
-            app.logger.info(f"External URL detected: {search_value}")
+            app.logger.info("External URL detected: %s", search_value, extra=LOG_SAMPLED)
             parsed_url = urllib.parse.urlparse(search_value)
             
             path_basename = os.path.basename(parsed_url.path)
@@ -974,7 +3721,7 @@ def playcard():
                 is_direct_media_url = True
             
             if is_direct_media_url:
-                app.logger.info(f"Direct media URL: {search_value}")
+                app.logger.info("Direct media URL: %s", search_value, extra=LOG_SAMPLED)
                 file_info = {
                     'name': safe_string(title_from_url),
                     'ext': safe_string(ext_from_url),
@@ -988,7 +3735,7 @@ def playcard():
                 return render_player(file_info, request, cover_html)
             else:
                 # Es ist eine HTTP/HTTPS URL, aber keine direkte Mediendatei und kein YouTube -> behandle als iFrame
-                app.logger.info(f"Generic iframe URL: {search_value}")
+                app.logger.info("Generic iframe URL: %s", search_value, extra=LOG_SAMPLED)
                 file_info = {
                     'name': safe_string(search_value),
                     'ext': 'html',
@@ -1044,7 +3791,7 @@ def playcard():
                 )
             else:
                 # Keine Treffer für lokale Suche, dann den Standard-Index anzeigen
-                app.logger.info(f"No local matches found for '{search_value}'. Displaying full index.")
+                app.logger.info("No local matches found for '%s'. Displaying full index.", search_value, extra=LOG_SAMPLED)
 
     # --- Start der Logik für Index-Anzeige und Shuffle-URL ---
     shuffle_track_title = None
@@ -1054,34 +3801,36 @@ def playcard():
 
     # Logik für den Shuffle-Link, basierend auf TEST_RADIO_SHUFFLE_FALLBACK
     if TEST_RADIO_SHUFFLE_FALLBACK:
-        app.logger.info("TEST_RADIO_SHUFFLE_FALLBACK is TRUE: Prioritizing radio stream for shuffle.")
+        app.logger.info("TEST_RADIO_SHUFFLE_FALLBACK is TRUE: Prioritizing radio stream for shuffle.", extra=LOG_SAMPLED)
         if current_radio_status and current_radio_status.get('stream_url'):
             shuffle_track_title = current_radio_status['stream_url']
-            app.logger.info(f"Using radio stream '{shuffle_track_title}' as shuffle target (TEST MODE).")
+            app.logger.info("Using radio stream '%s' as shuffle target (TEST MODE).", shuffle_track_title, extra=LOG_SAMPLED)
         else:
-            app.logger.warning("TEST MODE: No radio stream found for shuffle, falling back to local tracks.")
+            app.logger.warning("TEST MODE: No radio stream found for shuffle, falling back to local tracks.", extra=LOG_SAMPLED)
             music_entries = [entry for entry in MEDIA_INDEX if entry.get('ext') in [ext.lstrip('.') for ext in ALLOWED_EXTENSIONS]]
             if music_entries:
                 random_local_track = random.choice(music_entries)
                 shuffle_track_title = random_local_track['rel_path']
-                app.logger.info(f"Using random local track '{shuffle_track_title}' as shuffle target (TEST MODE, radio failed).")
+                app.logger.info("Using random local track '%s' as shuffle target (TEST MODE, radio failed).",
+                                shuffle_track_title, extra=LOG_SAMPLED)
             else:
-                app.logger.warning("TEST MODE: No local music tracks available either. Shuffle link will be inactive.")
+                app.logger.warning("TEST MODE: No local music tracks available either. Shuffle link will be inactive.",
+                                   extra=LOG_SAMPLED)
     else:
-        app.logger.info("TEST_RADIO_SHUFFLE_FALLBACK is FALSE: Prioritizing local tracks for shuffle.")
+        app.logger.info("TEST_RADIO_SHUFFLE_FALLBACK is FALSE: Prioritizing local tracks for shuffle.", extra=LOG_SAMPLED)
         music_entries = [entry for entry in MEDIA_INDEX if entry.get('ext') in [ext.lstrip('.') for ext in ALLOWED_EXTENSIONS]]
         if music_entries:
             random_local_track = random.choice(music_entries)
             shuffle_track_title = random_local_track['rel_path']
-            app.logger.info(f"Using random local track '{shuffle_track_title}' as shuffle target.")
+            app.logger.info("Using random local track '%s' as shuffle target.", shuffle_track_title, extra=LOG_SAMPLED)
         else:
             # Wenn keine lokalen Tracks, versuchen, einen Radio-Stream zu bekommen
-            app.logger.info("No local music tracks found. Attempting to get radio stream for shuffle fallback.")
+            app.logger.info("No local music tracks found. Attempting to get radio stream for shuffle fallback.", extra=LOG_SAMPLED)
             if current_radio_status and current_radio_status.get('stream_url'):
                 shuffle_track_title = current_radio_status['stream_url']
-                app.logger.info(f"Using radio stream '{shuffle_track_title}' as shuffle fallback.")
+                app.logger.info("Using radio stream '%s' as shuffle fallback.", shuffle_track_title, extra=LOG_SAMPLED)
             else:
-                app.logger.warning("No radio streams found for shuffle fallback.")
+                app.logger.warning("No radio streams found for shuffle fallback.", extra=LOG_SAMPLED)
 
     # Generiere den Shuffle-Link, falls ein Titel gefunden wurde
     shuffle_url = "#"
@@ -1119,22 +3868,183 @@ def api_redirect():
 # -------------------------------
 
 
+# -------------------------------
+# Antwortformate der API (Content Negotiation)
+# -------------------------------
+API_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'msgpack': 'application/msgpack',
+    'cbor': 'application/cbor',
+}
+
+
+def _api_format():
+    """Format aus format=... oder dem Accept-Header; JSON bleibt der Standard."""
+    available = ['json', 'ndjson'] + (['msgpack'] if msgpack else []) + (['cbor'] if cbor2 else [])
+    requested = request.args.get('format', '').lower()
+    if requested in available:
+        return requested
+    offered = [API_FORMATS[name] for name in available]
+    if msgpack:
+        offered.append('application/x-msgpack')  # Älterer, verbreiteter MIME-Typ
+    best = request.accept_mimetypes.best_match(offered, default=API_FORMATS['json'])
+    return 'msgpack' if best == 'application/x-msgpack' else next(k for k, v in API_FORMATS.items() if v == best)
+
+
+def _cbor_head(major, length):
+    """CBOR-Kopf (RFC 8949) für ein Array (4) oder eine Map (5) der Länge length."""
+    if length < 24:
+        return bytes([major << 5 | length])
+    for info, fmt in ((24, '>B'), (25, '>H'), (26, '>I'), (27, '>Q')):
+        if length < 1 << (8 * struct.calcsize(fmt)):
+            return bytes([major << 5 | info]) + struct.pack(fmt, length)
+
+
+def _binary_encoder(api_format):
+    """(Array-Kopf, Map-Kopf, Wert) für MessagePack bzw. CBOR"""
+    if api_format == 'msgpack':
+        packer = msgpack.Packer()
+        return packer.pack_array_header, packer.pack_map_header, packer.pack
+    return (lambda n: _cbor_head(4, n)), (lambda n: _cbor_head(5, n)), cbor2.dumps
+
+
+class LazyRecords:
+    """
+    Datensätze, die erst beim Senden formatiert werden: einzeln mit format_item oder in Blöcken
+    von API_RECORD_BATCH mit format_batch (Liste rein, Liste gleicher Länge raus). Die Anzahl
+    steht vorher fest (MessagePack und CBOR schreiben sie in den Array-Kopf), die Formatierer
+    dürfen also nichts auslassen.
+    """
+
+    def __init__(self, items, format_item=None, format_batch=None):
+        self.items = items
+        self.format_item = format_item
+        self.format_batch = format_batch
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        if self.format_batch is None:
+            return (self.format_item(item) for item in self.items)
+        return (record for start in range(0, len(self.items), API_RECORD_BATCH)
+                for record in self.format_batch(self.items[start:start + API_RECORD_BATCH]))
+
+
+def _materialize(obj):
+    """LazyRecords (auch verschachtelt in Dicts) zu Listen auflösen, für jsonify."""
+    if isinstance(obj, LazyRecords):
+        return [_materialize(item) for item in obj]
+    if isinstance(obj, dict):
+        return {key: _materialize(value) for key, value in obj.items()}
+    return obj
+
+
+def _binary_chunks(encoder, obj, depth=4):
+    """Kodiert die äußeren Ebenen (Listen, Dicts) Element für Element, tiefere am Stück."""
+    array_header, map_header, pack = encoder
+    if isinstance(obj, LazyRecords) and not depth:
+        obj = _materialize(obj)
+    if depth and isinstance(obj, (list, LazyRecords)):
+        yield array_header(len(obj))
+        for item in obj:
+            yield from _binary_chunks(encoder, item, depth - 1)
+    elif depth and isinstance(obj, dict):
+        yield map_header(len(obj))
+        for key, value in obj.items():
+            yield pack(key)
+            yield from _binary_chunks(encoder, value, depth - 1)
+    else:
+        yield pack(obj)
+
+
+def _buffered(chunks, size=API_STREAM_BUFFER):
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def api_response(payload, records=None):
+    """
+    API-Antwort im ausgehandelten Format. JSON (Standard) wie bisher über jsonify. NDJSON streamt
+    eine Zeile pro Datensatz: die Elemente einer Liste bzw. von payload[records] (davor eine Zeile
+    mit dem übrigen Umschlag, z.B. "building"), sonst das Objekt als eine Zeile. MessagePack und
+    CBOR haben dieselbe Struktur wie JSON und werden Element für Element kodiert und gestreamt.
+    Listen dürfen LazyRecords sein; die gestreamten Formate formatieren dann erst beim Senden,
+    sodass nie alle formatierten Datensätze gleichzeitig im Speicher liegen.
+    """
+    api_format = _api_format()
+    if api_format == 'json':
+        response = jsonify(_materialize(payload))
+    elif api_format == 'ndjson':
+        if isinstance(payload, (list, LazyRecords)):
+            items = payload
+        elif records and isinstance(payload.get(records), (list, LazyRecords)):
+            envelope = {key: value for key, value in payload.items() if key != records}
+            items = itertools.chain([envelope], payload[records])
+        else:
+            items = [payload]
+        lines = ((app.json.dumps(_materialize(item)) + "\n").encode('utf-8') for item in items)
+        response = app.response_class(stream_with_context(_buffered(lines)), mimetype=API_FORMATS['ndjson'])
+    else:
+        chunks = _binary_chunks(_binary_encoder(api_format), payload)
+        response = app.response_class(stream_with_context(_buffered(chunks)), mimetype=API_FORMATS[api_format])
+    response.vary.add('Accept')
+    return response
+
+
+def find_index_entry(rel_path):
+    """MEDIA_INDEX-Eintrag zu einem relativen Pfad (auch über 'alternates' von Duplikaten)."""
+    with INDEX_LOCK:
+        # Duplikat aus einem anderen MEDIA_DIR? Dann den kanonischen Eintrag liefern
+        return MEDIA_BY_REL_PATH.get(rel_path) or MEDIA_ALTERNATES.get(rel_path)
+
+
 def _format_song_for_json(file_info):
     """
     Formatiert die Details eines Songs für die JSON-API-Antwort,
     inklusive der Erzeugung externer URLs und der Suche nach Cover-Bildern.
     """
-    if not file_info:
-        return None
+    return _format_songs_for_json([file_info])[0]
+
+
+def _format_songs_for_json(file_infos):
+    """
+    Wie _format_song_for_json für eine Liste, mit einer Cache-Abfrage für alle Songs statt
+    einer pro Song. Die Ergebnisliste hat dieselbe Reihenfolge, unbrauchbare Einträge sind None.
+    """
+    rel_paths = []
+    for file_info in file_infos:
+        # Überprüfen, ob 'rel_path' vorhanden ist. Wenn nicht, versuchen wir 'path' zu verwenden.
+        rel_path_to_use = (file_info.get('rel_path') or file_info.get('path')) if file_info else None
+        if file_info and not rel_path_to_use:
+            app.logger.warning("[_format_song_for_json] Missing 'rel_path' and 'path' in file_info: %s", file_info, extra=LOG_SAMPLED)
+        rel_paths.append(rel_path_to_use)
+    valid = [i for i, rel_path in enumerate(rel_paths) if rel_path]
+
+    # Cover-Suche und URLs hängen nur vom Index und vom Host ab und werden gecacht;
+    # die Lautheit kommt jedes Mal frisch dazu, weil die Analyse im Hintergrund fertig werden kann.
+    cache_keys = [[request.host_url, rel_paths[i], file_infos[i].get('name', ''), file_infos[i].get('ext', '')]
+                  for i in valid]
+    songs = RESPONSE_CACHE.get_many('song', cache_keys,
+                                    lambda n: _format_song_base(file_infos[valid[n]], rel_paths[valid[n]]))
+    formatted = [None] * len(file_infos)
+    for i, song in zip(valid, songs):
+        formatted[i] = {
+            **song,
+            **get_loudness_fields(file_infos[i]),  # Lautheit aus der Hintergrund-Analyse (oder None)
+            **get_video_fields(file_infos[i])  # Posterframe ersetzt bei Videos das Standard-Cover
+        }
+    return formatted
 
-    # Überprüfen, ob 'rel_path' vorhanden ist. Wenn nicht, versuchen wir 'path' zu verwenden.
-    rel_path_to_use = file_info.get('rel_path')
-    if not rel_path_to_use:
-        rel_path_to_use = file_info.get('path') 
-        if not rel_path_to_use:
-            app.logger.warning(f"[_format_song_for_json] Missing 'rel_path' and 'path' in file_info: {file_info}")
-            return None
 
+def _format_song_base(file_info, rel_path_to_use):
     stream_url = url_for('serve_file', filename=rel_path_to_use, _external=True)
 
     cover_url = None
@@ -1172,26 +4082,81 @@ def api_root():
              "url": url_for('get_index_json', structured=1, _external=True),
              "parameters": {"structured": "1", "search": "Optional search term"}
          },
+         "tree": {
+             "description": "Browse the folder tree lazily: immediate subfolders (with counts and sizes) and files of one folder.",
+             "url": url_for('get_tree_json', path="", _external=True),
+             "parameters": {"path": "Relative folder path (empty for the root)"}
+         },
          "random_track": {
              "description": "Get details for a random media track.",
              "url": url_for('get_random_track_json', _external=True),
-             "parameters": {}
+             "parameters": {"after": "Optional relative path; picks among the tracks most similar to it"}
          },
          "track_info": {
              "description": "Get detailed information for a specific track by its relative path.",
              "url": url_for('get_track_info_json', title="<relative_path_to_track>", _external=True),
              "parameters": {"title": "Relative path of the track"}
          },
+         "peaks": {
+             "description": "Get a downsampled waveform (peak amplitudes) for a track.",
+             "url": url_for('get_peaks', title="<relative_path_to_track>", _external=True),
+             "parameters": {"title": "Relative path of the track", "buckets": f"Number of values (default {PEAKS_DEFAULT_BUCKETS})", "format": "json (default) or binary"}
+         },
+         "video_thumbnail": {
+             "description": "Get the poster frame or scrub sprite sheet of a video (202 while it is being generated).",
+             "url": url_for('get_video_thumbnail', title="<relative_path_to_video>", _external=True),
+             "parameters": {"title": "Relative path of the video", "kind": "poster (default) or sprite"}
+         },
+         "up_next": {
+             "description": "Get the tracks most similar to a track (folder, name, artist, duration, loudness).",
+             "url": url_for('get_up_next_json', title="<relative_path_to_track>", _external=True),
+             "parameters": {"title": "Relative path of the track", "count": f"Number of tracks (default {RECOMMEND_DEFAULT}, max {RECOMMEND_MAX})", "exclude": "Relative path to skip (repeatable)"}
+         },
+         "playlist": {
+             "description": "Stream an M3U8 or XSPF playlist for a folder, a search result or a random selection.",
+             "url": url_for('get_playlist', folder="<relative_folder>", _external=True),
+             "parameters": {"folder": "Relative folder", "search": "Search term", "shuffle": f"Number of random tracks (max {PLAYLIST_MAX_SHUFFLE})", "format": "m3u8 (default) or xspf"}
+         },
+         "folder_zip": {
+             "description": "Download a folder as an uncompressed ZIP, streamed with a known Content-Length.",
+             "url": url_for('get_folder_zip', path="<relative_folder>", _external=True),
+             "parameters": {"path": "Relative folder", "recursive": "1 to include subfolders"}
+         },
+         "top_tracks": {
+             "description": "Get the most played tracks.",
+             "url": url_for('get_top_tracks_json', _external=True),
+             "parameters": {"limit": "Number of tracks (default 20, max 100)"}
+         },
+         "trending_tracks": {
+             "description": "Get currently trending tracks (time-decayed play counts).",
+             "url": url_for('get_trending_tracks_json', _external=True),
+             "parameters": {"limit": "Number of tracks (default 20, max 100)"}
+         },
          "radio_status": {
              "description": "Get current status (listeners, now playing) of the radio stream.",
              "url": url_for('get_radio_status_json', _external=True),
              "parameters": {}
+         },
+         "radio_events": {
+             "description": "Server-Sent Events stream that pushes now-playing changes (event 'nowplaying').",
+             "url": url_for('get_radio_events', _external=True),
+             "parameters": {}
+         },
+         "radio_relay": {
+             "description": "Listen to a radio mount through the local single-upstream relay (if enabled).",
+             "url": url_for('radio_relay', mount="<mount_point>", _external=True),
+             "parameters": {}
          }
      }
      return jsonify({
          "status": "success",
          "message": "Welcome to the Playcard  API! Below are the available endpoints.",
-         "available_endpoints": api_endpoints
+         "available_endpoints": api_endpoints,
+         "response_formats": {
+             "description": "Index, tree, track, up-next, ranking and radio endpoints honour the Accept header or format=.",
+             "formats": {name: API_FORMATS[name] for name in API_FORMATS
+                         if name in ('json', 'ndjson') or (msgpack if name == 'msgpack' else cbor2)}
+         }
      })
 
 @app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/index")
@@ -1201,28 +4166,28 @@ def get_index_json():
     structured = request.args.get('structured', '1') == '1'
     search_value = request.args.get("search", "").strip()
 
-    all_songs_to_return = [] 
+    # Die Songs werden erst beim Senden blockweise formatiert (LazyRecords), vorab wird nur
+    # ausgesiebt, was _format_song_for_json ohnehin verwerfen würde
+    def usable(files):
+        return [f for f in files if f and (f.get('rel_path') or f.get('path'))]
 
+    def format_folders(folders):
+        # Eine Cache-Abfrage für alle Songs eines Blocks von Ordnern
+        songs = iter(_format_songs_for_json([f for _, files in folders for f in files]))
+        return [{"folder_name": name, "files": list(itertools.islice(songs, len(files)))}
+                for name, files in folders]
 
     if structured:
         raw_data = generate_index(structured=True)
         if search_value:
             raw_data = filter_folder_map(raw_data, search_value)
 
-        formatted_structured_data = []
-        for folder_name, files in raw_data.items():
-            formatted_files_in_folder = []
-            for file_info in files:
-                formatted_song = _format_song_for_json(file_info)
-                if formatted_song:
-                    formatted_files_in_folder.append(formatted_song)
-                    all_songs_to_return.append(formatted_song) 
-            formatted_structured_data.append({"folder_name": folder_name, "files": formatted_files_in_folder})
-
-        return jsonify({
+        return api_response({
             "type": "structured",
-            "data": formatted_structured_data
-        })
+            "building": not INDEX_STATUS['complete'],
+            "data": LazyRecords([(name, usable(files)) for name, files in raw_data.items()],
+                                format_batch=format_folders)
+        }, records='data')
 
 
     else: # Dies ist der "flache" View, der die Flutter-App bevorzugen sollte
@@ -1232,13 +4197,46 @@ def get_index_json():
                 e for e in raw_entries 
                 if search_value.lower() in e['name'].lower() 
             ]
-        
-        for entry in raw_entries:
-            formatted_song = _format_song_for_json(entry)
-            if formatted_song:
-                all_songs_to_return.append(formatted_song)
 
-        return jsonify(all_songs_to_return)
+        return api_response(LazyRecords(usable(raw_entries), format_batch=_format_songs_for_json))
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/tree")
+@limiter.limit("100 per minute")
+def get_tree_json():
+    """
+    Gibt nur die direkten Kinder eines Ordners zurück (Unterordner mit Zählern und
+    Gesamtgröße, Dateien im Format von /api/index), damit Clients tiefe Bibliotheken
+    schrittweise laden können.
+    """
+    path = request.args.get('path', '').strip().strip('/')
+    with INDEX_LOCK:
+        node = MEDIA_TREE.get(path)
+        if node is None and not path:
+            node = _tree_node('')  # Index wird noch aufgebaut: leere Wurzel statt 404
+        if node is None:
+            return jsonify({"status": "error", "message": "Folder not found."}), 404
+        folders = [MEDIA_TREE[child] for child in node['folders']]
+        files = list(node['files'])
+
+    return api_response({
+        "name": node['name'],
+        "path": node['path'],
+        "parent": os.path.dirname(node['path']) if node['path'] else None,
+        "building": not INDEX_STATUS['complete'],
+        "total_files": node['total_files'],
+        "total_size": node['total_size'],
+        "folders": [{
+            "name": folder['name'],
+            "path": folder['path'],
+            "folder_count": len(folder['folders']),
+            "file_count": len(folder['files']),
+            "total_files": folder['total_files'],
+            "total_size": folder['total_size'],
+            "url": url_for('get_tree_json', path=folder['path'], _external=True)
+        } for folder in folders],
+        "files": [song for song in _format_songs_for_json(files) if song]
+    })
 
 
 @app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/track_info")
@@ -1249,8 +4247,7 @@ def get_track_info_json():
     if not rel_path:
         abort(400, description="Relative path (title) parameter is required.")
 
-    with INDEX_LOCK:
-        track_info = next((entry for entry in MEDIA_INDEX if entry.get('rel_path') == rel_path), None)
+    track_info = find_index_entry(rel_path)
 
     if not track_info:
         abort(404, description="Track not found.")
@@ -1260,7 +4257,495 @@ def get_track_info_json():
     if not formatted_track:
         abort(500, description="Failed to format track information.")
 
-    return jsonify(formatted_track)
+    return api_response(formatted_track)
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/peaks")
+@limiter.limit("100 per minute")
+def get_peaks():
+    """
+    Wellenform für die Seek-Bar: N Spitzenwerte pro Titel, als JSON (0..1) oder binär
+    (format=binary, ein Byte pro Bucket). Wird im Hintergrund berechnet; bis dahin 202.
+    """
+    rel_path = request.args.get('title')
+    if not rel_path:
+        abort(400, description="Relative path (title) parameter is required.")
+    entry = find_index_entry(rel_path)
+    if not entry or (f".{entry['ext']}" not in MUSIC_EXTENSIONS and f".{entry['ext']}" not in VIDEO_EXTENSIONS):
+        abort(404, description="Track not found.")
+    if not FFMPEG_BIN:
+        abort(501, description="Waveform analysis is not available (ffmpeg missing).")
+
+    state, value = PEAKS_ANALYZER.lookup(entry)
+    if state == 'pending':
+        response = jsonify({"status": "pending", "message": "Waveform is being computed, retry shortly."})
+        response.status_code = 202
+        response.headers['Retry-After'] = '5'
+        return response
+    if state == 'failed':
+        abort(422, description="Waveform could not be computed for this file.")
+
+    buckets = max(1, min(request.args.get('buckets', PEAKS_DEFAULT_BUCKETS, type=int), PEAKS_MAX_BUCKETS))
+    peaks = downsample_peaks(base64.b64decode(value['peaks']), buckets)
+    if request.args.get('format') == 'binary':
+        response = app.response_class(peaks, mimetype='application/octet-stream')
+        response.headers['X-Peaks-Duration'] = str(value['duration'])
+    else:
+        response = jsonify({
+            "status": "success",
+            "duration": value['duration'],
+            "buckets": buckets,
+            "peaks": [round(p / 255, 3) for p in peaks]
+        })
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/video_thumbnail")
+def get_video_thumbnail():
+    """
+    Posterframe (kind=poster, Standard) oder Sprite-Sheet (kind=sprite) eines Videos.
+    Wird im Hintergrund erzeugt; bis dahin 202. Die URLs aus der Track-API enthalten
+    eine Version (v), die Bilder dürfen daher lange gecacht werden.
+    """
+    rel_path = request.args.get('title')
+    if not rel_path:
+        abort(400, description="Relative path (title) parameter is required.")
+    entry = find_index_entry(rel_path)
+    if not entry or f".{entry['ext']}" not in VIDEO_EXTENSIONS:
+        abort(404, description="Video not found.")
+    if not (FFMPEG_BIN and VIDEO_THUMBNAILS):
+        abort(501, description="Video thumbnails are not available (ffmpeg missing or disabled).")
+
+    state, value = VIDEO_ANALYZER.lookup(entry)
+    if state == 'ready' and not _video_thumbnails_exist(value):
+        # Bilder wurden gelöscht (z.B. THUMBNAIL_DIR aufgeräumt): neu erzeugen statt dauerhaft 404
+        state, value = VIDEO_ANALYZER.invalidate(entry)
+    if state == 'pending':
+        response = jsonify({"status": "pending", "message": "Thumbnails are being generated, retry shortly."})
+        response.status_code = 202
+        response.headers['Retry-After'] = '10'
+        return response
+    if state == 'failed':
+        abort(422, description="Thumbnails could not be generated for this file.")
+
+    name = value['sprite'] if request.args.get('kind') == 'sprite' else value['poster']
+    return send_from_directory(THUMBNAIL_DIR, name, mimetype='image/jpeg', max_age=86400 * 30)
+
+
+# -------------------------------
+# Playlists (M3U8 / XSPF, gestreamt)
+# -------------------------------
+def _playlist_entries(folder=None, search=None, shuffle=0):
+    """Lazy Auswahl aus der sortierten Index-Ansicht: Ordner, Suchtreffer oder Zufallsauswahl."""
+    if shuffle:
+        music_entries = [entry for entry in MEDIA_INDEX if entry.get('ext') in [ext.lstrip('.') for ext in ALLOWED_EXTENSIONS]]
+        yield from random.sample(music_entries, min(shuffle, len(music_entries)))
+    elif folder is not None:
+        yield from generate_index(structured=True).get(folder, [])
+    else:
+        search_lower = (search or '').lower()
+        for entry in generate_index(structured=False):
+            if search_lower in entry['name'].lower():
+                yield entry
+
+
+def _m3u8_lines(title, entries):
+    yield "#EXTM3U\n"
+    yield f"#PLAYLIST:{title}\n"
+    for entry in entries:
+        name = entry['name'].replace('\n', ' ')
+        yield f"#EXTINF:-1,{os.path.splitext(name)[0]}\n"
+        yield url_for('serve_file', filename=entry['rel_path'], _external=True) + "\n"
+
+
+def _xspf_lines(title, entries):
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<playlist version="1" xmlns="http://xspf.org/ns/0/">\n'
+    yield f"  <title>{html.escape(title)}</title>\n  <trackList>\n"
+    for entry in entries:
+        location = html.escape(url_for('serve_file', filename=entry['rel_path'], _external=True))
+        name = html.escape(os.path.splitext(entry['name'])[0])
+        yield f"    <track><location>{location}</location><title>{name}</title></track>\n"
+    yield "  </trackList>\n</playlist>\n"
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/playlist")
+@limiter.limit("30 per minute")
+def get_playlist():
+    """
+    Playlist für externe Player (VLC, mpv, ...) als M3U8 (Standard) oder XSPF.
+    Auswahl per folder=<relativer Ordner>, search=<Begriff> oder shuffle=<Anzahl>.
+    Die Playlist wird zeilenweise gestreamt, nicht im Speicher aufgebaut.
+    """
+    folder = request.args.get('folder')
+    search = request.args.get('search', '').strip()
+    shuffle = max(0, min(request.args.get('shuffle', 0, type=int), PLAYLIST_MAX_SHUFFLE))
+    playlist_format = request.args.get('format', 'm3u8').lower()
+    if folder is None and not search and not shuffle:
+        abort(400, description="One of folder, search or shuffle is required.")
+
+    # Gleiche Vorrangfolge wie _playlist_entries; folder='' ist der Wurzelordner, nicht "kein Ordner"
+    if shuffle:
+        label = 'Shuffle'
+    elif folder is not None:
+        label = folder or '/'
+    else:
+        label = search
+    title = f"Playcard - {label}"
+    entries = _playlist_entries(folder=folder, search=search, shuffle=shuffle)
+    if playlist_format == 'xspf':
+        lines, mimetype, extension = _xspf_lines(title, entries), 'application/xspf+xml', 'xspf'
+    else:
+        lines, mimetype, extension = _m3u8_lines(title, entries), 'audio/x-mpegurl', 'm3u8'
+    filename = secure_filename(label.lower() if shuffle else label) or 'playlist'
+    return app.response_class(stream_with_context(lines), mimetype=mimetype, headers={
+        'Content-Disposition': f'inline; filename="{filename}.{extension}"'
+    })
+
+
+# -------------------------------
+# Empfehlungen ("Up next"): Feature-Hashing und Kosinus-Ähnlichkeit
+# -------------------------------
+def _feature_tokens(entry):
+    """Gewichtete Tokens eines Titels: Ordner, Ordner- und Dateinamenswörter, Interpret aus "Interpret - Titel"."""
+    rel_dir = os.path.dirname(entry['rel_path']).lower()
+    tokens = [(f"dir:{rel_dir}", 3.0), (f"ext:{entry['ext']}", 0.5)]
+    for part in filter(None, rel_dir.split('/')):
+        tokens.append((f"folder:{part}", 1.0))
+        tokens.extend((f"word:{word}", 0.5) for word in re.findall(r'[^\W\d_]{2,}', part))
+    base = entry['base'].lower()
+    tokens.extend((f"word:{word}", 1.0) for word in re.findall(r'[^\W\d_]{2,}', base))
+    if ' - ' in base:
+        tokens.append((f"artist:{base.split(' - ', 1)[0].strip()}", 2.0))
+    return tokens
+
+
+def _numeric_features(entry, durations):
+    """
+    Laufzeit (log, um 4 Minuten zentriert) und Lautheit (um -14 LUFS), sofern schon analysiert,
+    sonst 0. durations: Laufzeiten aus dem Wellenform-Cache (path -> Sekunden).
+    """
+    duration = durations.get(entry['path'])
+    lufs = None
+    hit = PEAKS_ANALYZER.results.get(entry['path'])
+    if hit and not hit[1].get('failed'):
+        duration = hit[1].get('duration') or duration
+    hit = LOUDNESS_ANALYZER.results.get(entry['path'])
+    if hit and not hit[1].get('failed'):
+        lufs = hit[1].get('lufs')
+    return (math.log(duration / 240) * RECOMMEND_NUMERIC_WEIGHT if duration else 0.0,
+            (lufs + 14) / 10 * RECOMMEND_NUMERIC_WEIGHT if lufs is not None else 0.0)
+
+
+class Recommender:
+    """
+    Normierte float32-Matrix (Titel x Merkmale) über alle abspielbaren Titel. Tokens werden per
+    Feature-Hashing mit Vorzeichen auf RECOMMEND_DIMENSIONS Spalten verteilt (Kollisionen heben sich
+    im Mittel auf). Laufzeit und Lautheit liegen in einer kleinen eigenen Matrix samt Normierung,
+    damit refresh_numeric() sie nach den Analysen austauschen kann, ohne die (im Preload-Modus
+    geteilte) Token-Matrix anzufassen. Eine Anfrage ist ein Matrix-Vektor-Produkt plus
+    argpartition, also Millisekunden auch bei 500k Titeln.
+    """
+
+    def __init__(self, entries, generation):
+        allowed = {ext[1:] for ext in ALLOWED_EXTENSIONS}
+        self.generation = generation
+        self.entries = [entry for entry in entries if entry['ext'] in allowed]
+        self.row_by_rel_path = {entry['rel_path']: row for row, entry in enumerate(self.entries)}
+        columns = {}  # Token -> (Spalte, Vorzeichen); Ordner-Tokens wiederholen sich ständig
+        rows, cols, values = array('q'), array('q'), array('f')
+        for row, entry in enumerate(self.entries):
+            for token, weight in _feature_tokens(entry):
+                column = columns.get(token)
+                if column is None:
+                    h = zlib.crc32(token.encode('utf-8', 'surrogatepass'))
+                    column = columns[token] = (h % RECOMMEND_DIMENSIONS, 1.0 if h & 0x80000000 else -1.0)
+                rows.append(row)
+                cols.append(column[0])
+                values.append(weight * column[1])
+        matrix = np.zeros((len(self.entries), RECOMMEND_DIMENSIONS), dtype=np.float32)
+        np.add.at(matrix, (np.frombuffer(rows, dtype=np.int64), np.frombuffer(cols, dtype=np.int64)),
+                  np.frombuffer(values, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.has_tokens = (norms[:, 0] > 0).astype(np.float32)  # Token-Anteil hat danach Länge 1 oder 0
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        self.matrix = matrix
+        self.refresh_numeric()
+
+    def refresh_numeric(self):
+        """Laufzeit- und Lautheitsspalten aus den inzwischen vorliegenden Analysen neu setzen."""
+        stamps = {entry['path']: PersistentCache.file_stamp(entry) for entry in self.entries}
+        try:
+            durations = PEAKS_ANALYZER.cache.get_field_many(stamps, 'duration')
+        except sqlite3.Error as e:
+            app.logger.warning("Could not read durations for recommendations: %s", e)
+            durations = {}
+        numeric = np.array([_numeric_features(entry, durations) for entry in self.entries],
+                           dtype=np.float32).reshape(len(self.entries), 2)
+        scale = 1.0 / np.sqrt(self.has_tokens + np.einsum('ij,ij->i', numeric, numeric))
+        scale[~np.isfinite(scale)] = 0.0
+        self.numeric = (numeric, scale)  # Ein Tupel, damit parallele Anfragen nie halb getauschte Werte sehen
+
+    def similar(self, rel_path, count, exclude=()):
+        """Die count ähnlichsten Titel als [(Eintrag, Kosinus)], None wenn rel_path kein abspielbarer Titel ist."""
+        row = self.row_by_rel_path.get(rel_path)
+        if row is None:
+            return None
+        numeric, scale = self.numeric
+        scores = self.matrix @ self.matrix[row]
+        scores += numeric @ numeric[row]
+        scores *= scale * scale[row]
+        scores[row] = -np.inf
+        for excluded in exclude:
+            excluded_row = self.row_by_rel_path.get(excluded)
+            if excluded_row is not None:
+                scores[excluded_row] = -np.inf
+        count = min(count, len(self.entries) - 1)
+        if count <= 0:
+            return []
+        top = np.argpartition(scores, -count)[-count:]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.entries[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+
+RECOMMENDER = None
+RECOMMENDER_LOCK = Lock()
+_RECOMMENDER_TASKS = {'rebuild': None, 'refresh': None}  # Laufende Hintergrund-Threads
+
+
+def build_recommender():
+    """Baut den Recommender zur aktuellen Index-Generation (blockierend, nicht im Request aufrufen)."""
+    global RECOMMENDER
+    if np is None:
+        return None
+    with INDEX_LOCK:
+        entries, generation = MEDIA_INDEX, INDEX_GENERATION
+    recommender = Recommender(entries, generation)
+    with RECOMMENDER_LOCK:
+        RECOMMENDER = recommender
+        _RECOMMENDER_TASKS['rebuild'] = None
+    return recommender
+
+
+def get_recommender():
+    """
+    Aktueller Recommender, None ohne NumPy oder solange es noch keinen gibt. Hat sich der Index
+    geändert (Upload, Store-Sync), wird im Hintergrund neu gebaut; bis dahin gilt der bisherige.
+    """
+    if np is None:
+        return None
+    with INDEX_LOCK:
+        generation = INDEX_GENERATION
+    with RECOMMENDER_LOCK:
+        recommender = RECOMMENDER
+        if (recommender is None or recommender.generation != generation) and _RECOMMENDER_TASKS['rebuild'] is None:
+            thread = _RECOMMENDER_TASKS['rebuild'] = Thread(target=build_recommender, name="recommender", daemon=True)
+            thread.start()
+    return recommender
+
+
+def _refresh_recommender():
+    with RECOMMENDER_LOCK:
+        _RECOMMENDER_TASKS['refresh'] = None
+        recommender = RECOMMENDER
+    if recommender is not None:
+        recommender.refresh_numeric()
+
+
+def schedule_recommender_refresh():
+    """Nach neuen Lautheits-/Wellenform-Ergebnissen: Laufzeit und Lautheit gesammelt nachziehen."""
+    if np is None:
+        return
+    with RECOMMENDER_LOCK:
+        if _RECOMMENDER_TASKS['refresh'] is None:
+            timer = _RECOMMENDER_TASKS['refresh'] = Timer(RECOMMEND_REFRESH_DELAY, _refresh_recommender)
+            timer.daemon = True
+            timer.start()
+
+
+LOUDNESS_ANALYZER.on_update = PEAKS_ANALYZER.on_update = schedule_recommender_refresh
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/up_next")
+@limiter.limit("60 per minute")
+def get_up_next_json():
+    """
+    Die N ähnlichsten Titel zu title (Ordner, Namen, Interpret, Laufzeit, Lautheit), ohne die
+    per exclude übergebenen (z.B. zuletzt gespielten). Ohne NumPy: Zufallsauswahl.
+    """
+    rel_path = request.args.get('title')
+    if not rel_path:
+        abort(400, description="Relative path (title) parameter is required.")
+    entry = find_index_entry(rel_path)
+    if not entry:
+        abort(404, description="Track not found.")
+    count = max(1, min(request.args.get('count', RECOMMEND_DEFAULT, type=int), RECOMMEND_MAX))
+    exclude = set(request.args.getlist('exclude'))
+
+    recommender = get_recommender()
+    similar = recommender.similar(entry['rel_path'], count, exclude) if recommender else None
+    method = 'similarity'
+    if similar is None:
+        method = 'random'
+        allowed = [ext.lstrip('.') for ext in ALLOWED_EXTENSIONS]
+        pool = [e for e in MEDIA_INDEX if e.get('ext') in allowed
+                and e['rel_path'] != entry['rel_path'] and e['rel_path'] not in exclude]
+        similar = [(e, None) for e in random.sample(pool, min(count, len(pool)))]
+
+    tracks = []
+    songs = _format_songs_for_json([candidate for candidate, _ in similar])
+    for song, (_, score) in zip(songs, similar):
+        if song:
+            tracks.append({**song, "similarity": round(score, 4) if score is not None else None})
+    return api_response({"status": "success", "method": method, "title": entry['rel_path'], "tracks": tracks},
+                        records='tracks')
+
+
+# -------------------------------
+# Ordner-Download als ZIP
+# -------------------------------
+ZIP64_LIMIT = 0xFFFFFFFF
+
+
+def _dos_datetime(mtime):
+    t = time.localtime(max(mtime, 315619200))  # DOS-Zeit beginnt 1980
+    return (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday, t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+
+
+class StoredZip:
+    """
+    ZIP ohne Kompression, direkt von der Platte gestreamt. Gespeicherte Einträge sind genau so
+    groß wie die Datei, die Gesamtlänge steht also vorab fest (Content-Length); die CRC wird
+    beim Lesen berechnet und im Data Descriptor nachgereicht. Einträge oder Archive ab 4 GiB
+    (bzw. 65535 Einträgen) werden als Zip64 geschrieben.
+    """
+
+    def __init__(self, members):
+        # members: (Name im Archiv, absoluter Pfad, Größe, mtime)
+        self.members = []
+        offset = 0
+        for arcname, path, size, mtime in members:
+            member = {'name': arcname.encode('utf-8', 'replace'), 'path': path, 'size': size,
+                      'mtime': mtime, 'offset': offset, 'zip64': size >= ZIP64_LIMIT, 'crc': 0}
+            offset += (30 + len(member['name']) + (20 if member['zip64'] else 0)
+                       + size + (24 if member['zip64'] else 16))
+            self.members.append(member)
+        self.central_offset = offset
+        self.central_size = sum(46 + len(m['name']) + len(self._central_extra(m)) for m in self.members)
+        self.zip64_end = (len(self.members) >= 0xFFFF or self.central_offset >= ZIP64_LIMIT
+                          or self.central_size >= ZIP64_LIMIT)
+        self.length = self.central_offset + self.central_size + (56 + 20 if self.zip64_end else 0) + 22
+
+    @staticmethod
+    def _central_extra(member):
+        fields = []
+        if member['zip64']:
+            fields += [member['size'], member['size']]
+        if member['offset'] >= ZIP64_LIMIT:
+            fields.append(member['offset'])
+        if not fields:
+            return b''
+        return struct.pack(f'<HH{len(fields)}Q', 0x0001, 8 * len(fields), *fields)
+
+    def _local_header(self, member):
+        date, dos_time = _dos_datetime(member['mtime'])
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if member['zip64'] else b''
+        size = ZIP64_LIMIT if member['zip64'] else 0
+        # Bit 3: CRC und Größen folgen im Data Descriptor, Bit 11: Namen in UTF-8
+        return struct.pack('<IHHHHHIIIHH', 0x04034b50, 45 if member['zip64'] else 20, 0x0808, 0,
+                           dos_time, date, 0, size, size, len(member['name']), len(extra)) + member['name'] + extra
+
+    def _central_header(self, member):
+        date, dos_time = _dos_datetime(member['mtime'])
+        extra = self._central_extra(member)
+        size = ZIP64_LIMIT if member['zip64'] else member['size']
+        version = 45 if extra else 20
+        return struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, 3 << 8 | version, version, 0x0808, 0,
+                           dos_time, date, member['crc'], size, size, len(member['name']), len(extra),
+                           0, 0, 0, 0o100644 << 16, min(member['offset'], ZIP64_LIMIT)) + member['name'] + extra
+
+    def __iter__(self):
+        for member in self.members:
+            yield self._local_header(member)
+            crc, remaining = 0, member['size']
+            with open(member['path'], 'rb') as f:
+                while remaining:
+                    chunk = f.read(min(ZIP_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        # Content-Length ist schon gesendet; abbrechen, der Client sieht ein unvollständiges Archiv
+                        raise OSError(f"{member['path']} shrank while streaming the archive")
+                    crc = zlib.crc32(chunk, crc)
+                    remaining -= len(chunk)
+                    yield chunk
+            member['crc'] = crc
+            if member['zip64']:
+                yield struct.pack('<IIQQ', 0x08074b50, crc, member['size'], member['size'])
+            else:
+                yield struct.pack('<IIII', 0x08074b50, crc, member['size'], member['size'])
+
+        yield b''.join(self._central_header(member) for member in self.members)
+        count = len(self.members)
+        if self.zip64_end:
+            end_offset = self.central_offset + self.central_size
+            yield struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, 45, 45, 0, 0, count, count,
+                              self.central_size, self.central_offset)
+            yield struct.pack('<IIQI', 0x07064b50, 0, end_offset, 1)
+        yield struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                          min(self.central_size, ZIP64_LIMIT), min(self.central_offset, ZIP64_LIMIT), 0)
+
+
+def _folder_zip_members(path, recursive=False):
+    """Dateien (Medien und Bilder) eines Ordners aus dem Index, in Index-Sortierung, mit aktueller Größe."""
+    with INDEX_LOCK:
+        entries = MEDIA_INDEX
+    prefix = f"{path}/" if path else ''
+    top = os.path.basename(path) or PLAYCARD_ENDPOINT
+    wanted = ALLOWED_EXTENSIONS | IMAGE_EXTENSIONS
+    selected = []
+    for entry in entries:
+        rel_dir = os.path.dirname(entry['rel_path'])
+        if rel_dir != path and not (recursive and entry['rel_path'].startswith(prefix)):
+            continue
+        if f".{entry['ext']}" not in wanted or is_forbidden(entry['path']):
+            continue
+        selected.append((folder_sort_key(rel_dir), entry['sort_key'], entry))
+
+    members, seen = [], set()
+    for _, _, entry in sorted(selected, key=lambda item: item[:2]):
+        arcname = f"{top}/{entry['rel_path'][len(prefix):]}"
+        if arcname in seen:
+            continue  # gleicher relativer Pfad unter mehreren MEDIA_DIRS
+        try:
+            st = os.stat(entry['path'])
+        except OSError:
+            continue
+        seen.add(arcname)
+        members.append((arcname, entry['path'], st.st_size, st.st_mtime))
+    return members
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/folder_zip")
+@limiter.limit("10 per minute")
+def get_folder_zip():
+    """
+    Lädt einen Ordner (path=<relativer Ordner>, recursive=1 mit Unterordnern) als ZIP herunter.
+    Die Dateien werden unkomprimiert direkt von der Platte gestreamt: konstanter Speicher,
+    keine temporären Dateien, Content-Length steht vorab fest.
+    """
+    path = request.args.get('path', '').strip().strip('/')
+    with INDEX_LOCK:
+        known = path in MEDIA_TREE
+    if not known:
+        return jsonify({"status": "error", "message": "Folder not found."}), 404
+
+    archive = StoredZip(_folder_zip_members(path, recursive=request.args.get('recursive') == '1'))
+    filename = secure_filename(os.path.basename(path)) or PLAYCARD_ENDPOINT
+    return app.response_class(iter(archive), mimetype='application/zip', headers={
+        'Content-Length': str(archive.length),
+        'Content-Disposition': f'attachment; filename="{filename}.zip"'
+    })
 
 
 @app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/random_track")
@@ -1273,18 +4758,58 @@ def get_random_track_json():
     if not music_entries:
         abort(404, description="No music tracks found to select a random one.")
     
-    random_track = random.choice(music_entries)
+    # Mit after=<Titel> zufällig unter den ähnlichsten Titeln, damit der Übergang passt
+    after = request.args.get('after')
+    recommender = get_recommender() if after else None
+    similar = recommender.similar(after, RECOMMEND_SHUFFLE_POOL) if recommender else None
+    random_track = random.choice(similar)[0] if similar else random.choice(music_entries)
     
     formatted_track = _format_song_for_json(random_track)
     
     if not formatted_track:
         abort(500, description="Failed to format random track information.")
 
-    return jsonify({
+    return api_response({
         "status": "success",
         **formatted_track 
     })
 
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/top")
+@limiter.limit("30 per minute")
+def get_top_tracks_json():
+    """Die meistgespielten Titel (Plays werden gebündelt geschrieben, daher leicht verzögert)."""
+    return _play_ranking_json(trending=False)
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/trending")
+@limiter.limit("30 per minute")
+def get_trending_tracks_json():
+    """Aktuell angesagte Titel: Plays mit zeitlich abklingendem Gewicht."""
+    return _play_ranking_json(trending=True)
+
+
+def _play_ranking_json(trending):
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    ranking = PLAY_COUNTER.top(limit, trending=trending)
+    entries, seen = {}, set()
+    for r in ranking:
+        entry = find_index_entry(r['rel_path'])  # Duplikate zählen für ihren kanonischen Eintrag
+        if entry and entry['rel_path'] not in seen:  # Sonst inzwischen verschwunden oder verboten
+            entries[r['rel_path']] = entry
+            seen.add(entry['rel_path'])
+    ranking = [r for r in ranking if r['rel_path'] in entries]
+    tracks = []
+    for r, formatted in zip(ranking, _format_songs_for_json([entries[r['rel_path']] for r in ranking])):
+        if formatted:
+            formatted.update(play_count=r['play_count'], last_played=r['last_played'],
+                             trending_score=r['trending_score'])
+            tracks.append(formatted)
+    return api_response({
+        "status": "success",
+        "type": "trending" if trending else "top",
+        "tracks": tracks
+    }, records='tracks')
+
 # -------------------------------
 # New JSON-API Endpoint for Radio Status (mit optionalen Imports)
 # -------------------------------
@@ -1297,7 +4822,12 @@ def get_radio_status_json():
     and returns structured information about each stream as JSON.
     Dependencies (requests, beautifulsoup4, lxml) are imported lazily.
     """
-    streams_data = _get_radio_streams_from_xml() # Reuse the helper function
+    return radio_status_response()
+
+
+def radio_status_response():
+    """Antwort von /api/radio, gemeinsam für die WSGI-Route und den nativen ASGI-Handler."""
+    streams_data = [dict(s) for s in get_radio_streams()] # Reuse the helper function (or the watcher's cache)
 
     if not streams_data:
         return jsonify({
@@ -1305,25 +4835,857 @@ def get_radio_status_json():
             "message": "Could not fetch or parse radio status information."
         }), 500
 
-    return jsonify({
+    for stream in streams_data:
+        stream['relay_url'] = radio_relay_url(stream.get('mount_point'))
+
+    return api_response({
         "status": "success",
         "radio_streams": streams_data
+    }, records='radio_streams')
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/radio/events", methods=['GET'])
+@limiter.limit("20 per minute")
+def get_radio_events():
+    """
+    Server-Sent-Events-Stream mit Now-Playing-Updates. Es wird nur bei einem
+    Titelwechsel gesendet; alle Abonnenten teilen sich einen Watcher pro Prozess.
+    """
+    return app.response_class(stream_with_context(RADIO_WATCHER.events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/profiles")
+@limiter.limit("20 per minute")
+def get_profiles_json():
+    """Listet die langsamsten zuletzt profilierten Anfragen (Admin-Token erforderlich)."""
+    if not is_admin_request():
+        abort(404)
+    limit = request.args.get('limit', 20, type=int)
+    profiles = list_profiles(limit)
+    for profile in profiles:
+        profile['download_url'] = url_for('get_profile_file', name=profile['name'], token=request.args.get('token'), _external=True)
+    return jsonify({"status": "success", "profiles": profiles})
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/profiles/<name>")
+@limiter.limit("20 per minute")
+def get_profile_file(name):
+    """Liefert ein Profil im collapsed-stack-Format (z.B. für speedscope oder flamegraph.pl)."""
+    if not is_admin_request():
+        abort(404)
+    return send_from_directory(PROFILE_DIR, secure_filename(name) + '.folded', mimetype='text/plain')
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/admin/reload", methods=['POST'])
+@limiter.limit("5 per minute")
+def admin_reload():
+    """Baut den Index neu (im Preload-Modus koordiniert über den Master, Admin-Token erforderlich)."""
+    if not is_admin_request():
+        abort(404)
+    mode = request_reload()
+    return jsonify({"status": "success", "reload": mode}), 202
+
+
+# -------------------------------
+# Upload (tus 1.0: creation, termination, checksum)
+# -------------------------------
+TUS_VERSION = '1.0.0'
+UPLOAD_PARTIAL_DIR = '.playcard-partial'  # Unter dem Upload-Ordner, damit der fertige Upload nur umbenannt wird
+UPLOAD_CHECKSUM_ALGORITHMS = ('md5', 'sha1', 'sha256', 'sha512')
+
+
+def _upload_root():
+    """Absoluter Upload-Ordner oder None, wenn er nicht unter einem MEDIA_DIR liegt (dann nicht indexierbar)."""
+    root = os.path.abspath(UPLOAD_DIR or os.path.join(MEDIA_DIRS[0], 'uploads'))
+    for media_root in MEDIA_DIRS:
+        media_root = os.path.normpath(media_root)
+        if root == media_root or root.startswith(media_root + os.sep):
+            return root
+    return None
+
+
+def _upload_files(upload_id):
+    """(Datenpfad, Metadatenpfad) eines Uploads oder None bei ungültiger ID."""
+    root = _upload_root()
+    if root is None or not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        return None
+    partial_dir = os.path.join(root, UPLOAD_PARTIAL_DIR)
+    return os.path.join(partial_dir, f"{upload_id}.part"), os.path.join(partial_dir, f"{upload_id}.json")
+
+
+def _tus_response(status=204, headers=None, message=None):
+    if message is not None:
+        response = jsonify({"status": "error" if status >= 400 else "success", "message": message})
+        response.status_code = status
+    else:
+        response = app.response_class(status=status)
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    response.headers['Cache-Control'] = 'no-store'
+    for name, value in (headers or {}).items():
+        response.headers[name] = str(value)
+    return response
+
+
+def _parse_upload_metadata(header):
+    """Upload-Metadata: kommagetrennte Paare aus Schlüssel und Base64-Wert."""
+    metadata = {}
+    for pair in filter(None, (part.strip() for part in header.split(','))):
+        key, _, value = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode('utf-8') if value else ''
+        except (ValueError, UnicodeDecodeError):
+            return None
+    return metadata
+
+
+def _parse_checksum(value, encoding):
+    """'<algorithmus> <digest>' -> (algorithmus, digest-bytes) oder None."""
+    algorithm, _, digest = (value or '').strip().partition(' ')
+    algorithm = algorithm.lower()
+    if algorithm not in UPLOAD_CHECKSUM_ALGORITHMS or not digest:
+        return None
+    try:
+        return algorithm, (bytes.fromhex(digest) if encoding == 'hex' else base64.b64decode(digest, validate=True))
+    except ValueError:
+        return None
+
+
+def _upload_target(metadata):
+    """Zielpfad aus filename/folder der Metadaten; None, wenn Name oder Ordner unzulässig sind."""
+    parts = [part for part in metadata.get('folder', '').replace('\\', '/').split('/') if part]
+    filename = metadata.get('filename', '')
+    for part in parts + [filename]:
+        if part in ('', '.', '..') or '/' in part or '\\' in part or '\0' in part or part.startswith('.'):
+            return None
+    if os.path.splitext(filename)[1].lower() not in ALLOWED_EXTENSIONS | IMAGE_EXTENSIONS:
+        return None
+    target = os.path.join(_upload_root(), *parts, filename)
+    return None if is_forbidden(target) else target
+
+
+def _expire_uploads(partial_dir):
+    """Verwirft unvollständige Uploads, die länger als UPLOAD_EXPIRY nicht fortgesetzt wurden."""
+    cutoff = time.time() - UPLOAD_EXPIRY
+    try:
+        names = os.listdir(partial_dir)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(partial_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/uploads", methods=['OPTIONS', 'POST'])
+@limiter.limit("30 per minute")
+def create_upload():
+    """
+    Legt einen fortsetzbaren Upload an (tus creation). Header: Upload-Length, Upload-Metadata mit
+    filename, optional folder (relativ zum Upload-Ordner) und checksum ('sha256 <hex>' über die
+    ganze Datei, wird am Ende geprüft). Antwort 201 mit Location für die PATCH-Anfragen.
+    """
+    if not is_admin_request():
+        abort(404)
+    if request.method == 'OPTIONS':
+        return _tus_response(204, {'Tus-Version': TUS_VERSION, 'Tus-Max-Size': UPLOAD_MAX_SIZE,
+                                   'Tus-Extension': 'creation,termination,checksum',
+                                   'Tus-Checksum-Algorithm': ','.join(UPLOAD_CHECKSUM_ALGORITHMS)})
+    if _upload_root() is None:
+        return _tus_response(503, message="Upload directory is not inside a media directory.")
+
+    length = request.headers.get('Upload-Length', type=int)
+    metadata = _parse_upload_metadata(request.headers.get('Upload-Metadata', ''))
+    if length is None or length < 0 or metadata is None:
+        return _tus_response(400, message="Upload-Length and a valid Upload-Metadata header are required.")
+    if length > UPLOAD_MAX_SIZE:
+        return _tus_response(413, message=f"Uploads are limited to {UPLOAD_MAX_SIZE} bytes.")
+    target = _upload_target(metadata)
+    if target is None:
+        return _tus_response(400, message="Invalid or forbidden filename or folder.")
+    if os.path.exists(target):
+        return _tus_response(409, message="A file with this name already exists.")
+    checksum = metadata.get('checksum')
+    if checksum and _parse_checksum(checksum, 'hex') is None:
+        return _tus_response(400, message=f"checksum must be '<algorithm> <hex digest>' with one of {', '.join(UPLOAD_CHECKSUM_ALGORITHMS)}.")
+
+    upload_id = os.urandom(16).hex()
+    data_path, meta_path = _upload_files(upload_id)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    _expire_uploads(os.path.dirname(data_path))
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'length': length, 'target': target, 'checksum': checksum, 'created': time.time()}, f)
+    open(data_path, 'wb').close()
+    location = url_for('upload_chunk', upload_id=upload_id, _external=True)
+    if length == 0:
+        return _finish_upload(data_path, meta_path, 201, {'Location': location})
+    return _tus_response(201, {'Location': location, 'Upload-Offset': 0})
+
+
+@app.route(f"/{MUSIC_PATH}/{PLAYCARD_ENDPOINT}/api/uploads/<upload_id>", methods=['HEAD', 'PATCH', 'DELETE'])
+@limiter.limit("600 per minute")
+def upload_chunk(upload_id):
+    """
+    HEAD: aktueller Offset (zum Fortsetzen nach Abbruch). PATCH: Chunk ab Upload-Offset anhängen
+    (Content-Type application/offset+octet-stream, optional Upload-Checksum pro Chunk).
+    DELETE: Upload verwerfen. Der letzte Chunk prüft die Prüfsumme und fügt die Datei in den Index ein.
+    """
+    if not is_admin_request():
+        abort(404)
+    files = _upload_files(upload_id)
+    if files is None or not os.path.isfile(files[1]):
+        return _tus_response(404, message="Upload not found.")
+    data_path, meta_path = files
+    with open(meta_path, encoding='utf-8') as f:
+        upload = json.load(f)
+
+    if request.method == 'DELETE':
+        for path in files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return _tus_response(204)
+
+    if request.method == 'HEAD':
+        return _tus_response(200, {'Upload-Offset': os.path.getsize(data_path), 'Upload-Length': upload['length']})
+
+    if request.mimetype != 'application/offset+octet-stream':
+        return _tus_response(415, message="Content-Type must be application/offset+octet-stream.")
+    offset = request.headers.get('Upload-Offset', type=int)
+    chunk_checksum = request.headers.get('Upload-Checksum')
+    expected = _parse_checksum(chunk_checksum, 'base64') if chunk_checksum else None
+    if chunk_checksum and expected is None:
+        return _tus_response(400, message="Unsupported Upload-Checksum.")
+
+    with open(data_path, 'r+b') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return _tus_response(423, message="Another request is writing to this upload.")
+        current = os.fstat(f.fileno()).st_size
+        if offset != current:
+            return _tus_response(409, {'Upload-Offset': current}, message="Upload-Offset does not match.")
+        digest = hashlib.new(expected[0]) if expected else None
+        f.seek(offset)
+        remaining = upload['length'] - offset
+        while remaining > 0:
+            chunk = request.stream.read(min(UPLOAD_WRITE_SIZE, remaining))
+            if not chunk:
+                break
+            f.write(chunk)
+            if digest:
+                digest.update(chunk)
+            remaining -= len(chunk)
+        if digest and digest.digest() != expected[1]:
+            f.truncate(offset)
+            return _tus_response(460, {'Upload-Offset': offset}, message="Chunk checksum mismatch.")
+        f.flush()
+        os.fsync(f.fileno())
+        new_offset = f.tell()
+    os.utime(meta_path)  # Verfallszeit zählt ab der letzten Aktivität
+
+    if new_offset < upload['length']:
+        return _tus_response(204, {'Upload-Offset': new_offset})
+    return _finish_upload(data_path, meta_path, 204, {'Upload-Offset': new_offset})
+
+
+def _finish_upload(data_path, meta_path, status, headers):
+    """Prüft die Gesamtprüfsumme, verschiebt die Datei ans Ziel und fügt sie in den Index ein."""
+    with open(meta_path, encoding='utf-8') as f:
+        upload = json.load(f)
+    if upload.get('checksum'):
+        algorithm, expected = _parse_checksum(upload['checksum'], 'hex')
+        digest = hashlib.new(algorithm)
+        with open(data_path, 'rb') as f:
+            while chunk := f.read(ZIP_CHUNK_SIZE):
+                digest.update(chunk)
+        if digest.digest() != expected:
+            os.remove(data_path)
+            os.remove(meta_path)
+            return _tus_response(460, message="File checksum mismatch, upload discarded.")
+
+    target = upload['target']
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        # link() schlägt fehl, wenn das Ziel inzwischen existiert (kein stilles Überschreiben)
+        os.link(data_path, target)
+        os.remove(data_path)
+    except FileExistsError:
+        return _tus_response(409, message="A file with this name already exists.")
+    except OSError:
+        # Dateisystem ohne Hardlinks
+        if os.path.exists(target):
+            return _tus_response(409, message="A file with this name already exists.")
+        os.replace(data_path, target)
+    os.remove(meta_path)
+    os.chmod(target, 0o644)
+
+    entry = insert_index_file(target)
+    app.logger.info("Upload finished: %s (%s bytes)", entry['rel_path'], entry['size'])
+    headers = dict(headers, **{'X-Playcard-Track': urllib.parse.quote(entry['rel_path'])})
+    return _tus_response(status, headers)
+
+
+# -------------------------------
+# Statischer Export (vorgerenderte Seiten für Apache/nginx)
+# -------------------------------
+EXPORT_MANIFEST = '.playcard-export.json'
+
+
+def _export_fingerprint(*parts):
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8', 'surrogatepass'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _entry_stamp(entry):
+    return [entry['rel_path'], entry.get('size'), entry.get('mtime')]
+
+
+def _export_targets(renderer_version):
+    """
+    (Zieldatei, URL, Fingerabdruck) für alle exportierbaren Seiten. Der Fingerabdruck
+    umfasst alles, wovon die Seite abhängt; nur Seiten mit geändertem Abdruck werden neu gerendert.
+    Dateinamen für ?title=... entsprechen dem URL-kodierten Wert, wie ihn die Index-Links erzeugen.
+    """
+    prefix = f"{MUSIC_PATH}/{PLAYCARD_ENDPOINT}"
+    generation = INDEX_GENERATION
+    yield f"{prefix}/index.html", url_for('playcard', structured=1), _export_fingerprint(renderer_version, generation)
+    yield f"{prefix}/index-flat.html", url_for('playcard', structured=0), _export_fingerprint(renderer_version, generation)
+    yield f"{prefix}/api.json", url_for('api_root'), _export_fingerprint(renderer_version)
+    yield f"{prefix}/api/index-structured.json", url_for('get_index_json', structured=1), \
+        _export_fingerprint(renderer_version, generation)
+    yield f"{prefix}/api/index-flat.json", url_for('get_index_json', structured=0), \
+        _export_fingerprint(renderer_version, generation)
+
+    # Bilder pro Ordner: das Player-Cover kommt aus dem Ordner des Titels
+    images_by_dir = {}
+    for entry in MEDIA_INDEX:
+        if f".{entry['ext']}" in IMAGE_EXTENSIONS:
+            images_by_dir.setdefault(os.path.dirname(entry['path']), []).append(_entry_stamp(entry))
+
+    for path, node in MEDIA_TREE.items():
+        tree_file = f"{prefix}/api/tree/{urllib.parse.quote(path, safe='/')}/index.json" if path \
+            else f"{prefix}/api/tree/index.json"
+        summary = [[MEDIA_TREE[child]['path'], MEDIA_TREE[child]['total_files'], MEDIA_TREE[child]['total_size']]
+                   for child in node['folders']]
+        yield tree_file, url_for('get_tree_json', path=path), \
+            _export_fingerprint(renderer_version, summary, [_entry_stamp(entry) for entry in node['files']])
+
+        for entry in node['files']:
+            quoted = urllib.parse.quote(entry['rel_path'], safe='/')
+            stamp = _entry_stamp(entry)
+            yield f"{prefix}/player/{quoted}.html", url_for('playcard', title=entry['rel_path']), \
+                _export_fingerprint(renderer_version, stamp, images_by_dir.get(os.path.dirname(entry['path']), []))
+            yield f"{prefix}/api/track_info/{quoted}.json", url_for('get_track_info_json', title=entry['rel_path']), \
+                _export_fingerprint(renderer_version, stamp)
+
+
+def export_static_site(output_dir, base_url, full=False):
+    """
+    Rendert Index-, Player- und API-Seiten über den Testclient nach output_dir. Inkrementell:
+    das Manifest merkt sich pro Datei den Fingerabdruck, unveränderte Seiten werden
+    übersprungen, Seiten verschwundener Titel gelöscht. Gibt eine Statistik zurück.
+    """
+    output_dir = os.path.abspath(output_dir)
+    manifest_path = os.path.join(output_dir, EXPORT_MANIFEST)
+    manifest = {}
+    if not full and os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    if manifest.get('base_url') != base_url:
+        manifest = {}  # Anderer Host: alle absoluten URLs und OG-Tags ändern sich
+    pages = manifest.get('pages', {})
+
+    with open(__file__, 'rb') as f:
+        renderer_version = hashlib.blake2b(f.read(), digest_size=8).hexdigest()  # Code-Änderung = neu rendern
+
+    stats = {'written': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+    new_pages = {}
+    limiter_enabled = limiter.enabled
+    limiter.enabled = False  # Export ist kein Client-Traffic
+    try:
+        with app.test_request_context(base_url=base_url):
+            targets = list(_export_targets(renderer_version))
+        client = app.test_client()
+        for rel_file, url, fingerprint in targets:
+            target = os.path.normpath(os.path.join(output_dir, rel_file))
+            if not target.startswith(output_dir + os.sep):
+                continue
+            if pages.get(rel_file) == fingerprint and os.path.isfile(target):
+                new_pages[rel_file] = fingerprint
+                stats['unchanged'] += 1
+                continue
+            # Wie hinter dem Proxy: das Schema kommt als X-Forwarded-Proto (OG-Tags lesen es von dort)
+            # Exportierte Seiten holen den Now-Playing-Push beim laufenden (mehrfädigen) Server
+            response = client.get(url, base_url=base_url, headers={'X-Forwarded-Proto': urllib.parse.urlparse(base_url).scheme},
+                                  environ_overrides={'wsgi.multithread': True})
+            if response.status_code != 200:
+                app.logger.warning("Export of %s failed with status %s", url, response.status_code)
+                stats['failed'] += 1
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(response.get_data())
+            os.replace(tmp, target)
+            new_pages[rel_file] = fingerprint
+            stats['written'] += 1
+    finally:
+        limiter.enabled = limiter_enabled
+
+    for rel_file in set(pages) - set(new_pages):
+        try:
+            os.remove(os.path.join(output_dir, rel_file))
+            stats['removed'] += 1
+        except FileNotFoundError:
+            pass
+
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump({'base_url': base_url, 'generation': INDEX_GENERATION, 'exported': time.time(),
+                   'pages': new_pages}, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return stats
+
+
+# -------------------------------
+# ASGI Entry Point (neben dem WSGI-Objekt `application`)
+# -------------------------------
+class PlaycardASGI:
+    """
+    ASGI-Einstiegspunkt für I/O-lastige Endpunkte:
+      uvicorn playcard_server:asgi_application --host 127.0.0.1 --port 8010
+
+    Dateistreaming (inkl. Byte-Ranges), Radio-Status, Now-Playing-Events und der
+    Radio-Relay laufen nativ im Event-Loop, Dateizugriffe über einen Thread-Pool
+    (bzw. zerocopysend, wenn der Server es anbietet). Auch für sie laufen die
+    before_request-/after_request-Hooks der App (Rate-Limits, Metriken). Alle übrigen
+    Routen, inklusive der Suche, laufen unverändert über die Flask-App im Thread-Pool,
+    ohne den Event-Loop zu blockieren.
+    """
+
+    NATIVE_ENDPOINTS = {'serve_file', 'get_radio_status_json', 'get_radio_events', 'radio_relay'}
+
+    def __init__(self, flask_app, max_workers=ASGI_THREAD_POOL_SIZE):
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="playcard-asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        endpoint, args = None, {}
+        if scope['method'] in ('GET', 'HEAD'):
+            try:
+                adapter = self.flask_app.url_map.bind('localhost', script_name=scope.get('root_path') or None)
+                endpoint, args = adapter.match(scope['path'], method=scope['method'])
+            except HTTPException:
+                pass  # Redirects, 404, 405 usw. beantwortet Flask selbst
+
+        if endpoint == 'serve_file':
+            return await self._native(scope, receive, send, self._serve_file, args['filename'])
+        if endpoint == 'get_radio_status_json':
+            return await self._native(scope, receive, send, self._radio_status)
+        if endpoint == 'get_radio_events':
+            return await self._native(scope, receive, send, self._radio_events)
+        if endpoint == 'radio_relay' and RADIO_RELAY_ENABLED:
+            return await self._native(scope, receive, send, self._radio_relay, args['mount'])
+        return await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # --- Hilfsfunktionen ---
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    @staticmethod
+    def _header(scope, name):
+        name = name.lower().encode('latin-1')
+        for key, value in scope.get('headers', []):
+            if key.lower() == name:
+                return value.decode('latin-1')
+        return None
+
+    @staticmethod
+    async def _watch_disconnect(receive, disconnected):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    @staticmethod
+    async def _send_simple(send, status, body, content_type='text/plain; charset=utf-8'):
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1'))]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _environ(self, scope, body):
+        """Baut ein WSGI-environ aus einem ASGI-Scope."""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for key, value in scope.get('headers', []):
+            key = key.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _request_context(self, scope):
+        """Flask-Request-Kontext für url_for() & Co. in nativen Handlern (inkl. ProxyFix-Header)."""
+        environ = self._environ(scope, b'')
+        ProxyFix(lambda env, start_response: None, x_for=TRUSTED_PROXIES, x_host=1, x_proto=1)(environ, None)
+        return self.flask_app.request_context(environ)
+
+    @staticmethod
+    async def _send_flask_response(send, response, body=None):
+        if body is None:
+            body = b''.join(response.iter_encoded())
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in response.headers.items()
+                   if k.lower() != 'content-length']
+        headers.append((b'content-length', str(len(body)).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    # --- Native Handler mit den Hooks der Flask-App ---
+
+    def _before_native(self, scope):
+        """
+        Schiebt einen Request-Kontext und führt die before_request-Hooks aus (Rate-Limit,
+        Metriken). Gibt (Kontext, Antwort) zurück; die Antwort ist gesetzt, wenn ein Hook
+        die Anfrage schon beantwortet (z.B. 429).
+        """
+        request_ctx = self._request_context(scope)
+        request_ctx.push()
+        try:
+            rv = self.flask_app.preprocess_request()
+        except Exception as e:
+            rv = self.flask_app.handle_user_exception(e)
+        if rv is None:
+            return request_ctx, None
+        return request_ctx, self._finish_native(request_ctx, rv)
+
+    def _finish_native(self, request_ctx, rv):
+        """after_request-Hooks (verzögerte Limit-Abzüge, Metriken) und Kontext wieder abbauen."""
+        try:
+            return self.flask_app.finalize_request(rv)
+        finally:
+            request_ctx.pop()
+
+    def _handle_native_exception(self, request_ctx, e):
+        return self._finish_native(request_ctx, self.flask_app.handle_user_exception(e))
+
+    async def _native(self, scope, receive, send, handler, *args):
+        # Alle Schritte laufen im selben contextvars-Kontext, wie bei einer WSGI-Anfrage
+        context = contextvars.copy_context()
+        request_ctx, early = await self._run(context.run, self._before_native, scope)
+        if early is not None:
+            return await self._send_flask_response(send, early)
+
+        status = {}
+
+        async def tracked_send(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        try:
+            await handler(scope, receive, tracked_send, *args)
+        except HTTPException as e:
+            if 'code' not in status:
+                response = await self._run(context.run, self._handle_native_exception, request_ctx, e)
+                return await self._send_flask_response(send, response)
+            await self._run(context.run, self._finish_native, request_ctx, self.flask_app.response_class(status=500))
+            raise
+        except BaseException:
+            await self._run(context.run, self._finish_native, request_ctx, self.flask_app.response_class(status=500))
+            raise
+        await self._run(context.run, self._finish_native, request_ctx,
+                        self.flask_app.response_class(status=status.get('code', 500)))
+
+    # --- WSGI-Fallback ---
+
+    async def _wsgi(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+        def call_app():
+            iterable = self.flask_app(self._environ(scope, bytes(body)), start_response)
+            return iterable, iter(iterable)
+
+        # Alle Schritte im selben contextvars-Kontext: stream_with_context-Generatoren brauchen
+        # den App-/Request-Kontext, egal welcher Pool-Thread den nächsten Block holt
+        context = contextvars.copy_context()
+        iterable, chunks = await self._run(context.run, call_app)
+        disconnected = asyncio.Event()
+        watcher = None
+        try:
+            first = await self._run(context.run, next, chunks, None)
+            await send({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+            watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+            chunk = first
+            while chunk is not None and not disconnected.is_set():
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await self._run(context.run, next, chunks, None)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if watcher:
+                watcher.cancel()
+            if hasattr(iterable, 'close'):
+                await self._run(context.run, iterable.close)
+
+    # --- Native Handler ---
+
+    async def _serve_file(self, scope, receive, send, filename):
+        try:
+            resolved = await self._run(_resolve_media_file, filename)
+        except HTTPException:
+            raise
+        except Exception as e:
+            app.logger.error("File serve error: %s", e)
+            resolved = None
+        if not resolved:
+            return await self._send_simple(send, 404, b'Not Found')
+
+        full_path = resolved[2]
+        with self._request_context(scope):
+            count_play(full_path, self._header(scope, 'range'), request.remote_addr)
+            if is_play_start(self._header(scope, 'range')):
+                try:
+                    limiter.storage.incr(_open_stream_key(filename), STREAM_CONTINUATION_WINDOW)
+                except Exception as e:
+                    app.logger.debug("Could not mark open stream: %s", e)
+        st = await self._run(os.stat, full_path)
+        size = st.st_size
+        headers = [
+            (b'content-type', (mimetypes.guess_type(full_path)[0] or 'application/octet-stream').encode('latin-1')),
+            (b'accept-ranges', b'bytes'),
+            (b'last-modified', formatdate(st.st_mtime, usegmt=True).encode('latin-1')),
+        ]
+        start, end, status = 0, size - 1, 200
+        byte_range = _parse_byte_range(self._header(scope, 'range'), size)
+        if byte_range == 'invalid':
+            await send({'type': 'http.response.start', 'status': 416,
+                        'headers': [(b'content-range', f"bytes */{size}".encode('latin-1'))]})
+            return await send({'type': 'http.response.body', 'body': b''})
+        if byte_range:
+            start, end = byte_range
+            status = 206
+            headers.append((b'content-range', f"bytes {start}-{end}/{size}".encode('latin-1')))
+        length = end - start + 1 if size else 0
+        headers.append((b'content-length', str(length).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if scope['method'] == 'HEAD' or not length:
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        if 'http.response.zerocopysend' in (scope.get('extensions') or {}):
+            with open(full_path, 'rb') as f:
+                return await send({'type': 'http.response.zerocopysend', 'file': f, 'offset': start, 'count': length})
+
+        fd = await self._run(os.open, full_path, os.O_RDONLY)
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        try:
+            pos, remaining = start, length
+            while remaining > 0 and not disconnected.is_set():
+                chunk = await self._run(os.pread, fd, min(ASGI_STREAM_CHUNK_SIZE, remaining), pos)
+                if not chunk:
+                    break
+                pos += len(chunk)
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+        finally:
+            watcher.cancel()
+            os.close(fd)
+
+    async def _radio_status(self, scope, receive, send):
+        def render():
+            # Im Executor, weil get_radio_streams() beim Cache-Fehlschlag den Upstream abfragt;
+            # dieselbe Antwort (Snapshot-Cache, Formatwahl) wie die WSGI-Route
+            with self._request_context(scope):
+                response = self.flask_app.make_response(radio_status_response())
+                return response, b''.join(response.iter_encoded())
+
+        response, body = await self._run(render)
+        await self._send_flask_response(send, response, body)
+
+    async def _radio_events(self, scope, receive, send):
+        def payload(streams):
+            # Titelwechsel sind selten, ein kurzer Request-Kontext pro Nachricht ist billig
+            with self._request_context(scope):
+                return [dict(s, relay_url=radio_relay_url(s.get('mount_point'))) for s in streams]
+
+        q = RADIO_WATCHER.subscribe()
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+            await send({'type': 'http.response.body', 'body': f"retry: {RADIO_WATCH_INTERVAL * 1000}\n\n".encode(), 'more_body': True})
+            idle = 0.0
+            while not disconnected.is_set():
+                try:
+                    streams = q.get_nowait()
+                except queue.Empty:
+                    await asyncio.sleep(ASGI_POLL_INTERVAL * 10)
+                    idle += ASGI_POLL_INTERVAL * 10
+                    if idle >= RADIO_EVENTS_HEARTBEAT:
+                        idle = 0.0
+                        await send({'type': 'http.response.body', 'body': b": keepalive\n\n", 'more_body': True})
+                    continue
+                idle = 0.0
+                message = f"event: nowplaying\ndata: {json.dumps(payload(streams))}\n\n"
+                await send({'type': 'http.response.body', 'body': message.encode('utf-8'), 'more_body': True})
+        finally:
+            watcher.cancel()
+            RADIO_WATCHER.unsubscribe(q)
+
+    async def _radio_relay(self, scope, receive, send, mount):
+        mount = '/' + mount.lstrip('/')
+        known = await self._run(_is_known_radio_mount, mount)
+        if not known:
+            return await self._send_simple(send, 404, b'Unknown radio mount.')
+        relay = get_radio_relay(mount)
+        disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+        stream = relay.alisten()
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', relay.content_type.encode('latin-1')),
+                (b'cache-control', b'no-cache, no-store'), (b'x-accel-buffering', b'no')]})
+            async for chunk in stream:
+                if disconnected.is_set():
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            await stream.aclose()
+
+
+def _parse_byte_range(header, size):
+    """
+    Wertet einen einfachen Range-Header ("bytes=a-b", "bytes=a-", "bytes=-n") aus.
+    Gibt (start, end) zurück, None ohne (verwertbaren) Range-Header oder 'invalid' für 416.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return 'invalid'
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return 'invalid'
+    return start, min(end, size - 1)
+
+
 # -------------------------------
 # Run Application
 # -------------------------------
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    import argparse
+    parser = argparse.ArgumentParser(description="Playcard server")
+    parser.add_argument('--export', metavar='DIR', help="Seiten statisch nach DIR exportieren (inkrementell) und beenden")
+    parser.add_argument('--base-url', default="http://localhost", help="Öffentliche Basis-URL für absolute Links im Export")
+    parser.add_argument('--full', action='store_true', help="Export komplett neu rendern")
+    args = parser.parse_args()
+    if args.export:
+        build_media_index(EXTENSIONS, analyze=False)
+        stats = export_static_site(args.export, args.base_url.rstrip('/'), full=args.full)
+        print(f"Export to {args.export}: {stats['written']} written, {stats['unchanged']} unchanged, "
+              f"{stats['removed']} removed, {stats['failed']} failed")
+        sys.exit(1 if stats['failed'] else 0)
     
-    # Sicherstellen, dass der Index nur einmal gebaut wird
-    run_once_global()
+    # Index im Hintergrund aufbauen, der Server antwortet sofort
+    start_index_build()
 
     # Lokaler Entwicklungsmodus
     app.run(host="127.0.0.1", port=8010, threaded=True) # debug=True hier für detaillierte Fehler
 
 else:
     # Für WSGI-Server (z.B. uWSGI)
-    run_once_global()
     application = app # Dies ist das Entry Point für WSGI-Server
+    asgi_application = PlaycardASGI(app) # Entry Point für ASGI-Server (z.B. uvicorn)
+    if PRELOAD_MODE:
+        # Index einmal im Master bauen, die Worker erben ihn beim Fork (siehe playcard_gunicorn.conf.py)
+        preload_index()
+        try:
+            from uwsgidecorators import postfork
+            postfork(after_fork)
+        except ImportError:
+            pass  # gunicorn ruft after_fork über den post_fork-Hook auf
+    else:
+        # Der Index entsteht im Hintergrund (siehe /ready). uWSGI lädt die App ohne lazy-apps
+        # im Master; dessen Build-Thread überlebt den Fork nicht, deshalb baut dort jeder
+        # Worker nach dem Fork selbst (bzw. übernimmt den Index aus dem Store).
+        try:
+            import uwsgi
+            in_uwsgi_master = uwsgi.worker_id() == 0
+        except ImportError:
+            in_uwsgi_master = False
+        if in_uwsgi_master:
+            from uwsgidecorators import postfork
+            postfork(start_index_build)
+        else:
+            start_index_build()